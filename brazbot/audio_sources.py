@@ -0,0 +1,313 @@
+"""
+Audio sources for VoiceClient.play.
+
+A source exposes frames(), an async iterator of Opus packets ready for the
+RTP packetizer. OpusPassthroughSource demuxes sources that already are Opus
+(Ogg/Opus, WebM/Opus) without spawning ffmpeg; FFmpegOpusSource streams
+anything else through ffmpeg while it downloads.
+
+Playback runs as concurrent stages joined by bounded queues, each one
+waiting on the next when it falls behind:
+
+    HTTP fetch -> ffmpeg stdin (drained) -> Ogg demux -> FrameBuffer -> paced sender
+"""
+
+import os
+import asyncio
+import aiohttp
+import logging
+from collections import deque
+from asyncio.subprocess import PIPE
+from brazbot.opus import ogg_packets, OGG_CAPTURE
+from brazbot.webm import webm_opus_packets, EBML_MAGIC
+
+CHUNK_SIZE = 16384
+
+
+class FileStream:
+    """
+    Async readexactly() over a local file. Reads are small and buffered, so
+    they are done inline rather than in an executor.
+    """
+    def __init__(self, path, buffering=65536):
+        self.file = open(path, "rb", buffering=buffering)
+
+    async def readexactly(self, n):
+        data = self.file.read(n)
+        if len(data) < n:
+            raise asyncio.IncompleteReadError(data, n)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class PrefixedStream:
+    """
+    Puts back bytes already read (e.g. for container sniffing) in front of a stream.
+    """
+    def __init__(self, prefix, stream):
+        self.prefix = memoryview(prefix)
+        self.stream = stream
+
+    async def readexactly(self, n):
+        if not self.prefix:
+            return await self.stream.readexactly(n)
+        head, self.prefix = self.prefix[:n], self.prefix[n:]
+        if len(head) == n:
+            return head
+        try:
+            rest = await self.stream.readexactly(n - len(head))
+        except asyncio.IncompleteReadError as e:
+            raise asyncio.IncompleteReadError(bytes(head) + e.partial, n)
+        return bytes(head) + bytes(rest)
+
+
+def detect_container(magic):
+    if magic[:4] == OGG_CAPTURE:
+        return "ogg"
+    if magic[:4] == EBML_MAGIC:
+        return "webm"
+    return None
+
+
+class OpusPassthroughSource:
+    def __init__(self, location, container=None, headers=None):
+        """
+        Args:
+            location (str): http(s) URL or local path of an Ogg/Opus or WebM/Opus file.
+            container (str, optional): "ogg" or "webm"; sniffed from the first bytes when omitted.
+            headers (dict, optional): Extra HTTP request headers.
+        """
+        self.location = location
+        self.container = container
+        self.headers = headers
+        self.frame_count = 0
+
+    def demux(self, stream, container):
+        if container == "ogg":
+            return ogg_packets(stream)
+        if container == "webm":
+            return webm_opus_packets(stream)
+        raise ValueError(f"Not an Opus container: {self.location}")
+
+    async def _frames_from(self, stream):
+        container = self.container
+        if container is None:
+            magic = await stream.readexactly(4)
+            container = detect_container(magic)
+            stream = PrefixedStream(magic, stream)
+        logging.debug(f"Opus passthrough ({container}): {self.location}")
+        async for frame in self.demux(stream, container):
+            self.frame_count += 1
+            yield frame
+
+    async def frames(self):
+        if self.location.startswith(("http://", "https://")):
+            async with aiohttp.ClientSession() as session:
+                async with session.get(self.location, headers=self.headers) as response:
+                    if response.status != 200:
+                        raise Exception(f"Failed to fetch audio from URL: {response.status}")
+                    async for frame in self._frames_from(response.content):
+                        yield frame
+        else:
+            if not os.path.exists(self.location):
+                raise FileNotFoundError(self.location)
+            stream = FileStream(self.location)
+            try:
+                async for frame in self._frames_from(stream):
+                    yield frame
+            finally:
+                stream.close()
+
+
+def ffmpeg_opus_args(bitrate, codec=None):
+    # Ogg/Opus out: 20ms frames, one page per frame so the first packet is
+    # not held back by the muxer; a small probe so output starts early
+    if codec == "opus":
+        encode = ['-c:a', 'copy']
+    else:
+        encode = [
+            '-c:a', 'libopus',
+            '-ar', '48000',
+            '-ac', '2',
+            '-b:a', str(bitrate),
+            '-frame_duration', '20',
+            '-application', 'audio'
+        ]
+    return [
+        'ffmpeg',
+        '-loglevel', 'warning',
+        '-probesize', '65536',
+        '-analyzeduration', '200000',
+        '-i', 'pipe:0',
+        '-map', '0:a:0',
+        '-map_metadata', '-1',
+        *encode,
+        '-f', 'ogg',
+        '-page_duration', '20000',
+        'pipe:1'
+    ]
+
+
+class FFmpegOpusSource:
+    def __init__(self, url, bitrate=64000, codec=None, headers=None):
+        """
+        Args:
+            url (str): http(s) URL of any audio ffmpeg can read.
+            bitrate (int): Opus bitrate in bits per second.
+            codec (str, optional): "opus" to remux instead of transcode.
+            headers (dict, optional): Extra HTTP request headers.
+        """
+        self.url = url
+        self.bitrate = bitrate
+        self.codec = codec
+        self.headers = headers
+        self.process = None
+        self.frame_count = 0
+
+    async def _feed(self, session):
+        # Fetch stage: at most one chunk in flight beyond the pipe buffer
+        stdin = self.process.stdin
+        try:
+            async with session.get(self.url, headers=self.headers) as response:
+                if response.status != 200:
+                    raise Exception(f"Failed to fetch audio from URL: {response.status}")
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    stdin.write(chunk)
+                    await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg exited (e.g. playback stopped)
+        finally:
+            if not stdin.is_closing():
+                stdin.close()
+
+    async def _log_stderr(self):
+        async for line in self.process.stderr:
+            logging.warning(f"ffmpeg: {line.decode(errors='replace').rstrip()}")
+
+    async def frames(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *ffmpeg_opus_args(self.bitrate, self.codec), stdin=PIPE, stdout=PIPE, stderr=PIPE
+        )
+        logging.debug(f"ffmpeg process created with PID: {self.process.pid}")
+        async with aiohttp.ClientSession() as session:
+            feeder = asyncio.create_task(self._feed(session))
+            stderr = asyncio.create_task(self._log_stderr())
+            try:
+                async for frame in ogg_packets(self.process.stdout):
+                    self.frame_count += 1
+                    yield frame
+                if feeder.done() and feeder.exception():
+                    raise feeder.exception()
+            finally:
+                feeder.cancel()
+                if self.process.returncode is None:
+                    self.process.kill()
+                await self.process.wait()
+                stderr.cancel()
+                # The feeder may still be inside session.get(): let it unwind
+                # before the session closes under it
+                await asyncio.gather(feeder, stderr, return_exceptions=True)
+
+
+class FrameBuffer:
+    """
+    Bounded frame queue between the decode stage and the paced sender.
+
+    put() waits while the buffer is full, which in turn stops the demuxer
+    reading, ffmpeg writing and the download; so memory is bounded by the
+    capacity whatever the track length. Iterating yields frames until the
+    producer closes the buffer and it is drained.
+    """
+    def __init__(self, capacity=100):
+        self.capacity = capacity  # 100 frames = 2 s of audio
+        self.frames = deque()
+        self.closed = False
+        self.error = None
+        self.underruns = 0  # Times the sender found it empty mid-stream
+        self._started = False
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._not_empty = asyncio.Event()
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def exhausted(self):
+        return self.closed and not self.frames
+
+    async def put(self, frame):
+        while len(self.frames) >= self.capacity:
+            self._not_full.clear()
+            await self._not_full.wait()
+        self.frames.append(frame)
+        self._not_empty.set()
+
+    def get_nowait(self):
+        """
+        Next frame, or None when none is buffered (an underrun unless closed).
+        """
+        if not self.frames:
+            if self._started and not self.closed:
+                self.underruns += 1
+            return None
+        self._started = True
+        frame = self.frames.popleft()
+        self._not_full.set()
+        return frame
+
+    async def get(self):
+        while not self.frames:
+            if self.closed:
+                return None
+            if self._started:
+                self.underruns += 1
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        self._started = True
+        frame = self.frames.popleft()
+        self._not_full.set()
+        return frame
+
+    async def ready(self):
+        """
+        Waits until a frame is buffered or the buffer is closed.
+        """
+        while not self.frames and not self.closed:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+    def close(self, error=None):
+        self.closed = True
+        self.error = error
+        self._not_empty.set()
+
+    async def fill(self, frames):
+        """
+        Producer stage: moves frames from a source iterator into the buffer.
+        """
+        try:
+            async for frame in frames:
+                await self.put(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Audio source failed: {e}")
+            self.close(e)
+        finally:
+            self.close(self.error)
+            await frames.aclose()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await self.get()
+        if frame is None:
+            raise StopAsyncIteration
+        return frame
+
+    async def aclose(self):
+        self.close(self.error)
@@ -22,7 +22,7 @@ class AuditLogEntry:
     @classmethod
     async def from_guild_id(cls, bot, guild_id):
         cache_key = f"audit_log_{guild_id}"
-        data = bot.get_cache_data(cache_key)
+        data = await bot.get_cache_data_async(cache_key)
 
         if data:
             users = {user['id']: user for user in data['users']}
@@ -48,7 +48,7 @@ class AuditLogEntry:
             async with session.get(url, headers=headers) as response:
                 if response.status == 200:
                     data = await response.json()
-                    bot.set_cache_data(cache_key, data, seconds=10)
+                    await bot.set_cache_data_async(cache_key, data, seconds=10)
                     users = {user['id']: user for user in data['users']}  # Convert list to dictionary
                     return [
                         cls(
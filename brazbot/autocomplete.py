@@ -1,3 +1,7 @@
+import time
+import asyncio
+from collections import OrderedDict
+
 def autocomplete_command(bot, name=None, description=None):
     def decorator(func):
         bot.command_handler.register_command(func, name, description)
@@ -15,3 +19,98 @@ def autocomplete_command(bot, name=None, description=None):
     
     decorator.autocomplete = autocomplete
     return decorator
+
+
+class AutocompleteCache:
+    """
+    Memoizes autocomplete suggestions per (command, option, guild, partial
+    value) for a short TTL and debounces keystrokes: a newer interaction from
+    the same user for the same option cancels the older computation.
+    Functions whose suggestions depend on the user (autocomplete_per_user
+    set on them, see CommandHandler.register_autocomplete) are also cached
+    per user.
+    """
+    MAX_CHOICES = 25
+
+    def __init__(self, ttl=10, max_entries=10000, matcher=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.matcher = matcher or (lambda value, choice: value.lower() in str(choice['name']).lower())
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.superseded = set()  # Tasks cancelled by a newer keystroke
+
+    @staticmethod
+    def scope(interaction, func=None):
+        """
+        Cache scope of an interaction: its guild, plus the user when func
+        gives per-user suggestions.
+        """
+        user = interaction.get('member', {}).get('user') or interaction.get('user') or {}
+        user_id = user.get('id') if getattr(func, 'autocomplete_per_user', False) else None
+        return (interaction.get('guild_id'), user_id)
+
+    def get(self, command_name, option_name, value, scope=None):
+        now = time.monotonic()
+        key = (command_name, option_name, scope, value)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.entries.move_to_end(key)
+                return entry[1]
+            del self.entries[key]
+
+        # Narrow the longest cached prefix, if that list was not truncated
+        for length in range(len(value) - 1, -1, -1):
+            entry = self.entries.get((command_name, option_name, scope, value[:length]))
+            if entry is None or entry[0] <= now:
+                continue
+            if len(entry[1]) >= self.MAX_CHOICES:
+                return None
+            choices = [choice for choice in entry[1] if self.matcher(value, choice)]
+            self.set(command_name, option_name, value, choices, scope)
+            return choices
+        return None
+
+    def set(self, command_name, option_name, value, choices, scope=None):
+        key = (command_name, option_name, scope, value)
+        self.entries[key] = (time.monotonic() + self.ttl, choices)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    async def run(self, interaction, command_name, option_name, value, func, send):
+        scope = self.scope(interaction, func)
+        choices = self.get(command_name, option_name, value, scope)
+        if choices is not None:
+            await send(interaction, choices)
+            return
+
+        user = interaction.get('member', {}).get('user') or interaction.get('user') or {}
+        slot = (user.get('id'), command_name, option_name)
+        previous = self.in_flight.get(slot)
+        if previous is not None and not previous.done():
+            self.superseded.add(previous)
+            previous.cancel()  # Stale keystroke, nobody will see its answer
+
+        task = asyncio.ensure_future(func(interaction))
+        self.in_flight[slot] = task
+        try:
+            choices = await task
+        except asyncio.CancelledError:
+            if task in self.superseded:
+                return  # Replaced by a newer keystroke; our own caller was not cancelled
+            raise
+        finally:
+            self.superseded.discard(task)
+            if self.in_flight.get(slot) is task:
+                del self.in_flight[slot]
+
+        if choices is None:
+            return  # Function answered the interaction itself
+        choices = list(choices)[:self.MAX_CHOICES]
+        self.set(command_name, option_name, value, choices, scope)
+        await send(interaction, choices)
@@ -1,4 +1,4 @@
-import json
+import time
 import asyncio
 import aiohttp
 import logging
@@ -6,12 +6,21 @@ from aiohttp import ClientResponseError
 from brazbot.events import EventHandler
 from brazbot.commands import CommandHandler
 from brazbot.message_handler import MessageHandler
-from brazbot.cache import Cache
+from brazbot.cache import Cache, MemoryCacheBackend
+from brazbot.intern import interned_loads
+from brazbot.persistent_cache import PersistentCache
+from brazbot.command_sync import SyncState
+from brazbot.permissions import PermissionResolver
 from brazbot.audit_log_entry import AuditLogEntry
 from brazbot.eventstype import EventTypes
 from brazbot.decorators import tasks
 from datetime import datetime, timedelta
 
+# Events after which cached command check results may be stale
+CHECK_INVALIDATING_EVENTS = frozenset((
+    'GUILD_UPDATE', 'GUILD_ROLE_UPDATE', 'GUILD_ROLE_DELETE', 'GUILD_MEMBER_UPDATE'
+))
+
 # Mapeamento de intents
 INTENTS = {
     "GUILDS": 1 << 0,
@@ -40,7 +49,7 @@ INTENTS = {
 logging.basicConfig(level=logging.DEBUG)
 
 class DiscordBot:
-    def __init__(self, token, command_prefix=None, intents=None, num_shards=1, shard_id=0):
+    def __init__(self, token, command_prefix=None, intents=None, num_shards=1, shard_id=0, persistent_cache=None, cache_backend=None):
         self.token = token
         self.endpoint = "wss://gateway.discord.gg/?v=10"
         self.session_id = None
@@ -68,42 +77,119 @@ class DiscordBot:
         self.cogs = []
         self.eventtypes = tuple(map(lambda event_type: event_type.name, EventTypes))
         self.cache = {}
+        # Local dict tier; cache_backend (e.g. RedisCacheBackend) can be shared between shard processes
+        self.local_cache = MemoryCacheBackend(self.cache)
+        self.cache_backend = cache_backend if cache_backend is not None else self.local_cache
+        self.local_cache_seconds = 30
+        self._cache_tasks = set()
+        self.permissions = PermissionResolver()
         self.wait_for_futures = []
         self.auto_register_events()
         self._ws = None
         self.message_queue = asyncio.Queue()
 
+        # Optional on-disk tier: a path or a PersistentCache instance
+        if isinstance(persistent_cache, str):
+            persistent_cache = PersistentCache(persistent_cache)
+        self.persistent_cache = persistent_cache
+        if self.persistent_cache is not None:
+            self.command_handler.sync_state = SyncState(path=None, store=self.persistent_cache)
+            self.rehydrate_cache()
+
+    def rehydrate_cache(self, seconds=300):
+        """
+        Loads the live entries of the persistent tier into the in-memory cache,
+        each kept for at most `seconds` before it is fetched again.
+        """
+        now = time.time()
+        count = 0
+        for key, data, expires in self.persistent_cache.load():
+            if not self.persistent_cache.wants(key):
+                continue
+            remaining = seconds if expires is None else min(seconds, expires - now)
+            self.cache[key] = {
+                'data': data,
+                'expiry': datetime.now() + timedelta(seconds=remaining)
+            }
+            count += 1
+        logging.info(f"Rehydrated {count} cache entries from {self.persistent_cache.path}")
+
     def get_cache_data(self, key):
-        if key in self.cache:
-            entry = self.cache[key]
-            if entry['expiry'] > datetime.now():
-                return entry['data']
-            else:
-                self.delete_cache_data(key)
-        return None
+        return self.local_cache.get_now(key)
 
     def set_cache_data(self, key, data, seconds=60):
-        self.cache[key] = {
-            'data': data,
-            'expiry': datetime.now() + timedelta(seconds=seconds)
-        }
+        self.local_cache.set_now(key, data, seconds)
+        self._persist(key, data, seconds)
+
+    def _persist(self, key, data, seconds):
+        if self.persistent_cache is not None and self.persistent_cache.wants(key):
+            # Never kept on disk longer than in memory, or a restart would revive it
+            ttl = self.persistent_cache.ttl_for(key)
+            if seconds:
+                ttl = min(ttl, seconds)
+            self.persistent_cache.set(key, data, ttl)
+
+    async def get_cache_data_async(self, key):
+        data = self.get_cache_data(key)
+        if data is not None or self.cache_backend is self.local_cache:
+            return data
+        data = await self.cache_backend.get(key)
+        if data is not None:
+            self.set_cache_data(key, data, seconds=self.local_cache_seconds)
+        return data
+
+    async def set_cache_data_async(self, key, data, seconds=60):
+        self.set_cache_data(key, data, seconds)
+        if self.cache_backend is not self.local_cache:
+            await self.cache_backend.set(key, data, seconds)
 
     def delete_cache_data(self, key):
-        if key in self.cache:
-            del self.cache[key]
+        """
+        Drops key from every tier: memory, the persistent cache and a shared
+        cache_backend (deleted in the background).
+        """
+        self._forget(key)
+        if self.cache_backend is not self.local_cache:
+            task = asyncio.ensure_future(self.cache_backend.delete(key))
+            self._cache_tasks.add(task)
+            task.add_done_callback(self._cache_task_done)
+
+    async def delete_cache_data_async(self, key):
+        self._forget(key)
+        if self.cache_backend is not self.local_cache:
+            await self.cache_backend.delete(key)
+
+    def _forget(self, key):
+        self.cache.pop(key, None)
+        if self.persistent_cache is not None and self.persistent_cache.wants(key):
+            self.persistent_cache.delete(key)
+
+    def _cache_task_done(self, task):
+        self._cache_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Cache backend delete failed: {task.exception()}")
 
     def update_cache_data(self, key, data):
         if key in self.cache:
-            self.cache[key]['data'] = data
+            entry = self.cache[key]
+            entry['data'] = data
+            if entry['expiry'] != datetime.max:
+                self._persist(key, data, max(0.001, (entry['expiry'] - datetime.now()).total_seconds()))
+            else:
+                self._persist(key, data, None)
 
     @tasks(seconds=120)
     async def _cache_cleanup_task(self):
         now = datetime.now()
         keys_to_delete = [key for key, entry in self.cache.items() if entry['expiry'] <= now]
         for key in keys_to_delete:
-            self.delete_cache_data(key)
+            del self.cache[key]  # Local expiry only; disk and backend entries expire on their own
         print(f"Deleted {len(keys_to_delete)} expired cache keys.")
 
+    @tasks(seconds=30)
+    async def _persistent_cache_flush_task(self):
+        self.persistent_cache.flush()
+
     def calculate_intents(self, intents):
         if isinstance(intents, list):
             return sum(INTENTS[intent] for intent in intents if intent in INTENTS)
@@ -114,9 +200,9 @@ class DiscordBot:
         self.event_handler.register(event_name, func)
         return func
 
-    def command(self, name=None, description=None):
+    def command(self, name=None, description=None, aliases=None):
         def decorator(func):
-            self.command_handler.register_command(func, name, description)
+            self.command_handler.register_command(func, name, description, aliases)
             return func
         return decorator
 
@@ -175,8 +261,14 @@ class DiscordBot:
 
     async def wait_for(self, event_type, check, timeout=None):
         future = asyncio.get_event_loop().create_future()
-        self.wait_for_futures.append((future, check))
-        return await asyncio.wait_for(future, timeout)
+        waiter = (future, event_type, check)
+        self.wait_for_futures.append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            # Timed out or cancelled waiters must not be resolved later
+            if waiter in self.wait_for_futures:
+                self.wait_for_futures.remove(waiter)
 
     async def message_listener(self):
         while True:
@@ -184,8 +276,13 @@ class DiscordBot:
             await self.process_message(message)
 
     async def process_message(self, message):
-        message = json.loads(message)
+        message = interned_loads(message)
         self.sequence = message.get('s')
+        if message['op'] == 0:
+            # Keeps roles, overwrites and owners current for local permission checks
+            self.permissions.handle_event(message['t'], message['d'])
+            if message['t'] in CHECK_INVALIDATING_EVENTS:
+                self.command_handler.invalidate_checks(message['d'].get('guild_id') or message['d'].get('id'))
 
         if message['op'] == 10:
             self.heartbeat_interval = message['d']['heartbeat_interval']
@@ -252,16 +349,37 @@ class DiscordBot:
                 'd': message['d']
             })
 
-        # Handle wait_for futures
-        for future, check in self.wait_for_futures:
-            if check(message):
+        # Handle wait_for futures; several may wait for the same event
+        for waiter in list(self.wait_for_futures):
+            future, event_type, check = waiter
+            if message.get('t') == event_type and not future.done() and check(message):
                 future.set_result(message)
-                self.wait_for_futures.remove((future, check))
+                self.wait_for_futures.remove(waiter)
 
     async def start(self):
         asyncio.create_task(self._cache_cleanup_task())
+        if self.persistent_cache is not None:
+            self.persistent_cache.purge_expired()
+            asyncio.create_task(self._persistent_cache_flush_task())
         await self.setup_hook()
-
+        try:
+            await self._run_gateway()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """
+        Releases the shared HTTP sessions and caches; called when start()
+        ends, including when it is cancelled on shutdown.
+        """
+        await self.message_handler.close()
+        await self.command_handler.close()
+        if self.cache_backend is not self.local_cache:
+            await self.cache_backend.close()
+        if self.persistent_cache is not None:
+            self.persistent_cache.flush()
+
+    async def _run_gateway(self):
         while True:
             try:
                 async with aiohttp.ClientSession() as session:
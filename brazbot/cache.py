@@ -1,4 +1,5 @@
 import time
+from datetime import datetime, timedelta
 
 class Cache:
     def __init__(self):
@@ -16,3 +17,61 @@ class Cache:
             del self.cache[key]
             del self.expiry_times[key]
         return None
+
+
+class CacheBackend:
+    """
+    Async entity cache protocol used by DiscordBot. Values are JSON-like
+    payloads; ttl is in seconds (None means no expiry).
+    """
+    async def get(self, key):
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys):
+        raise NotImplementedError
+
+    async def set(self, key, value, ttl=None):
+        await self.set_many({key: value}, ttl)
+
+    async def set_many(self, mapping, ttl=None):
+        raise NotImplementedError
+
+    async def delete(self, key):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Default backend: the per-process dict behind DiscordBot.get_cache_data,
+    entries stored as {'data': ..., 'expiry': datetime}.
+    """
+    def __init__(self, store=None):
+        self.store = {} if store is None else store
+
+    def get_now(self, key):
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+        if entry['expiry'] <= datetime.now():
+            del self.store[key]
+            return None
+        return entry['data']
+
+    def set_now(self, key, value, ttl=None):
+        self.store[key] = {
+            'data': value,
+            'expiry': datetime.now() + timedelta(seconds=ttl) if ttl else datetime.max
+        }
+
+    async def get_many(self, keys):
+        return [self.get_now(key) for key in keys]
+
+    async def set_many(self, mapping, ttl=None):
+        for key, value in mapping.items():
+            self.set_now(key, value, ttl)
+
+    async def delete(self, key):
+        self.store.pop(key, None)
@@ -0,0 +1,171 @@
+"""
+In-memory candidate index for autocomplete.
+
+Prefix matches come from a sorted array of normalized keys (a flattened
+prefix trie: one bisect finds the subtree), fuzzy matches from a trigram
+posting index. Both support incremental add and remove.
+"""
+
+import heapq
+import bisect
+from collections import defaultdict
+
+MAX_CHOICES = 25
+
+
+def normalize(text):
+    return " ".join(str(text).casefold().split())
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CandidateIndex:
+    def __init__(self, entries=None, limit=MAX_CHOICES, posting_cap=1000):
+        """
+        Args:
+            entries (iterable, optional): Strings, (name, value) pairs or
+                Discord choice dicts ({"name": ..., "value": ...}).
+            limit (int, optional): Max suggestions returned. Discord allows 25.
+            posting_cap (int, optional): Trigrams shared by more entries than
+                this are skipped by fuzzy search (unless all of them are).
+        """
+        self.limit = limit
+        self.posting_cap = posting_cap
+        self.items = {}              # id -> (key, name, value)
+        self.by_value = {}           # value -> id
+        self.keys = []               # sorted (key, id)
+        self.postings = defaultdict(set)
+        self._next_id = 0
+        if entries is not None:
+            self.extend(entries)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, value):
+        return value in self.by_value
+
+    @staticmethod
+    def _split(entry):
+        if isinstance(entry, dict):
+            return entry['name'], entry.get('value', entry['name'])
+        if isinstance(entry, (tuple, list)):
+            return entry[0], entry[1]
+        return entry, entry
+
+    def add(self, name, value=None):
+        if value is None:
+            value = name
+        if value in self.by_value:
+            self.remove(value)
+        item_id = self._next_id
+        self._next_id += 1
+        key = normalize(name)
+        self.items[item_id] = (key, str(name)[:100], value)
+        self.by_value[value] = item_id
+        bisect.insort(self.keys, (key, item_id))
+        for gram in trigrams(key):
+            self.postings[gram].add(item_id)
+        return item_id
+
+    def extend(self, entries):
+        for entry in entries:
+            self.add(*self._split(entry))
+
+    def remove(self, value):
+        item_id = self.by_value.pop(value, None)
+        if item_id is None:
+            return False
+        key, _, _ = self.items.pop(item_id)
+        position = bisect.bisect_left(self.keys, (key, item_id))
+        if position < len(self.keys) and self.keys[position] == (key, item_id):
+            del self.keys[position]
+        for gram in trigrams(key):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(item_id)
+                if not posting:
+                    del self.postings[gram]
+        return True
+
+    def add_member(self, member):
+        # Guild member payloads ({"user": {...}, "nick": ...}) or Member objects
+        if isinstance(member, dict):
+            user = member.get('user', member)
+            name = member.get('nick') or user.get('global_name') or user.get('username')
+            return self.add(name, user['id'])
+        return self.add(member.nick or member.global_name or member.username, member.id)
+
+    def clear(self):
+        self.items.clear()
+        self.by_value.clear()
+        self.keys.clear()
+        self.postings.clear()
+
+    def prefix(self, query, limit=None):
+        limit = limit or self.limit
+        key = normalize(query)
+        start = bisect.bisect_left(self.keys, (key,))
+        ids = []
+        for candidate, item_id in self.keys[start:start + limit]:
+            if not candidate.startswith(key):
+                break
+            ids.append(item_id)
+        return ids
+
+    def fuzzy(self, query, limit=None, exclude=()):
+        limit = limit or self.limit
+        key = normalize(query)
+        grams = trigrams(key)
+        if not key or not grams:
+            return []
+
+        # Rarest trigrams first; very common ones only add noise and time
+        postings = sorted((self.postings[gram] for gram in grams if gram in self.postings), key=len)
+        if not postings:
+            return []
+        cap = max(len(postings[0]), self.posting_cap)
+        scores = defaultdict(int)
+        used = 0
+        for posting in postings:
+            if len(posting) > cap:
+                break
+            used += 1
+            for item_id in posting:
+                scores[item_id] += 1
+
+        # Only rank candidates sharing a good part of the trigrams we looked at
+        best = max(scores.values())
+        minimum = min(best, max(1, (used + 1) // 2))
+        total = len(grams)
+        ranked = []
+        for item_id, shared in scores.items():
+            if shared < minimum or item_id in exclude:
+                continue
+            candidate = self.items[item_id][0]
+            score = shared / (total + len(candidate) + 2 - shared)  # Jaccard over trigrams
+            if key in candidate:
+                score += 1.0
+            ranked.append((-score, len(candidate), item_id))
+        return [item_id for _, _, item_id in heapq.nsmallest(limit, ranked)]
+
+    def search(self, query, limit=None):
+        """
+        Prefix matches first, then fuzzy (trigram) matches.
+
+        Returns:
+            list: Discord choice dicts, at most `limit` of them.
+        """
+        limit = limit or self.limit
+        ids = self.prefix(query, limit)
+        if len(ids) < limit and query:
+            ids += self.fuzzy(query, limit - len(ids), exclude=set(ids))
+        return [{"name": self.items[item_id][1], "value": self.items[item_id][2]} for item_id in ids]
+
+    async def __call__(self, interaction):
+        # Lets an index be registered directly as an autocomplete function
+        focused = next((opt for opt in interaction['data'].get('options', []) if opt.get('focused')), None)
+        return self.search(str(focused.get('value', '')) if focused else "")
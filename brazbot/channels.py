@@ -1,6 +1,5 @@
 import aiohttp
 import json
-import logging
 import websockets
 from datetime import datetime, timezone
 from .voiceclient import VoiceClient
@@ -44,7 +43,7 @@ class Channel:
     @classmethod
     async def from_channel_id(cls, bot, guild_id, channel_id, user_id):
         cache_key = f"channel_{channel_id}"
-        data = bot.get_cache_data(cache_key)
+        data = await bot.get_cache_data_async(cache_key)
 
         if data:
             return cls(data, bot, guild_id, channel_id, user_id)
@@ -58,7 +57,7 @@ class Channel:
             async with session.get(url, headers=headers) as response:
                 if response.status == 200:
                     data = await response.json()
-                    bot.set_cache_data(cache_key, data, seconds=120)
+                    await bot.set_cache_data_async(cache_key, data, seconds=120)
                     return cls(data, bot, guild_id, channel_id, user_id)
                 else:
                     raise Exception(f"Failed to fetch channel data: {response.status}")
@@ -70,42 +69,7 @@ class Channel:
         return self.name
 
     async def send_message(self, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
-        url = f"{self.base_url}/channels/{self.id}/messages"
-        data = {}
-        if content:
-            data["content"] = str(content)
-        if embed:
-            data["embeds"] = [embed]
-        if embeds:
-            data["embeds"] = embeds
-        if components:
-            data["components"] = components
-        if ephemeral:
-            data["flags"] = 64  # This flag makes the response ephemeral
-
-        async with aiohttp.ClientSession() as session:
-            if files:
-                form = FormData()
-                form.add_field('payload_json', json.dumps(data))
-                for file in files:
-                    form.add_field('file', file['data'], filename=file['filename'], content_type=file['content_type'])
-                async with session.post(url, headers=self.headers, data=form) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to send message with file: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message sent with file: {response_json}")
-                        return response_json
-            else:
-                async with session.post(url, headers=self.headers, json=data) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to send message: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message sent: {response_json}")
-                        return response_json
+        return await self.bot.message_handler.send_message(self.id, content, embed, embeds, files, components, ephemeral)
 
     # Methods to interact with the Discord API
     async def clone(self, name=None, reason=None):
@@ -186,16 +150,8 @@ class Channel:
         return self.overwrites.get(str(member_or_role.id))
 
     async def permissions_for(self, member_or_role):
-        url = f"https://discord.com/api/v10/channels/{self.id}/permissions/{member_or_role.id}"
-        headers = {
-            "Authorization": f"Bot {self.bot.token}"
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"Failed to fetch permissions for {member_or_role.id} in channel {self.id}: {response.status}")
+        # Computed locally from cached roles and overwrites; returns an int bitset
+        return await self.bot.permissions.permissions_for(self.bot, self.guild_id, self.id, member_or_role)
 
     async def set_permissions(self, member_or_role, allow, deny, reason=None):
         url = f"https://discord.com/api/v10/channels/{self.id}/permissions/{member_or_role.id}"
@@ -268,7 +224,7 @@ class TextChannel():
     @classmethod
     async def from_channel_id(cls, bot, guild_id, channel_id, user_id):
         cache_key = f"channel_{channel_id}"
-        data = bot.get_cache_data(cache_key)
+        data = await bot.get_cache_data_async(cache_key)
 
         if data:
             return cls(data, bot, guild_id, channel_id, user_id)
@@ -282,7 +238,7 @@ class TextChannel():
             async with session.get(url, headers=headers) as response:
                 if response.status == 200:
                     data = await response.json()
-                    bot.set_cache_data(cache_key, data, seconds=120)
+                    await bot.set_cache_data_async(cache_key, data, seconds=120)
                     return cls(data, bot, guild_id, channel_id, user_id)
                 else:
                     raise Exception(f"Failed to fetch channel data: {response.status}")
@@ -514,16 +470,8 @@ class TextChannel():
         return self.overwrites.get(str(member_or_role.id))
 
     async def permissions_for(self, member_or_role):
-        url = f"https://discord.com/api/v10/channels/{self.id}/permissions/{member_or_role.id}"
-        headers = {
-            "Authorization": f"Bot {self.bot.token}"
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"Failed to fetch permissions for {member_or_role.id} in channel {self.id}: {response.status}")
+        # Computed locally from cached roles and overwrites; returns an int bitset
+        return await self.bot.permissions.permissions_for(self.bot, self.guild_id, self.id, member_or_role)
 
     async def set_permissions(self, member_or_role, allow, deny, reason=None):
         url = f"https://discord.com/api/v10/channels/{self.id}/permissions/{member_or_role.id}"
@@ -562,42 +510,7 @@ class TextChannel():
             await self.delete_messages([message['id'] for message in messages])
 
     async def send(self, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
-        url = f"https://discord.com/api/v10/channels/{self.id}/messages"
-        data = {}
-        if content:
-            data["content"] = str(content)
-        if embed:
-            data["embeds"] = [embed]
-        if embeds:
-            data["embeds"] = embeds
-        if components:
-            data["components"] = components
-        if ephemeral:
-            data["flags"] = 64  # This flag makes the response ephemeral
-
-        async with aiohttp.ClientSession() as session:
-            if files:
-                form = aiohttp.FormData()
-                form.add_field('payload_json', json.dumps(data))
-                for file in files:
-                    form.add_field('file', file['data'], filename=file['filename'], content_type=file['content_type'])
-                async with session.post(url, headers=self.headers, data=form) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to send message with file: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message sent with file: {response_json}")
-                        return response_json
-            else:
-                async with session.post(url, headers=self.headers, json=data) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to send message: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message sent: {response_json}")
-                        return response_json
+        return await self.bot.message_handler.send_message(self.id, content, embed, embeds, files, components, ephemeral)
 
     async def typing(self):
         url = f"https://discord.com/api/v10/channels/{self.id}/typing"
@@ -645,7 +558,7 @@ class VoiceChannel():
     @classmethod
     async def from_channel_id(cls, bot, guild_id, channel_id, user_id):
         cache_key = f"channel_{channel_id}"
-        data = bot.get_cache_data(cache_key)
+        data = await bot.get_cache_data_async(cache_key)
 
         if data:
             return cls(data, bot, guild_id, channel_id, user_id)
@@ -667,7 +580,7 @@ class VoiceChannel():
             async with session.get(url, headers=headers) as response:
                 if response.status == 200:
                     data = await response.json()
-                    bot.set_cache_data(cache_key, data, seconds=120)
+                    await bot.set_cache_data_async(cache_key, data, seconds=120)
                     return cls(data, bot, guild_id, channel_id, user_id)
                 else:
                     raise Exception(f"Failed to fetch channel data: {response.status}")
@@ -822,16 +735,8 @@ class VoiceChannel():
         return self.overwrites.get(str(member_or_role.id))
 
     async def permissions_for(self, member_or_role):
-        url = f"https://discord.com/api/v10/channels/{self.id}/permissions/{member_or_role.id}"
-        headers = {
-            "Authorization": f"Bot {self.bot.token}"
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"Failed to fetch permissions for {member_or_role.id} in channel {self.id}: {response.status}")
+        # Computed locally from cached roles and overwrites; returns an int bitset
+        return await self.bot.permissions.permissions_for(self.bot, self.guild_id, self.id, member_or_role)
 
     async def pins(self):
         url = f"https://discord.com/api/v10/channels/{self.id}/pins"
@@ -854,42 +759,7 @@ class VoiceChannel():
             await self.delete_messages([message['id'] for message in messages])
 
     async def send(self, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
-        url = f"https://discord.com/api/v10/channels/{self.id}/messages"
-        data = {}
-        if content:
-            data["content"] = str(content)
-        if embed:
-            data["embeds"] = [embed]
-        if embeds:
-            data["embeds"] = embeds
-        if components:
-            data["components"] = components
-        if ephemeral:
-            data["flags"] = 64  # This flag makes the response ephemeral
-
-        async with aiohttp.ClientSession() as session:
-            if files:
-                form = aiohttp.FormData()
-                form.add_field('payload_json', json.dumps(data))
-                for file in files:
-                    form.add_field('file', file['data'], filename=file['filename'], content_type=file['content_type'])
-                async with session.post(url, headers=self.headers, data=form) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to send message with file: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message sent with file: {response_json}")
-                        return response_json
-            else:
-                async with session.post(url, headers=self.headers, json=data) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to send message: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message sent: {response_json}")
-                        return response_json
+        return await self.bot.message_handler.send_message(self.id, content, embed, embeds, files, components, ephemeral)
 
     async def set_permissions(self, member_or_role, allow, deny, reason=None):
         url = f"https://discord.com/api/v10/channels/{self.id}/permissions/{member_or_role.id}"
@@ -0,0 +1,177 @@
+"""
+Declarative command checks.
+
+Decorators such as is_admin or has_role attach Check objects to the command
+function. CommandHandler runs them as one pipeline before converting the
+arguments: cheapest first, stopping at the first failure, with the guild
+state resolved at most once per invocation and pure check results cached
+briefly per (user, guild).
+
+The decorated function is also wrapped so the checks still apply when it is
+called any other way (event handlers, component callbacks, direct calls);
+the wrapper raises CheckFailure. Calls made by CommandHandler skip the
+wrapper's run, so stateful checks such as rate limits are counted once.
+"""
+
+import time
+import logging
+import functools
+import contextlib
+import contextvars
+import weakref
+
+DEFAULT_CACHE_SECONDS = 5
+
+# True while CommandHandler calls a command whose checks it already ran
+_checks_ran = contextvars.ContextVar("brazbot_checks_ran", default=False)
+_guard_pipelines = weakref.WeakSet()  # Pipelines of guarded functions, for invalidate_guarded
+
+
+class CheckFailure(Exception):
+    def __init__(self, check, message=None, **details):
+        super().__init__(message or check.message)
+        self.check = check
+        self.details = details  # Extra fields for on_error, e.g. retry_after
+
+
+class Check:
+    def __init__(self, name, predicate, message, cost=10, cache_seconds=DEFAULT_CACHE_SECONDS, stateful=False):
+        """
+        Args:
+            name (str): Identifies the check (and its cached results), e.g. "has_role:Mod".
+            predicate (callable): async (ctx, invocation) -> bool.
+            message (str): Sent through on_error when the check fails.
+            cost (int): Lower runs first.
+            cache_seconds (float): How long a result is reused for the same user and guild. 0 disables it.
+            stateful (bool): The predicate has side effects (e.g. consumes a rate limit);
+                such checks run after every pure one and are never cached.
+        """
+        self.name = name
+        self.predicate = predicate
+        self.message = message
+        self.cost = cost
+        self.cache_seconds = 0 if stateful else cache_seconds
+        self.stateful = stateful
+
+    def sort_key(self):
+        return (self.stateful, self.cost)
+
+
+class Invocation:
+    """
+    Per-invocation scratch space shared by the checks of one command call.
+    """
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.user_id = ctx.author['id'] if ctx.author else None
+        self.role_ids = ctx.member.get('roles', []) if ctx.member else []
+        self._guild = None
+
+    async def guild(self):
+        # Permission state of the guild (owner, roles), loaded once per call
+        if self._guild is None:
+            self._guild = await self.ctx.bot.permissions.ensure_guild(self.ctx.bot, self.ctx.guild_id)
+        return self._guild
+
+    async def permissions(self):
+        guild = await self.guild()
+        return guild.base_permissions(self.user_id, self.role_ids)
+
+
+class CheckPipeline:
+    def __init__(self, checks=()):
+        self.checks = sorted(checks, key=Check.sort_key)
+        self.results = {}  # (check name, user id, guild id) -> (passed, expires)
+
+    def __len__(self):
+        return len(self.checks)
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None:
+            self.results.clear()
+            return
+        for key in [key for key in self.results if key[2] == guild_id]:
+            del self.results[key]
+
+    async def run(self, ctx):
+        """
+        Raises:
+            CheckFailure: for the first check that does not pass.
+        """
+        invocation = Invocation(ctx)
+        now = time.monotonic()
+        for check in self.checks:
+            key = (check.name, invocation.user_id, ctx.guild_id)
+            cached = self.results.get(key) if check.cache_seconds else None
+            if cached is not None and cached[1] > now:
+                passed = cached[0]
+            else:
+                passed = bool(await check.predicate(ctx, invocation))
+                if check.cache_seconds:
+                    self.results[key] = (passed, now + check.cache_seconds)
+            if not passed:
+                logging.debug(f"Check {check.name} failed for user {invocation.user_id}")
+                raise CheckFailure(check)
+
+
+def add_check(func, check):
+    """
+    Attaches a check to a command function. Works whether it is applied
+    before or after the command is registered.
+
+    Returns:
+        The guarded function, which runs the checks itself when it is not
+        called by CommandHandler.
+    """
+    if not hasattr(func, "_checks"):
+        func._checks = []
+    func._checks.append(check)
+    if getattr(func, "_checks_guarded", False):
+        return func
+    return _guard(func)
+
+
+def _guard(func):
+    @functools.wraps(func)  # Shares func._checks, so later checks apply to both
+    async def wrapper(ctx, *args, **kwargs):
+        if _checks_ran.get():
+            # Only the outermost guarded call was covered; nested ones still check
+            token = _checks_ran.set(False)
+        else:
+            token = None
+            pipeline = wrapper._pipeline
+            if pipeline is None or len(pipeline) != len(wrapper._checks):
+                pipeline = wrapper._pipeline = CheckPipeline(wrapper._checks)
+                _guard_pipelines.add(pipeline)
+            await pipeline.run(ctx)
+        try:
+            return await func(ctx, *args, **kwargs)
+        finally:
+            if token is not None:
+                _checks_ran.reset(token)
+    wrapper._pipeline = None
+    wrapper._checks_guarded = True
+    return wrapper
+
+
+def invalidate_guarded(guild_id=None):
+    for pipeline in list(_guard_pipelines):
+        pipeline.invalidate(guild_id)
+
+
+@contextlib.contextmanager
+def checks_ran(func):
+    """
+    Wraps a command call made after its pipeline already passed, so a
+    guarded function does not run the same checks again.
+    """
+    token = _checks_ran.set(True) if getattr(func, "_checks_guarded", False) else None
+    try:
+        yield
+    finally:
+        if token is not None:
+            _checks_ran.reset(token)
+
+
+def get_checks(func):
+    return getattr(func, "_checks", [])
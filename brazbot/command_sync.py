@@ -0,0 +1,240 @@
+"""
+Canonical form and hashing of application command trees.
+
+Both the locally registered commands and the ones returned by Discord are
+reduced to the same canonical dicts (known keys only, defaults dropped), so
+comparing them is exact and does not depend on the order Discord lists them.
+"""
+
+import os
+import time
+import json
+import asyncio
+import hashlib
+import logging
+
+COMMAND_KEYS = ("name", "description", "type", "options", "default_member_permissions", "nsfw")
+OPTION_KEYS = (
+    "type", "name", "description", "required", "choices", "options", "autocomplete",
+    "channel_types", "min_value", "max_value", "min_length", "max_length"
+)
+CHOICE_KEYS = ("name", "value")
+
+DEFAULT_STATE_PATH = ".brazbot_command_sync.json"
+
+
+def _canonical(data, keys):
+    result = {}
+    for key in keys:
+        value = data.get(key)
+        if value is None or value is False or value == []:
+            continue  # Discord omits defaults, so do we
+        if key == "options":
+            value = [_canonical(option, OPTION_KEYS) for option in value]
+        elif key == "choices":
+            value = [_canonical(choice, CHOICE_KEYS) for choice in value]
+        elif key == "channel_types":
+            value = sorted(value)
+        result[key] = value
+    return result
+
+
+def canonical_command(command):
+    command = _canonical(command, COMMAND_KEYS)
+    command.setdefault("type", 1)
+    return command
+
+
+def command_hash(command):
+    encoded = json.dumps(canonical_command(command), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def tree_hash(commands):
+    """
+    Order-independent hash of a list of command payloads.
+    """
+    digest = hashlib.sha256()
+    for name, value in sorted((command["name"], command_hash(command)) for command in commands):
+        digest.update(f"{name}:{value}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def diff_commands(current, existing):
+    """
+    Compares local command payloads with the commands Discord returned.
+
+    Args:
+        current (list): Local command payloads.
+        existing (dict): Discord commands keyed by name (with their ids).
+
+    Returns:
+        dict: "create" and "update" lists of (name, payload) and a "delete"
+        list of (name, id). "update" payloads carry the existing id.
+    """
+    changes = {"create": [], "update": [], "delete": []}
+    names = set()
+    for command in current:
+        name = command["name"]
+        names.add(name)
+        remote = existing.get(name)
+        if remote is None:
+            changes["create"].append((name, command))
+        elif command_hash(command) != command_hash(remote):
+            changes["update"].append((name, dict(command, id=remote["id"])))
+    for name, remote in existing.items():
+        if name not in names:
+            changes["delete"].append((name, remote["id"]))
+    return changes
+
+
+class SyncState:
+    """
+    Last synced tree hash and command ids per scope (application id plus
+    "global" or a guild id), persisted as a small JSON file. Scopes are
+    keyed by application so bots run from the same checkout (e.g. a dev and
+    a prod token) do not share hashes.
+
+    A stored hash is only trusted once the scope was compared with Discord
+    in this process (see `verified`), so commands changed remotely, from
+    another machine or the developer portal, are still noticed.
+    """
+    STORE_KEY = "command_sync"
+
+    def __init__(self, path=DEFAULT_STATE_PATH, store=None):
+        self.path = path
+        self.store = store  # Optional PersistentCache used instead of the JSON file
+        self.scopes = {}
+        self.verified = set()  # Scope keys checked against Discord by this process
+        self.load()
+
+    def load(self):
+        if self.store is not None:
+            self.scopes = self.store.get(self.STORE_KEY) or {}
+            return
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.scopes = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable command sync state {self.path}: {e}")
+            self.scopes = {}
+
+    def save(self):
+        if self.store is not None:
+            self.store.set(self.STORE_KEY, self.scopes)
+            self.store.flush()
+            return
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.scopes, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def scope_key(application_id, guild_id=None):
+        return f"{application_id}:{guild_id or 'global'}"
+
+    def get_hash(self, application_id, guild_id=None):
+        return self.scopes.get(self.scope_key(application_id, guild_id), {}).get("hash")
+
+    def is_current(self, application_id, guild_id, tree_hash_value):
+        """
+        True when the scope was synced to this hash and Discord was checked
+        for it since startup; otherwise the caller should GET and diff.
+        """
+        key = self.scope_key(application_id, guild_id)
+        return key in self.verified and self.get_hash(application_id, guild_id) == tree_hash_value
+
+    def update(self, application_id, guild_id, tree_hash_value, ids, save=True):
+        key = self.scope_key(application_id, guild_id)
+        self.scopes[key] = {"hash": tree_hash_value, "ids": ids}
+        self.verified.add(key)
+        if save:
+            self.save()
+
+    def invalidate(self, application_id, guild_id=None):
+        key = self.scope_key(application_id, guild_id)
+        self.verified.discard(key)
+        if self.scopes.pop(key, None) is not None:
+            self.save()
+
+
+def is_global_limit(headers):
+    return headers.get("X-RateLimit-Global", "").lower() == "true" or headers.get("X-RateLimit-Scope") == "global"
+
+
+class RateLimitBucket:
+    """
+    Shared view of one Discord rate-limit bucket, fed from the X-RateLimit-*
+    headers of every response. When the bucket is exhausted all callers wait
+    for the reset instead of running into 429s. A global 429 pauses every
+    bucket of the same RateLimitBuckets, not just this one.
+    """
+    def __init__(self, shared=None):
+        self.remaining = None
+        self.reset_at = 0.0
+        self.shared = shared  # RateLimitBuckets holding the global pause
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.shared is not None:
+            await self.shared.wait_global()
+        async with self._lock:
+            if self.remaining is not None and self.remaining <= 0:
+                delay = self.reset_at - time.monotonic()
+                if delay > 0:
+                    logging.debug(f"Rate limit bucket exhausted, waiting {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                self.remaining = None
+            elif self.remaining is not None:
+                self.remaining -= 1
+
+    def update(self, headers, status=None):
+        if status == 429 and self.shared is not None and is_global_limit(headers):
+            # Says nothing about this route: every request waits instead
+            self.shared.pause(float(headers.get("Retry-After", 1)))
+            return
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if status == 429:
+            remaining = 0
+            reset_after = headers.get("Retry-After", reset_after or 1)
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset_after is not None:
+            self.reset_at = time.monotonic() + float(reset_after)
+
+
+class RateLimitBuckets:
+    """
+    One RateLimitBucket per (method, route, major parameter). Discord limits
+    each route separately and guild_id is a major parameter, so deploys to
+    different guilds do not wait on each other's buckets.
+    """
+    def __init__(self):
+        self.buckets = {}
+        self.global_reset_at = 0.0
+
+    def get(self, method, route, major=None):
+        key = (method, route, major)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = RateLimitBucket(self)
+        return bucket
+
+    def pause(self, seconds):
+        """
+        Holds every bucket for `seconds` after a global 429.
+        """
+        self.global_reset_at = max(self.global_reset_at, time.monotonic() + seconds)
+
+    async def wait_global(self):
+        while True:
+            delay = self.global_reset_at - time.monotonic()
+            if delay <= 0:
+                return
+            logging.debug(f"Global rate limit hit, waiting {delay:.2f}s")
+            await asyncio.sleep(delay)
@@ -1,4 +1,6 @@
 import aiohttp
+import time
+import asyncio
 import logging
 import json
 from typing import Union, Literal, get_args, _GenericAlias
@@ -9,7 +11,13 @@ from brazbot.member import Member
 from brazbot.roles import Role
 from brazbot.channels import Channel
 from brazbot.guilds import Guild
+from brazbot.threads import Thread
 from brazbot.channels import Channel, VoiceChannel, TextChannel
+from brazbot.router import CommandRouter
+from brazbot.autocomplete import AutocompleteCache
+from brazbot.candidate_index import CandidateIndex, MAX_CHOICES
+from brazbot.command_sync import SyncState, RateLimitBuckets, diff_commands, tree_hash
+from brazbot.checks import CheckPipeline, CheckFailure, get_checks, checks_ran, invalidate_guarded
 
 logging.basicConfig(level=logging.DEBUG)
 #logging.getLogger().setLevel(logging.CRITICAL)
@@ -21,11 +29,19 @@ class CommandContext:
         self.interaction = interaction
         self.channel_id = message.get('channel_id')
         self.author = message.get('author') or (interaction.get('member', {}).get('user') if interaction else None)
+        self.member = message.get('member') or (interaction.get('member') if interaction else None)
         self.content = message.get('content')
         self.guild_id = message.get('guild_id') if message.get('guild_id') else (interaction.get('guild_id') if interaction else None)
         self.options = {opt['name']: opt['value'] for opt in (interaction['data'].get('options', []) if interaction and 'data' in interaction else [])}
 
     async def defer(self, ephemeral=False):
+        if self.interaction.get('_responded'):
+            return  # Already acknowledged (e.g. by the auto-defer watchdog)
+        self.interaction['_responded'] = True
+        # Later send_interaction calls wait for this and become follow-ups
+        deferred = asyncio.get_running_loop().create_future()
+        self.interaction['_deferred'] = deferred
+
         url = f"https://discord.com/api/v10/interactions/{self.interaction['id']}/{self.interaction['token']}/callback"
         json_data = {
             "type": 5  # Type 5 is for deferred responses
@@ -33,18 +49,21 @@ class CommandContext:
         if ephemeral:
             json_data["data"] = {"flags": 64}
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=json_data) as response:
-                if response.status != 204:
-                    logging.error(f"Failed to defer interaction: {response.status}")
-                else:
-                    logging.info("Interaction deferred successfully")
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url, json=json_data) as response:
+                    if response.status != 204:
+                        logging.error(f"Failed to defer interaction: {response.status}")
+                    else:
+                        logging.info("Interaction deferred successfully")
+        finally:
+            deferred.set_result(True)
 
     async def send_modal(self, title, custom_id, data):
         await self.bot.message_handler.send_modal(self.interaction, title, custom_id, data)
 
     async def send_followup_message(self, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
-        await self.bot.message_handler.send_followup_message(self.bot.application_id, self.interaction["token"], content, embed, embeds, files, components, ephemeral)
+        return await self.bot.message_handler.send_followup_message(self.bot.application_id, self.interaction["token"], content, embed, embeds, files, components, ephemeral)
 
     async def get_channel(self, id=None):
         _id = id if id is not None else self.channel_id
@@ -56,8 +75,75 @@ class CommandHandler:
         self.commands = {}
         self.autocomplete_functions = {}
         self._param_channel = None
+        self.router = CommandRouter(bot.command_prefix)
+        self.auto_defer_after = None
+        self.auto_defer_ephemeral = False
+        self.latencies = {}
+        self.sync_state = SyncState()
+        self.autocomplete_cache = AutocompleteCache()
+        self._session = None
+        self._tree_hash = None
+        self.check_pipelines = {}
+        self._defer_tasks = set()  # Auto-defer POSTs in flight, kept referenced until done
+
+    def enable_auto_defer(self, after=2.2, ephemeral=False):
+        """
+        Opt-in watchdog: slash commands that have not responded after `after`
+        seconds are deferred (type 5) automatically, and their later
+        send_interaction calls are sent as follow-ups.
+        """
+        self.auto_defer_after = after
+        self.auto_defer_ephemeral = ephemeral
+
+    def disable_auto_defer(self):
+        self.auto_defer_after = None
+
+    async def _defer_watchdog(self, ctx, command_name):
+        await asyncio.sleep(self.auto_defer_after)
+        if not ctx.interaction.get('_responded'):
+            logging.warning(f"Command '{command_name}' did not respond within {self.auto_defer_after}s, deferring")
+            self._latency_entry(command_name)["auto_deferred"] += 1
+            # Shielded: the command finishing cancels the watchdog, but an
+            # acknowledgement already on its way must still complete
+            task = asyncio.ensure_future(ctx.defer(ephemeral=self.auto_defer_ephemeral))
+            self._defer_tasks.add(task)
+            task.add_done_callback(self._defer_tasks.discard)
+            await asyncio.shield(task)
+
+    def _latency_entry(self, command_name):
+        entry = self.latencies.get(command_name)
+        if entry is None:
+            entry = self.latencies[command_name] = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0, "auto_deferred": 0}
+        return entry
+
+    def record_latency(self, command_name, elapsed):
+        entry = self._latency_entry(command_name)
+        entry["count"] += 1
+        entry["total"] += elapsed
+        entry["last"] = elapsed
+        if elapsed > entry["max"]:
+            entry["max"] = elapsed
+
+    def command_stats(self):
+        """
+        Per-command handler latency, slowest average first.
+
+        Returns:
+            list: dicts with name, count, avg, max, last and auto_deferred.
+        """
+        stats = [
+            {
+                "name": name,
+                "count": entry["count"],
+                "avg": entry["total"] / entry["count"] if entry["count"] else 0.0,
+                "max": entry["max"],
+                "last": entry["last"],
+                "auto_deferred": entry["auto_deferred"]
+            } for name, entry in self.latencies.items()
+        ]
+        return sorted(stats, key=lambda stat: stat["avg"], reverse=True)
 
-    def register_command(self, func, name=None, description=None):
+    def register_command(self, func, name=None, description=None, aliases=None):
         name = name or func.__name__
         description = description or func.__doc__ or "No description provided"
 
@@ -94,7 +180,13 @@ class CommandHandler:
                 option["type"] = 11  # THREAD type (custom Thread object)
             elif isinstance(param, _GenericAlias) and param.__origin__ is Literal:
                 option["type"] = 3  # STRING
-                option["choices"] = [{"name": v, "value": v} for v in get_args(param)]
+                choices = [{"name": str(v), "value": v} for v in get_args(param)]
+                if len(choices) > MAX_CHOICES:
+                    # Discord caps choices at 25; serve larger literals through autocomplete
+                    option["autocomplete"] = True
+                    self.autocomplete_functions[(name, param_name)] = CandidateIndex(choices)
+                else:
+                    option["choices"] = choices
             elif isinstance(param, _GenericAlias) and param.__origin__ is Union and len(param.__args__) == 2 and param.__args__[1] is type(None):
                 option["type"] = 3  # STRING
                 option["required"] = False
@@ -122,21 +214,45 @@ class CommandHandler:
             "options": options,
             "type": 1  # 1 indicates a CHAT_INPUT command
         }
+        self.router.add(name, func, aliases)
+        self._tree_hash = None
+        self.check_pipelines.pop(name, None)
 
         logging.debug(f"Registered command: {name} with options: {options}")
 
         #logging.debug(f"Registered command: {name} with options: {options}")
 
-    def register_autocomplete(self, func, command_name, option_name):
+    def register_autocomplete(self, func, command_name, option_name, per_user=False):
+        """
+        func may be an async function of the interaction or a CandidateIndex.
+        Suggestions are cached per guild; per_user also scopes them to the
+        user typing, for functions whose answer depends on who asks.
+        """
         if command_name not in self.commands:
             raise ValueError(f"Command '{command_name}' not found")
         for option in self.commands[command_name]["options"]:
             if option["name"] == option_name:
                 option["autocomplete"] = True
+                if per_user:
+                    func.autocomplete_per_user = True
                 self.autocomplete_functions[(command_name, option_name)] = func
+                self._tree_hash = None
                 return
         raise ValueError(f"Option '{option_name}' not found in command '{command_name}'")
 
+    async def _get_session(self):
+        # Shared session for the hot interaction-callback paths
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._defer_tasks:
+            await asyncio.gather(*self._defer_tasks, return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     async def send_autocomplete_response(self, interaction, suggestions):
         response_data = {
             "type": 8,  # Autocomplete result type
@@ -145,10 +261,10 @@ class CommandHandler:
             }
         }
         url = f"https://discord.com/api/v10/interactions/{interaction['id']}/{interaction['token']}/callback"
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=response_data) as response:
-                if response.status != 200:
-                    logging.error(f"Failed to send autocomplete response: {response.status}")
+        session = await self._get_session()
+        async with session.post(url, json=response_data) as response:
+            if response.status not in (200, 204):
+                logging.error(f"Failed to send autocomplete response: {response.status}")
 
 
     async def handle_autocomplete(self, interaction):
@@ -158,118 +274,306 @@ class CommandHandler:
         if focused_option:
             option_name = focused_option['name']
             if (command_name, option_name) in self.autocomplete_functions:
-                await self.autocomplete_functions[(command_name, option_name)](interaction)
+                func = self.autocomplete_functions[(command_name, option_name)]
+                await self.autocomplete_cache.run(interaction, command_name, option_name, str(focused_option.get('value', '')), func, self.send_autocomplete_response)
             else:
                 logging.warning(f"No autocomplete function registered for command '{command_name}' and option '{option_name}'")
 
 
+    def check_pipeline(self, name, func):
+        checks = get_checks(func)
+        pipeline = self.check_pipelines.get(name)
+        # Rebuilt when checks were attached after registration
+        if pipeline is None or len(pipeline) != len(checks):
+            pipeline = self.check_pipelines[name] = CheckPipeline(checks)
+        return pipeline
+
+    def invalidate_checks(self, guild_id=None):
+        for pipeline in self.check_pipelines.values():
+            pipeline.invalidate(guild_id)
+        invalidate_guarded(guild_id)
+
+    async def run_checks(self, name, func, ctx):
+        pipeline = self.check_pipeline(name, func)
+        if not len(pipeline):
+            return True
+        try:
+            await pipeline.run(ctx)
+        except CheckFailure as e:
+            await self.bot.event_handler.handle_event({
+                't': 'on_error',
+                'd': {'message': str(e), 'command': name, 'check': e.check.name, 'channel_id': ctx.channel_id, **e.details}
+            })
+            return False
+        return True
+
+    def _router_prefixes(self):
+        prefix = self.bot.command_prefix
+        if prefix is None:
+            return ()
+        return (prefix,) if isinstance(prefix, str) else tuple(prefix)
+
+    def _resolve_option(self, ctx, opt, resolved, annotations, user_id):
+        """
+        Builds the argument for one slash-command option from the interaction's
+        resolved block. Returns a coroutine when a REST lookup is still needed.
+        """
+        value = opt['value']
+        if opt['type'] == 6:  # USER type
+            user = resolved.get('users', {}).get(value)
+            if user is None:
+                return Member.from_user_id(self.bot, value, ctx.guild_id)
+            data = dict(user)
+            member = resolved.get('members', {}).get(value)
+            if member:
+                data.update(member)
+            self.bot.set_cache_data(f"member_{value}", user, seconds=200)
+            return Member(data, self.bot, ctx.guild_id)
+        elif opt['type'] == 8:  # ROLE type
+            role = resolved.get('roles', {}).get(value)
+            if role is None:
+                return Role.from_role_id(self.bot, ctx.guild_id, value)
+            self.bot.set_cache_data(f"role_{value}", role, seconds=120)
+            return Role(role, self.bot, ctx.guild_id)
+        elif opt['type'] == 7:  # CHANNEL type
+            channel_cls = annotations.get(opt['name'], self._param_channel)
+            if channel_cls not in (Channel, VoiceChannel, TextChannel):
+                channel_cls = self._param_channel or Channel
+            channel = resolved.get('channels', {}).get(value)
+            if channel is None:
+                return channel_cls.from_channel_id(self.bot, ctx.guild_id, value, user_id)
+            return channel_cls(channel, self.bot, ctx.guild_id, value, user_id)
+        elif opt['type'] == 9:  # GUILD type
+            return Guild.from_guild_id(self.bot, ctx.guild_id)
+        elif opt['type'] == 11:  # ATTACHMENT type
+            attachment = resolved.get('attachments', {}).get(value)
+            if attachment is not None:
+                return Attachment(attachment)
+            return Thread.from_thread_id(self.bot, ctx.guild_id, value)
+        return value
+
     #logging.debug(f"Handling command for message: {message}")
     async def handle_command(self, message):
         logging.debug(f"Handling command for message: {message}")
         if 'content' in message['d']:
             content = message['d']['content']
-            if self.bot.command_prefix and content.startswith(self.bot.command_prefix):
-                command_name, *args = content[len(self.bot.command_prefix):].split()
-                if command_name in self.commands:
-                    ctx = CommandContext(self.bot, message['d'])
-                    await self.commands[command_name]["func"](ctx, *args)
+            prefixes = self._router_prefixes()
+            if self.router.prefixes != prefixes or self.router.mention_id != self.bot.application_id:
+                self.router.set_prefixes(prefixes, self.bot.application_id)
+            route, tokens = self.router.resolve(content)
+            if route is not None:
+                ctx = CommandContext(self.bot, message['d'])
+                if not await self.run_checks(route.name, route.func, ctx):
+                    return
+                try:
+                    args, kwargs = await route.convert(ctx, tokens)
+                except ValueError as e:
+                    await self.bot.event_handler.handle_event({
+                        't': 'on_error',
+                        'd': {'message': str(e), 'command': route.name, 'channel_id': ctx.channel_id}
+                    })
+                    return
+                started = time.monotonic()
+                try:
+                    with checks_ran(route.func):
+                        await route.func(ctx, *args, **kwargs)
+                finally:
+                    self.record_latency(route.name, time.monotonic() - started)
         elif message['d']['type'] == 2:  # Slash command type
             command_name = message['d']['data']['name']
             if command_name in self.commands:
+                started = time.monotonic()
                 ctx = CommandContext(self.bot, message['d'], interaction=message['d'])
-                user_id = message['d'].get('member', {}).get('user', {}).get('id')
-
-                self.bot.interaction = message['d']  # Set the interaction attribute
-                options = message['d']['data'].get('options', [])
-                args = {}
-                for opt in options:
-                    if opt['type'] == 6:  # USER type
-                        args[opt['name']] = await Member.from_user_id(self.bot, opt['value'], ctx.guild_id)
-                    elif opt['type'] == 8:  # ROLE type
-                        args[opt['name']] = await Role.from_role_id(self.bot, ctx.guild_id, opt['value'])
-                    elif opt['type'] == 7:  # CHANNEL type
-                        if self._param_channel is VoiceChannel:
-                            args[opt['name']] = await VoiceChannel.from_channel_id(self.bot, ctx.guild_id, opt['value'], user_id)
-                        elif self._param_channel is TextChannel:
-                            args[opt['name']] = await TextChannel.from_channel_id(self.bot, ctx.guild_id, opt['value'], user_id)
-                        elif self._param_channel is Channel:
-                            args[opt['name']] = await Channel.from_channel_id(self.bot, ctx.guild_id, opt['value'], user_id)
-
-                    elif opt['type'] == 9:  # GUILD type 
-                        args[opt['name']] = await Guild.from_guild_id(self.bot, ctx.guild_id)
-                    elif opt['type'] == 11:  # THREAD type 
-                        args[opt['name']] = await Thread.from_thread_id(cls, self.bot, ctx.guild_id, opt['value'])
-                    else:
-                        args[opt['name']] = opt['value']
-                logging.debug(f"Executing command: {command_name} with options: {options}")
-                await self.commands[command_name]["func"](ctx, **args)
+                if not await self.run_checks(command_name, self.commands[command_name]["func"], ctx):
+                    return
+                watchdog = None
+                try:
+                    if self.auto_defer_after is not None:
+                        watchdog = asyncio.create_task(self._defer_watchdog(ctx, command_name))
+                    user_id = message['d'].get('member', {}).get('user', {}).get('id')
+
+                    self.bot.interaction = message['d']  # Set the interaction attribute
+                    options = message['d']['data'].get('options', [])
+                    resolved = message['d']['data'].get('resolved', {})
+                    annotations = self.commands[command_name]["func"].__annotations__
+                    args = {}
+                    pending = {}
+                    for opt in options:
+                        value = self._resolve_option(ctx, opt, resolved, annotations, user_id)
+                        if asyncio.iscoroutine(value):
+                            pending[opt['name']] = value
+                        else:
+                            args[opt['name']] = value
+                    if pending:
+                        # Options missing from the resolved block are fetched concurrently
+                        results = await asyncio.gather(*pending.values())
+                        args.update(zip(pending.keys(), results))
+                    logging.debug(f"Executing command: {command_name} with options: {options}")
+                    func = self.commands[command_name]["func"]
+                    with checks_ran(func):
+                        await func(ctx, **args)
+                finally:
+                    if watchdog is not None and not watchdog.done():
+                        watchdog.cancel()
+                    self.record_latency(command_name, time.monotonic() - started)
         elif message['d']['type'] == 4:  # Autocomplete interaction
             await self.handle_autocomplete(message['d'])
 
-    async def get_existing_commands(self, guild_id=None):
-        url = f"{self.bot.base_url}/applications/{self.bot.application_id}/commands"
+    def _commands_url(self, guild_id=None):
         if guild_id:
-            url = f"{self.bot.base_url}/applications/{self.bot.application_id}/guilds/{guild_id}/commands"
+            return f"{self.bot.base_url}/applications/{self.bot.application_id}/guilds/{guild_id}/commands"
+        return f"{self.bot.base_url}/applications/{self.bot.application_id}/commands"
+
+    def command_payloads(self):
+        return [
+            {
+                "name": name,
+                "description": cmd["description"],
+                "options": cmd["options"],
+                "type": 1  # 1 indica um comando CHAT_INPUT
+            } for name, cmd in self.commands.items()
+        ]
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.bot.headers) as response:
-                if response.status == 200:
-                    return {cmd['name']: cmd for cmd in await response.json()}
-                return {}
+    def tree_hash(self):
+        if self._tree_hash is None:
+            self._tree_hash = tree_hash(self.command_payloads())
+        return self._tree_hash
+
+    async def _command_request(self, session, method, url, payload=None, bucket=None):
+        while True:
+            if bucket is not None:
+                await bucket.acquire()
+            async with session.request(method, url, headers=self.bot.headers, json=payload) as response:
+                if bucket is not None:
+                    bucket.update(response.headers, response.status)
+                if response.status == 429:
+                    if bucket is None:
+                        await self.bot.handle_rate_limit(response)
+                    continue
+                if response.status not in (200, 201, 204):
+                    raise Exception(f"{method} {url} failed: {response.status} - {await response.text()}")
+                if response.status == 204:
+                    return None
+                return await response.json()
 
-    async def sync_commands(self, guild_id=None):
+    async def get_existing_commands(self, guild_id=None, session=None):
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.get_existing_commands(guild_id, session)
+        try:
+            commands = await self._command_request(session, "GET", self._commands_url(guild_id))
+        except Exception as e:
+            logging.error(f"Failed to fetch existing commands: {e}")
+            return {}
+        return {cmd['name']: cmd for cmd in commands}
+
+    async def sync_commands(self, guild_id=None, force=False):
+        """
+        Incremental sync: skips the network entirely when the local tree hash
+        matches the last synced one, otherwise POSTs, PATCHes and DELETEs only
+        the commands that differ from what Discord has. The first sync of a
+        scope in each process always GETs the remote commands, so changes
+        made outside this bot are picked up without force=True.
+        """
         try:
             if not Snowflake.is_valid(self.bot.application_id):
                 raise ValueError(f"Invalid application_id: {self.bot.application_id}")
 
-            current_commands = [
-                {
-                    "name": name,
-                    "description": cmd["description"],
-                    "options": cmd["options"],
-                    "type": 1  # 1 indica um comando CHAT_INPUT
-                } for name, cmd in self.commands.items()
-            ]
-
-            existing_commands = await self.get_existing_commands(guild_id)
-            transformed_existing_commands = [
-                {
-                    "name": cmd['name'],
-                    "description": cmd['description'],
-                    "options": [
-                        {
-                            "name": opt['name'],
-                            "description": opt.get('description', ''),
-                            "type": opt['type'],
-                            "required": opt.get('required', False)
-                        } for opt in cmd.get('options', [])
-                    ],
-                    "type": cmd['type']
-                } for cmd in existing_commands.values()
-            ]
-
-            if self.commands_changed(current_commands, transformed_existing_commands):
-                url = f"{self.bot.base_url}/applications/{self.bot.application_id}/commands"
-                if guild_id:
-                    url = f"{self.bot.base_url}/applications/{self.bot.application_id}/guilds/{guild_id}/commands"
-
-                async with aiohttp.ClientSession() as session:
-                    async with session.put(url, headers=self.bot.headers, json=current_commands) as response:
-                        response_text = await response.text()
-                        if response.status != 200:
-                            logging.error(f"Failed to sync commands: {response.status}")
-                            logging.error(f"Response: {response_text}")
-                            return f"Failed to sync commands: {response.status}\nResponse: {response_text}"
-                        else:
-                            logging.info("Commands synced successfully: " + response_text)
-                            return f"Commands synced successfully: {response_text}"
-            else:
+            current_hash = self.tree_hash()
+            if not force and self.sync_state.is_current(self.bot.application_id, guild_id, current_hash):
                 logging.info("No changes in commands. Sync skipped.")
                 return "No changes in commands. Sync skipped."
+
+            current_commands = self.command_payloads()
+            url = self._commands_url(guild_id)
+            async with aiohttp.ClientSession() as session:
+                existing_commands = {cmd['name']: cmd for cmd in await self._command_request(session, "GET", url)}
+                changes = diff_commands(current_commands, existing_commands)
+                ids = {name: cmd['id'] for name, cmd in existing_commands.items()}
+
+                for name, payload in changes["create"]:
+                    created = await self._command_request(session, "POST", url, payload)
+                    ids[name] = created['id']
+                for name, payload in changes["update"]:
+                    command_id = payload.pop("id")
+                    await self._command_request(session, "PATCH", f"{url}/{command_id}", payload)
+                for name, command_id in changes["delete"]:
+                    await self._command_request(session, "DELETE", f"{url}/{command_id}")
+                    ids.pop(name, None)
+
+            self.sync_state.update(self.bot.application_id, guild_id, current_hash, ids)
+            summary = f"{len(changes['create'])} created, {len(changes['update'])} updated, {len(changes['delete'])} deleted"
+            logging.info(f"Commands synced successfully: {summary}")
+            return f"Commands synced successfully: {summary}"
         except Exception as e:
             logging.error(f"Exception occurred while syncing commands: {e}")
             return f"Exception occurred while syncing commands: {e}"
 
+    async def deploy_commands(self, guild_ids, commands=None, concurrency=8, force=False):
+        """
+        Deploys a command tree to many guilds through a bounded worker pool
+        sharing one session, with a rate-limit bucket per route and guild.
+
+        Args:
+            guild_ids (iterable): Guilds to deploy to.
+            commands (list, optional): Command payloads. Defaults to the registered ones.
+            concurrency (int, optional): Number of guilds deployed at once.
+            force (bool, optional): Ignore the stored tree hash.
+
+        Returns:
+            dict: guild_id -> {"status": "skipped" | "unchanged" | "deployed" | "failed",
+            "diff": {"create": [...], "update": [...], "delete": [...]}, "error": str | None}
+        """
+        if not Snowflake.is_valid(self.bot.application_id):
+            raise ValueError(f"Invalid application_id: {self.bot.application_id}")
+
+        if commands is None:
+            commands = self.command_payloads()
+        current_hash = tree_hash(commands)
+        queue = asyncio.Queue()
+        for guild_id in dict.fromkeys(str(guild_id) for guild_id in guild_ids):
+            queue.put_nowait(guild_id)
+        results = {}
+        buckets = RateLimitBuckets()
+        route = "/applications/{application_id}/guilds/{guild_id}/commands"
+
+        async def deploy_guild(session, guild_id):
+            if not force and self.sync_state.is_current(self.bot.application_id, guild_id, current_hash):
+                return {"status": "skipped", "diff": None, "error": None}
+            url = self._commands_url(guild_id)
+            existing = {cmd['name']: cmd for cmd in await self._command_request(session, "GET", url, bucket=buckets.get("GET", route, guild_id))}
+            changes = diff_commands(commands, existing)
+            diff = {key: [name for name, _ in value] for key, value in changes.items()}
+            if not any(diff.values()):
+                ids = {name: cmd['id'] for name, cmd in existing.items()}
+                status = "unchanged"
+            else:
+                deployed = await self._command_request(session, "PUT", url, commands, bucket=buckets.get("PUT", route, guild_id))
+                ids = {cmd['name']: cmd['id'] for cmd in deployed}
+                status = "deployed"
+            self.sync_state.update(self.bot.application_id, guild_id, current_hash, ids, save=False)
+            return {"status": status, "diff": diff, "error": None}
+
+        async def worker(session):
+            while not queue.empty():
+                guild_id = queue.get_nowait()
+                try:
+                    results[guild_id] = await deploy_guild(session, guild_id)
+                except Exception as e:
+                    logging.error(f"Failed to deploy commands to guild {guild_id}: {e}")
+                    results[guild_id] = {"status": "failed", "diff": None, "error": str(e)}
+
+        try:
+            async with aiohttp.ClientSession() as session:
+                await asyncio.gather(*(worker(session) for _ in range(max(1, concurrency))))
+        finally:
+            self.sync_state.save()  # Keeps the guilds already deployed if the run is cut short
+
+        deployed = sum(1 for result in results.values() if result["status"] == "deployed")
+        failed = sum(1 for result in results.values() if result["status"] == "failed")
+        logging.info(f"Deployed commands to {deployed} of {len(results)} guilds ({failed} failed)")
+        return results
+
     async def send_response(self, content):
         url = f"https://discord.com/api/v10/interactions/{self.interaction['id']}/{self.interaction['token']}/callback"
         json_data = {
@@ -291,24 +595,8 @@ class CommandHandler:
                 return await response.json()
     
     def commands_changed(self, current_commands, existing_commands):
-        if len(current_commands) != len(existing_commands):
-           #logging.debug("Number of commands changed.")
-            return True
-
-        for current, existing in zip(current_commands, existing_commands):
-            if current["name"] != existing["name"]:
-               #logging.debug(f"Command name changed: {current['name']} != {existing['name']}")
-                return True
-            if current["description"] != existing["description"]:
-               #logging.debug(f"Description for command {current['name']} changed: {current['description']} != {existing['description']}")
-                return True
-            if current["options"] != existing["options"]:
-               #logging.debug(f"Options for command {current['name']} changed.")
-                return True
-
-        return False
+        return tree_hash(current_commands) != tree_hash(existing_commands)
 
-   
     async def check_rate_limits(self):
         endpoints = [
             "/gateway",
@@ -0,0 +1,224 @@
+"""
+Cooldown and concurrency engines behind decorators.rate_limit and
+decorators.max_concurrency.
+
+Each bucket key (a user, channel or guild id) holds as little as possible:
+
+    fixed    (window start, count)   `limit` uses per window of `per` seconds
+    gcra     theoretical arrival time  `limit` uses per `per` seconds, smoothed,
+                                       bursts of up to `limit` allowed
+    sliding  array of timestamps      exact log of the last `limit` uses
+
+Buckets are kept in order of last use (a hit moves its key to the end), so
+keys whose window has passed sit at the front. A periodic compaction pops
+them from there, at most `compact_batch` per call, so memory follows the
+number of recently active keys without ever sweeping every key at once.
+"""
+
+import time
+import asyncio
+from array import array
+
+MODES = ("fixed", "sliding", "gcra")
+SCOPES = ("user", "channel", "guild", "global")
+
+
+class Cooldown:
+    def __init__(self, limit, per, mode="fixed", compact_every=60.0, compact_batch=1000):
+        """
+        Args:
+            limit (int): Uses allowed per `per` seconds.
+            per (float): Window length in seconds.
+            mode (str): "fixed", "sliding" or "gcra".
+            compact_every (float): Seconds between sweeps of expired keys.
+            compact_batch (int): Keys a sweep may drop per hit; a sweep that
+                stops there carries on with the next hit.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cooldown mode {mode!r}, expected one of {MODES}")
+        if limit < 1 or per <= 0:
+            raise ValueError("Cooldown limit must be >= 1 and per > 0")
+        self.limit = limit
+        self.per = float(per)
+        self.mode = mode
+        self.interval = self.per / limit      # GCRA emission interval
+        self.tolerance = self.per - self.interval
+        self.compact_every = compact_every
+        self.compact_batch = compact_batch
+        self.buckets = {}
+        self._next_compact = time.monotonic() + compact_every
+        self._hit = getattr(self, f"_hit_{mode}")
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def hit(self, key, now=None):
+        """
+        Records one use of `key` if allowed.
+
+        Returns:
+            float: 0.0 when the use was allowed, otherwise seconds until it would be.
+        """
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_compact:
+            self.compact(now, self.compact_batch)
+        return self._hit(key, now)
+
+    def retry_after(self, key, now=None):
+        """
+        Seconds until `key` may be used again, without recording a use.
+        """
+        if now is None:
+            now = time.monotonic()
+        state = self.buckets.get(key)
+        if state is None:
+            return 0.0
+        if self.mode == "fixed":
+            start, count = state
+            return max(0.0, start + self.per - now) if count >= self.limit else 0.0
+        if self.mode == "gcra":
+            return max(0.0, state - now - self.tolerance)
+        live = [stamp for stamp in state if stamp > now - self.per]
+        return max(0.0, live[0] + self.per - now) if len(live) >= self.limit else 0.0
+
+    def reset(self, key=None):
+        if key is None:
+            self.buckets.clear()
+        else:
+            self.buckets.pop(key, None)
+
+    # Each _hit_* pops the key and stores it again, moving it to the end
+
+    def _hit_fixed(self, key, now):
+        state = self.buckets.pop(key, None)
+        if state is None or now >= state[0] + self.per:
+            self.buckets[key] = (now, 1.0)
+            return 0.0
+        start, count = state
+        if count >= self.limit:
+            self.buckets[key] = state
+            return start + self.per - now
+        self.buckets[key] = (start, count + 1.0)
+        return 0.0
+
+    def _hit_gcra(self, key, now):
+        tat = self.buckets.pop(key, now)
+        if tat < now:
+            tat = now
+        wait = tat - now - self.tolerance
+        if wait > 0:
+            self.buckets[key] = tat
+            return wait
+        self.buckets[key] = tat + self.interval
+        return 0.0
+
+    def _hit_sliding(self, key, now):
+        log = self.buckets.pop(key, None)
+        if log is None:
+            self.buckets[key] = array("d", (now,))
+            return 0.0
+        self.buckets[key] = log
+        cutoff = now - self.per
+        expired = 0
+        while expired < len(log) and log[expired] <= cutoff:
+            expired += 1
+        if expired:
+            del log[:expired]
+        if len(log) >= self.limit:
+            return log[0] + self.per - now
+        log.append(now)
+        return 0.0
+
+    def _expired(self, state, now):
+        if self.mode == "fixed":
+            return now >= state[0] + self.per
+        if self.mode == "gcra":
+            return state <= now
+        return not state or state[-1] <= now - self.per
+
+    def compact(self, now=None, limit=None):
+        """
+        Drops keys whose state no longer limits anything, least recently
+        used first, stopping at the first key still limiting.
+
+        Every state expires within `per` seconds of its last hit, and keys
+        are in last-hit order, so each key not dropped now will be once the
+        ones before it are.
+
+        Args:
+            limit (int, optional): Most keys to drop in this call.
+
+        Returns:
+            int: Number of keys removed.
+        """
+        if now is None:
+            now = time.monotonic()
+        buckets = self.buckets
+        removed = 0
+        while buckets and (limit is None or removed < limit):
+            key = next(iter(buckets))
+            if not self._expired(buckets[key], now):
+                break
+            del buckets[key]
+            removed += 1
+        # Cut short by the limit: carry on with the next hit
+        self._next_compact = now if limit is not None and removed >= limit else now + self.compact_every
+        return removed
+
+
+def scope_key(ctx, scope):
+    if scope == "global":
+        return None
+    if scope == "guild":
+        return ctx.guild_id
+    if scope == "channel":
+        return ctx.channel_id
+    return ctx.author['id'] if ctx.author else None
+
+
+class KeyedSemaphore:
+    """
+    One semaphore of `limit` slots per key, created on first use and dropped
+    as soon as nobody holds or waits for it.
+    """
+    def __init__(self, limit):
+        if limit < 1:
+            raise ValueError("Concurrency limit must be >= 1")
+        self.limit = limit
+        self.slots = {}  # key -> [asyncio.Semaphore, holders + waiters]
+
+    def __len__(self):
+        return len(self.slots)
+
+    def locked(self, key):
+        entry = self.slots.get(key)
+        return entry is not None and entry[0].locked()
+
+    async def acquire(self, key, wait=True):
+        """
+        Returns:
+            bool: False when wait is False and every slot is taken.
+        """
+        if not wait and self.locked(key):
+            return False
+        entry = self.slots.get(key)
+        if entry is None:
+            entry = self.slots[key] = [asyncio.Semaphore(self.limit), 0]
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._leave(key, entry)
+            raise
+        return True
+
+    def release(self, key):
+        entry = self.slots[key]
+        entry[0].release()
+        self._leave(key, entry)
+
+    def _leave(self, key, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.slots[key]
@@ -1,13 +1,12 @@
-import aiohttp
 import asyncio
 import functools
 from functools import wraps
-from brazbot.cache import Cache
+from brazbot.permissions import ADMINISTRATOR
+from brazbot.checks import Check, CheckFailure, add_check
+from brazbot.cooldowns import Cooldown, KeyedSemaphore, SCOPES, scope_key
 from datetime import datetime, timedelta
 
 
-cache = Cache()
-
 def tasks(seconds=120):
     def decorator(func):
         @wraps(func)
@@ -39,99 +38,96 @@ def describe(**descriptions):
 
 
 def is_admin():
+    async def predicate(ctx, invocation):
+        # Owner and ADMINISTRATOR both resolve to every permission bit
+        return await invocation.permissions() & ADMINISTRATOR
+
     def decorator(func):
-        @functools.wraps(func)
-        async def wrapper(ctx, *args, **kwargs):
-            guild_id = ctx.guild_id
-            author_id = ctx.author['id']
-            
-            guild_info = cache.get(f"guild_info_{guild_id}")
-            if not guild_info:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(f"https://discord.com/api/v10/guilds/{guild_id}", headers=ctx.bot.headers) as response:
-                        guild_info = await response.json()
-                cache.set(f"guild_info_{guild_id}", guild_info)
-            if guild_info.get('owner_id') == author_id:
-                return await func(ctx, *args, **kwargs)
-            
-            roles = ctx.member['roles']
-            guild_roles = cache.get(f"guild_roles_{guild_id}")
-            if not guild_roles:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(f"https://discord.com/api/v10/guilds/{guild_id}/roles", headers=ctx.bot.headers) as response:
-                        guild_roles = await response.json()
-                cache.set(f"guild_roles_{guild_id}", guild_roles)
-            admin_role_ids = [role['id'] for role in guild_roles if int(role['permissions']) & 0x8]
-            if any(role_id in roles for role_id in admin_role_ids):
-                return await func(ctx, *args, **kwargs)
-            else:
-                await ctx.bot.event_handler.handle_event({
-                    't': 'on_error',
-                    'd': {'message': 'Você precisa ser um administrador ou o dono do servidor para usar este comando.', 'channel_id': ctx.channel_id}
-                })
-        return wrapper
+        return add_check(func, Check(
+            "is_admin", predicate,
+            'Você precisa ser um administrador ou o dono do servidor para usar este comando.',
+            cost=2
+        ))
     return decorator
 
 def is_owner():
+    async def predicate(ctx, invocation):
+        return (await invocation.guild()).owner_id == invocation.user_id
+
     def decorator(func):
-        @functools.wraps(func)
-        async def wrapper(ctx, *args, **kwargs):
-            guild_id = ctx.guild_id
-            author_id = ctx.author['id']
-            
-            guild_info = cache.get(f"guild_info_{guild_id}")
-            if not guild_info:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(f"https://discord.com/api/v10/guilds/{guild_id}", headers=ctx.bot.headers) as response:
-                        guild_info = await response.json()
-                cache.set(f"guild_info_{guild_id}", guild_info)
-            if guild_info.get('owner_id') == author_id:
-                return await func(ctx, *args, **kwargs)
-            await ctx.bot.event_handler.handle_event({
-                't': 'on_error',
-                'd': {'message': 'Você precisa ser o dono do servidor para usar este comando.', 'channel_id': ctx.channel_id}
-            })
-        return wrapper
+        return add_check(func, Check(
+            "is_owner", predicate,
+            'Você precisa ser o dono do servidor para usar este comando.',
+            cost=1
+        ))
     return decorator
 
 def has_role(role_name):
+    async def predicate(ctx, invocation):
+        return not (await invocation.guild()).role_named(role_name).isdisjoint(invocation.role_ids)
+
     def decorator(func):
-        @functools.wraps(func)
-        async def wrapper(ctx, *args, **kwargs):
-            roles = ctx.member['roles']
-            guild_id = ctx.guild_id
-            
-            guild_roles = cache.get(f"guild_roles_{guild_id}")
-            if not guild_roles:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(f"https://discord.com/api/v10/guilds/{guild_id}/roles", headers=ctx.bot.headers) as response:
-                        guild_roles = await response.json()
-                cache.set(f"guild_roles_{guild_id}", guild_roles)
-            role_ids = [role['id'] for role in guild_roles if role['name'] == role_name]
-            if any(role_id in roles for role_id in role_ids):
-                return await func(ctx, *args, **kwargs)
-            else:
-                await ctx.bot.event_handler.handle_event({
-                    't': 'on_error',
-                    'd': {'message': f'Você precisa do papel {role_name} para usar este comando.', 'channel_id': ctx.channel_id}
-                })
-        return wrapper
+        return add_check(func, Check(
+            f"has_role:{role_name}", predicate,
+            f'Você precisa do papel {role_name} para usar este comando.',
+            cost=1
+        ))
     return decorator
     
-def rate_limit(limit, per, scope="user"):
+def rate_limit(limit, per, scope="user", mode="fixed"):
+    """
+    Allows `limit` uses every `per` seconds per user, channel or guild.
+
+    Args:
+        mode (str): "fixed" window, "sliding" window log or "gcra" (smoothed token bucket).
+    """
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown rate limit scope {scope!r}, expected one of {SCOPES}")
+    cooldown = Cooldown(limit, per, mode)
+
+    async def predicate(ctx, invocation):
+        retry_after = cooldown.hit(scope_key(ctx, scope))
+        if retry_after:
+            raise CheckFailure(check, time_left=retry_after, retry_after=retry_after)
+        return True
+
+    check = Check(
+        f"rate_limit:{scope}", predicate,
+        'Você atingiu o limite de uso deste comando.',
+        cost=0, stateful=True
+    )
+
+    def decorator(func):
+        func = add_check(func, check)
+        func._cooldown = cooldown
+        return func
+    return decorator
+
+def max_concurrency(n, per="guild", wait=True):
+    """
+    Runs at most `n` invocations of the command at once per user, channel,
+    guild or globally ("global"). Extra calls wait for a slot, or are
+    rejected through on_error when wait is False.
+    """
+    if per not in SCOPES:
+        raise ValueError(f"Unknown concurrency scope {per!r}, expected one of {SCOPES}")
+    slots = KeyedSemaphore(n)
+
     def decorator(func):
         @functools.wraps(func)
         async def wrapper(ctx, *args, **kwargs):
-            key = f"rate_limit:{scope}:{ctx.guild_id if scope == 'guild' else ctx.channel_id if scope == 'channel' else ctx.author['id']}"
-            current = cache.get(key) or 0
-            if current >= limit:
+            key = scope_key(ctx, per)
+            if not await slots.acquire(key, wait=wait):
                 await ctx.bot.event_handler.handle_event({
                     't': 'on_error',
-                    'd': {'message': 'Você atingiu o limite de uso deste comando.', 'time_left': per, 'channel_id': ctx.channel_id}
+                    'd': {'message': 'Este comando já está em execução, tente novamente em instantes.', 'channel_id': ctx.channel_id}
                 })
-            else:
-                cache.set(key, current + 1, ttl=per)
+                return
+            try:
                 return await func(ctx, *args, **kwargs)
+            finally:
+                slots.release(key)
+        wrapper._concurrency = slots
         return wrapper
     return decorator
 
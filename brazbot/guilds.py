@@ -1,20 +1,22 @@
 import aiohttp
 from datetime import datetime
 from brazbot.member import Member
+from brazbot.intern import intern_string, intern_strings
+from brazbot.candidate_index import CandidateIndex
 from datetime import datetime, timedelta
 
 class Guild:
 	def __init__(self, data, bot=None):
 		self.bot = bot
-		self.id = data.get('id')
+		self.id = intern_string(data.get('id'))
 		self.name = data.get('name')
 		self.icon = data.get('icon')
 		self.splash = data.get('splash')
 		self.discovery_splash = data.get('discovery_splash')
 		self.owner_id = data.get('owner_id')
 		self.owner = data.get('owner')
-		self.permissions = data.get('permissions')
-		self.region = data.get('region')
+		self.permissions = intern_string(data.get('permissions'))
+		self.region = intern_string(data.get('region'))
 		self.afk_channel = data.get('afk_channel')
 		self.afk_timeout = data.get('afk_timeout')
 		self.widget_enabled = data.get('widget_enabled')
@@ -24,7 +26,7 @@ class Guild:
 		self.explicit_content_filter = data.get('explicit_content_filter')
 		self.roles = data.get('roles', [])
 		self.emojis = data.get('emojis', [])
-		self.features = data.get('features', [])
+		self.features = intern_strings(data.get('features', []))
 		self.mfa_level = data.get('mfa_level')
 		self.application_id = data.get('application_id')
 		self.system_channel = data.get('system_channel')
@@ -37,7 +39,7 @@ class Guild:
 		self.banner = data.get('banner')
 		self.premium_tier = data.get('premium_tier')
 		self.premium_subscription_count = data.get('premium_subscription_count')
-		self.preferred_locale = data.get('preferred_locale')
+		self.preferred_locale = intern_string(data.get('preferred_locale'))
 		self.public_updates_channel = data.get('public_updates_channel')
 		self.max_video_channel_users = data.get('max_video_channel_users')
 		self.approximate_member_count = data.get('approximate_member_count')
@@ -70,7 +72,7 @@ class Guild:
 	@classmethod
 	async def from_guild_id(cls, bot, guild_id):
 		cache_key = f"guild_{guild_id}"
-		data = bot.get_cache_data(cache_key)
+		data = await bot.get_cache_data_async(cache_key)
 
 		if data:
 			return cls(data, bot)
@@ -84,7 +86,7 @@ class Guild:
 			async with session.get(url, headers=headers) as response:
 				if response.status == 200:
 					data = await response.json()
-					bot.set_cache_data(cache_key, data, seconds=120)
+					await bot.set_cache_data_async(cache_key, data, seconds=120)
 					return cls(data, bot)
 				else:
 					raise Exception(f"Failed to fetch guild data: {response.status}")
@@ -746,6 +748,21 @@ class Guild:
 				else:
 					raise Exception(f"Failed to query members: {response.status}")
 
+	async def member_suggestions(self, query, limit=25, index=None):
+		"""
+		Autocomplete choices for members matching query. Answered from a
+		CandidateIndex when one is given; members found over REST are added
+		to it, so it warms up as people type.
+		"""
+		if index is not None and len(index.prefix(query, limit)) >= limit:
+			return index.search(query, limit)
+		members = await self.query_members(query, limit)
+		if index is None:
+			index = CandidateIndex(limit=limit)
+		for member in members:
+			index.add_member(member)
+		return index.search(query, limit)
+
 	async def templates(self):
 		url = f"https://discord.com/api/v10/guilds/{self.id}/templates"
 		headers = {
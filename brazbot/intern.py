@@ -0,0 +1,95 @@
+"""
+Gateway payloads repeat the same keys and a handful of low-cardinality
+values (locales, permission strings, role ids, guild features) over and
+over. Interning them makes every occurrence point to the same str object
+instead of a fresh copy.
+
+Only dict keys and the fields in INTERN_FIELDS are interned: interned
+strings are never freed on 3.12+, so values that do not repeat (message
+content, nonces, timestamps, user ids) must stay out of the table.
+"""
+
+import sys
+import json
+
+MAX_INTERN_LENGTH = 64
+
+# Keys whose string values (or lists of strings) come from a small, bounded set
+INTERN_FIELDS = frozenset({
+    "t", "type", "status", "locale", "preferred_locale", "region", "rtc_region",
+    "permissions", "allow", "deny", "features", "roles", "guild_id", "discriminator"
+})
+
+
+def intern_string(value):
+    if type(value) is str and len(value) <= MAX_INTERN_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+def intern_strings(values):
+    return [intern_string(value) for value in values]
+
+
+def intern_list(values):
+    for index, value in enumerate(values):
+        if type(value) is str:
+            values[index] = intern_string(value)
+    return values
+
+
+def intern_object_pairs(pairs):
+    # object_pairs_hook for json.loads: keys always, values of INTERN_FIELDS only
+    obj = {}
+    for key, value in pairs:
+        key = sys.intern(key)
+        if key in INTERN_FIELDS:
+            if type(value) is list:
+                value = intern_list(value)
+            else:
+                value = intern_string(value)
+        obj[key] = value
+    return obj
+
+
+def interned_loads(data):
+    return json.loads(data, object_pairs_hook=intern_object_pairs)
+
+
+def deep_sizeof(obj, seen=None):
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += deep_sizeof(value, seen)
+    return size
+
+
+def measure_savings(raw_payloads):
+    """
+    Decodes a recorded corpus (e.g. GUILD_CREATE frames) with and without
+    interning and returns the retained size of each, in bytes.
+
+    Args:
+        raw_payloads (list): Raw JSON frames, as str or bytes.
+
+    Returns:
+        dict: plain, interned and saved byte counts.
+    """
+    plain = [json.loads(raw) for raw in raw_payloads]
+    interned = [interned_loads(raw) for raw in raw_payloads]
+    plain_size = deep_sizeof(plain)
+    interned_size = deep_sizeof(interned)
+    return {
+        "payloads": len(raw_payloads),
+        "plain_bytes": plain_size,
+        "interned_bytes": interned_size,
+        "saved_bytes": plain_size - interned_size
+    }
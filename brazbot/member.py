@@ -1,18 +1,19 @@
 import aiohttp
 from datetime import datetime
 from .roles import Role
+from .intern import intern_string, intern_strings
 
 class Member:
     def __init__(self, data, bot=None, guild_id=None):
         self.bot = bot
         self.id = data.get('id')
         self.username = data.get('username')
-        self.discriminator = data.get('discriminator')
+        self.discriminator = intern_string(data.get('discriminator'))
         self.avatar = data.get('avatar')
         self.bot = bot
         self.system = data.get('system', False)
         self.mfa_enabled = data.get('mfa_enabled', False)
-        self.locale = data.get('locale')
+        self.locale = intern_string(data.get('locale'))
         self.verified = data.get('verified', False)
         self.email = data.get('email')
         self.flags = data.get('flags', 0)
@@ -48,7 +49,7 @@ class Member:
         self.premium_since = datetime.fromisoformat(data.get('premium_since')) if data.get('premium_since') else None
         self.raw_status = data.get('raw_status')
         self.resolved_permissions = data.get('resolved_permissions')
-        self.roles = data.get('roles', [])
+        self.roles = intern_strings(data.get('roles', []))
         self.status = data.get('status')
         self.system = data.get('system', False)
         self.timed_out_until = datetime.fromisoformat(data.get('timed_out_until')) if data.get('timed_out_until') else None
@@ -59,7 +60,7 @@ class Member:
     @classmethod
     async def from_user_id(cls, bot, user_id, guild_id=None):
         cache_key = f"member_{user_id}"
-        data = bot.get_cache_data(cache_key)
+        data = await bot.get_cache_data_async(cache_key)
 
         if data:
             return cls(data, bot, guild_id)
@@ -73,7 +74,7 @@ class Member:
             async with session.get(url, headers=headers) as response:
                 if response.status == 200:
                     data = await response.json()
-                    bot.set_cache_data(cache_key, data, seconds=200)
+                    await bot.set_cache_data_async(cache_key, data, seconds=200)
                     return cls(data, bot, guild_id)
                 else:
                     raise Exception(f"Failed to fetch user data: {response.status}")
@@ -264,22 +265,10 @@ class Member:
     async def send(self, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
         if not self.dm_channel:
             await self.create_dm()
-        url = f"https://discord.com/api/v10/channels/{self.dm_channel['id']}/messages"
-        headers = {
-            "Authorization": f"Bot {self.bot.token}",
-            "Content-Type": "application/json"
-        }
-        json_data = {
-            "content": content,
-            "embed": embed,
-            "embeds": embeds,
-            "components": components,
-            "flags": 64 if ephemeral else 0
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=json_data) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to send message: {response.status}")
+        message = await self.bot.message_handler.send_message(self.dm_channel['id'], content, embed, embeds, files, components, ephemeral)
+        if message is None:
+            raise Exception(f"Failed to send message to member {self.id}")
+        return message
 
     async def timeout(self, duration, reason=None):
         url = f"https://discord.com/api/v10/guilds/{self.guild_id}/members/{self.id}"
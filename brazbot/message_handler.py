@@ -1,219 +1,190 @@
+"""
+SEE:    1. https://discord.com/developers/docs/interactions/receiving-and-responding#interaction-response-object
+        2. https://discord.com/developers/docs/topics/rate-limits#global-rate-limit
+        3. https://discord.com/developers/docs/resources/webhook#edit-webhook-message
+        4. https://discord.com/developers/docs/reference#uploading-files
+
+Every message send path (channels, threads, DMs, interaction responses and
+follow-ups) builds its body with MessagePayload and goes through
+MessageHandler.request: JSON when there are no files, multipart otherwise,
+over one shared HTTP session.
+"""
+
+import os
 import aiohttp
 import logging
 import asyncio
 import json
 from aiohttp import FormData
 
-"""
-SEE:    1. https://discord.com/developers/docs/interactions/receiving-and-responding#interaction-response-object
-        2. https://discord.com/developers/docs/topics/rate-limits#global-rate-limit
-        3. https://discord.com/developers/docs/resources/webhook#edit-webhook-message
-"""
+EPHEMERAL = 64
+MAX_RATE_LIMIT_RETRIES = 3
 
-class MessageHandler:
-    def __init__(self, token):
-        self.token = token
-        self.base_url = "https://discord.com/api/v10"
-        self.headers = {
-            "Authorization": f"Bot {self.token}"
-        }
 
-    async def send_message(self, channel_id, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
-        url = f"{self.base_url}/channels/{channel_id}/messages"
-        data = {}
-        if content:
-            data["content"] = str(content)
-        if embed:
-            data["embeds"] = [embed]
+def _compact_dumps(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+class MessagePayload:
+    def __init__(self, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False, **fields):
+        """
+        Args:
+            content (str, optional): Message text.
+            embed (dict, optional): A single embed; embeds wins when both are given.
+            embeds (list, optional): Embeds.
+            files (list, optional): Attachments, each a path, a brazbot File, or a
+                dict with data, filename and optional content_type.
+            components (list, optional): Message components.
+            ephemeral (bool): Only visible to the invoking user (interactions).
+            **fields: Any other message field (tts, allowed_mentions, ...).
+        """
+        data = {key: value for key, value in fields.items() if value is not None}
+        if content is not None and content != "":
+            data["content"] = str(content)  # Discord rejects an empty content field
         if embeds:
             data["embeds"] = embeds
+        elif embed:
+            data["embeds"] = [embed]
         if components:
             data["components"] = components
         if ephemeral:
-            data["flags"] = 64  # This flag makes the response ephemeral
+            data["flags"] = data.get("flags", 0) | EPHEMERAL
+        self.files = [self._file_part(file) for file in files or ()]
+        if self.files:
+            data["attachments"] = [{"id": index, "filename": part[0]} for index, part in enumerate(self.files)]
+        self.data = data
+        self._opened = []
 
-        async with aiohttp.ClientSession() as session:
-            if files:
-                form = FormData()
-                form.add_field('payload_json', json.dumps(data))
-                for file in files:
-                    form.add_field('file', file['data'], filename=file['filename'], content_type=file['content_type'])
-                async with session.post(url, headers=self.headers, data=form) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to send message with file: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message sent with file: {response_json}")
-                        return response_json
-            else:
-                async with session.post(url, headers=self.headers, json=data) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to send message: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message sent: {response_json}")
-                        return response_json
+    @staticmethod
+    def _file_part(file):
+        # (filename, path or data, content type)
+        if isinstance(file, dict):
+            return file['filename'], file['data'], file.get('content_type')
+        path = getattr(file, "file_path", file)
+        return os.path.basename(path), os.fspath(path), None
 
-    async def edit_message(self, channel_id, message_id, content=None, embed=None, embeds=None, files=None, components=None):
-        url = f"{self.base_url}/channels/{channel_id}/messages/{message_id}"
-        data = {}
-        if content:
-            data["content"] = content
-        if embed:
-            data["embeds"] = [embed]
-        if embeds:
-            data["embeds"] = embeds
-        if components:
-            data["components"] = components
+    def body(self, callback_type=None):
+        """
+        Request body and extra headers; interaction callbacks wrap the
+        message as {"type": callback_type, "data": message}.
 
-        async with aiohttp.ClientSession() as session:
-            if files:
-                form = FormData()
-                form.add_field('payload_json', json.dumps(data))
-                for file in files:
-                    form.add_field('file', file['data'], filename=file['filename'], content_type=file['content_type'])
-                async with session.patch(url, headers=self.headers, data=form) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to edit message with file: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message edited with file: {response_json}")
-                        return response_json
-            else:
-                async with session.patch(url, headers=self.headers, json=data) as response:
-                    if response.status != 200:
-                        logging.error(f"Failed to edit message: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Message edited: {response_json}")
-                        return response_json
+        Returns:
+            tuple: (bytes or aiohttp.FormData, dict of headers)
+        """
+        data = self.data if callback_type is None else {"type": callback_type, "data": self.data}
+        if not self.files:
+            return _compact_dumps(data).encode(), {"Content-Type": "application/json"}
+        form = FormData()
+        form.add_field('payload_json', _compact_dumps(data), content_type="application/json")
+        for index, (filename, source, content_type) in enumerate(self.files):
+            if isinstance(source, str):
+                # Streamed from disk by aiohttp rather than read into memory
+                source = open(source, 'rb')
+                self._opened.append(source)
+            form.add_field(f'files[{index}]', source, filename=filename, content_type=content_type)
+        return form, {}
 
-    async def send_interaction(self, interaction, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
-        url = f"{self.base_url}/interactions/{interaction['id']}/{interaction['token']}/callback"
-        data = {
-            "type": 4,
-            "data": {}
+    def close(self):
+        for file in self._opened:
+            file.close()
+        self._opened = []
+
+
+class MessageHandler:
+    def __init__(self, token):
+        self.token = token
+        self.base_url = "https://discord.com/api/v10"
+        self.headers = {
+            "Authorization": f"Bot {self.token}"
         }
-        if content:
-            data["data"]["content"] = str(content)  # Ensure content is a string
-        if embed:
-            data["data"]["embeds"] = [embed]
-        if embeds:
-            data["data"]["embeds"] = embeds
-        if files:
-            data["data"]["attachments"] = files
-        if components:
-            data["data"]["components"] = components
-        if ephemeral:
-            data["data"]["flags"] = 64  # This flag makes the response ephemeral
+        self._session = None
 
-        logging.debug(f"send_interaction payload: {json.dumps(data, indent=2)}")
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
 
-        async with aiohttp.ClientSession() as session:
-            if files:
-                form = FormData()
-                form.add_field('payload_json', json.dumps(data))
-                for file in files:
-                    form.add_field('file', file['data'], filename=file['filename'], content_type=file['content_type'])
-                async with session.post(url, headers={"Authorization": self.headers["Authorization"]}, data=form) as response:
-                    if response.status == 429:  # Rate limit
-                        retry_after = int(response.headers.get("Retry-After", 1))
-                        logging.error(f"Rate limited. Retrying after {retry_after} seconds.")
-                        await asyncio.sleep(retry_after)
-                        return await self.send_interaction(interaction, content, embed, embeds, files, components, ephemeral)
-                    elif response.status != 200:
-                        logging.error(f"Failed to send interaction: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Interaction sent: {response_json}")
-                        return response_json
-            else:
-                async with session.post(url, headers=self.headers, json=data) as response:
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def request(self, method, url, payload, action="send message", callback_type=None):
+        """
+        The single transport for message payloads, with rate limit retries.
+
+        Returns:
+            dict: The response JSON ({} for 204 No Content), or None on failure.
+        """
+        session = await self._get_session()
+        try:
+            for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+                # A multipart body can only be read once, so it is rebuilt per attempt
+                body, headers = payload.body(callback_type)
+                async with session.request(method, url, headers={**self.headers, **headers}, data=body) as response:
                     if response.status == 429:  # Rate limit
-                        retry_after = int(response.headers.get("Retry-After", 1))
+                        retry_after = float(response.headers.get("Retry-After", 1))
                         logging.error(f"Rate limited. Retrying after {retry_after} seconds.")
+                        payload.close()
                         await asyncio.sleep(retry_after)
-                        return await self.send_interaction(interaction, content, embed, embeds, files, components, ephemeral)
-                    elif response.status != 200:
-                        logging.error(f"Failed to send interaction: {response.status} - {await response.text()}")
+                        continue
+                    if response.status == 204:
+                        logging.info(f"Request to {action} succeeded")
+                        return {}
+                    if response.status != 200:
+                        logging.error(f"Failed to {action}: {response.status} - {await response.text()}")
                         return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Interaction sent: {response_json}")
-                        return response_json
+                    response_json = await response.json()
+                    logging.info(f"Request to {action} succeeded: {response_json}")
+                    return response_json
+            logging.error(f"Failed to {action}: still rate limited")
+            return None
+        finally:
+            payload.close()
 
-    async def send_followup_message(self, application_id, interaction_token, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
-        url = f"{self.base_url}/webhooks/{application_id}/{interaction_token}"
-        data = {
-            "content": str(content) if content else "",
-            "embeds": [embed] if embed else embeds,
-            "components": components,
-            "attachments": files,
-            "flags": 64 if ephemeral else 0
-        }
+    async def send_message(self, channel_id, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
+        url = f"{self.base_url}/channels/{channel_id}/messages"
+        payload = MessagePayload(content, embed, embeds, files, components, ephemeral)
+        return await self.request("POST", url, payload)
 
-        logging.debug(f"send_followup_message payload: {json.dumps(data, indent=2)}")
+    async def edit_message(self, channel_id, message_id, content=None, embed=None, embeds=None, files=None, components=None):
+        url = f"{self.base_url}/channels/{channel_id}/messages/{message_id}"
+        payload = MessagePayload(content, embed, embeds, files, components)
+        return await self.request("PATCH", url, payload, "edit message")
 
-        async with aiohttp.ClientSession() as session:
-            if files:
-                form = FormData()
-                form.add_field('payload_json', json.dumps(data))
-                for file in files:
-                    form.add_field('file', file['data'], filename=file['filename'], content_type=file['content_type'])
-                async with session.post(url, headers={"Authorization": self.headers["Authorization"]}, data=form) as response:
-                    if response.status == 429:  # Rate limit
-                        retry_after = int(response.headers.get("Retry-After", 1))
-                        logging.error(f"Rate limited. Retrying after {retry_after} seconds.")
-                        await asyncio.sleep(retry_after)
-                        return await self.send_followup_message(application_id, interaction_token, content, embed, embeds, files, components, ephemeral)
-                    elif response.status != 200:
-                        logging.error(f"Failed to send follow-up message: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Follow-up message sent: {response_json}")
-                        return response_json
-            else:
-                async with session.post(url, headers=self.headers, json=data) as response:
-                    if response.status == 429:  # Rate limit
-                        retry_after = int(response.headers.get("Retry-After", 1))
-                        logging.error(f"Rate limited. Retrying after {retry_after} seconds.")
-                        await asyncio.sleep(retry_after)
-                        return await self.send_followup_message(application_id, interaction_token, content, embed, embeds, files, components, ephemeral)
-                    elif response.status != 200:
-                        logging.error(f"Failed to send follow-up message: {response.status} - {await response.text()}")
-                        return None
-                    else:
-                        response_json = await response.json()
-                        logging.info(f"Follow-up message sent: {response_json}")
-                        return response_json
+    async def send_interaction(self, interaction, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
+        deferred = interaction.get('_deferred')
+        if deferred is not None:
+            # Already deferred (manually or by the auto-defer watchdog): reply as a follow-up
+            await deferred
+            return await self.send_followup_message(interaction['application_id'], interaction['token'], content, embed, embeds, files, components, ephemeral)
+        interaction['_responded'] = True
+
+        url = f"{self.base_url}/interactions/{interaction['id']}/{interaction['token']}/callback"
+        payload = MessagePayload(content, embed, embeds, files, components, ephemeral)
+        logging.debug(f"send_interaction payload: {payload.data}")
+        return await self.request("POST", url, payload, "send interaction", callback_type=4)
+
+    async def send_followup_message(self, application_id, interaction_token, content=None, embed=None, embeds=None, files=None, components=None, ephemeral=False):
+        url = f"{self.base_url}/webhooks/{application_id}/{interaction_token}"
+        payload = MessagePayload(content, embed, embeds, files, components, ephemeral)
+        logging.debug(f"send_followup_message payload: {payload.data}")
+        return await self.request("POST", url, payload, "send follow-up message")
 
 
     #https://discord.com/developers/docs/interactions/message-components#text-inputs
     async def send_modal(self, interaction, title, custom_id, data):
+        """
+        Args:
+            data (dict): The modal ({"title", "custom_id", "components"}), or
+                a whole type 9 callback as built by Form.to_component.
+        """
+        interaction['_responded'] = True
         url = f"{self.base_url}/interactions/{interaction['id']}/{interaction['token']}/callback"
-
-        logging.debug(f"send_modal payload: {json.dumps(data, indent=2)}")
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=self.headers, json=data) as response:
-                if response.status == 429:  # Rate limit
-                    retry_after = int(response.headers.get("Retry-After", 1))
-                    logging.error(f"Rate limited. Retrying after {retry_after} seconds.")
-                    #await asyncio.sleep(retry_after)
-                    return await self.send_modal(interaction, title, custom_id, components)
-                elif response.status != 200:
-                    logging.error(f"Failed to send modal: {response.status} - {await response.text()}")
-                    return None
-                else:
-                    response_json = await response.json()
-                    logging.info(f"Modal sent: {response_json}")
-                    return response_json
+        modal = data['data'] if data.get('type') == 9 else data
+        payload = MessagePayload(**{"title": title, "custom_id": custom_id, **modal})
+        logging.debug(f"send_modal payload: {payload.data}")
+        return await self.request("POST", url, payload, "send modal", callback_type=9)
 
     async def delete_message(self, channel_id, message_id):
         url = f"{self.base_url}/channels/{channel_id}/messages/{message_id}"
@@ -0,0 +1,288 @@
+"""
+Ogg/Opus demuxing.
+
+ffmpeg (or an .opus/.ogg file) gives us Opus packets inside Ogg pages. The
+voice sender needs the bare packets, one per 20 ms frame. Pages are read
+whole and packets handed out as memoryview slices of the page body, so the
+only copy is the one made by the cipher. Packets continued across pages (rare
+for voice-sized frames) are joined.
+
+Also a small ctypes binding to libopus (optional, loaded on first use) for
+the few places that must touch audio samples: volume and receive decoding.
+
+SEE: https://www.rfc-editor.org/rfc/rfc3533 (Ogg) and rfc7845 (Ogg Opus)
+"""
+
+import math
+import asyncio
+import ctypes
+import ctypes.util
+from struct import unpack_from
+
+OGG_CAPTURE = b"OggS"
+OGG_HEADER_SIZE = 27
+OPUS_HEAD = b"OpusHead"
+OPUS_TAGS = b"OpusTags"
+SILENCE_FRAME = b"\xF8\xFF\xFE"
+SAMPLE_RATE = 48000
+
+# Samples (at 48 kHz) per frame for each TOC config, RFC 6716 section 3.1
+_SILK_SIZES = (480, 960, 1920, 2880)
+_CELT_SIZES = (120, 240, 480, 960)
+
+
+def packet_samples(packet):
+    """
+    Duration of an Opus packet in 48 kHz samples, read from its TOC byte.
+    """
+    if not len(packet):
+        return 0
+    toc = packet[0]
+    config = toc >> 3
+    if config < 12:
+        frame = _SILK_SIZES[config & 3]
+    elif config < 16:
+        frame = 480 if config & 1 == 0 else 960
+    else:
+        frame = _CELT_SIZES[config & 3]
+    code = toc & 3
+    if code == 0:
+        count = 1
+    elif code < 3:
+        count = 2
+    else:
+        count = packet[1] & 0x3F if len(packet) > 1 else 1
+    return frame * count
+
+
+class OggError(Exception):
+    pass
+
+
+class OggPage:
+    __slots__ = ("flags", "granule", "serial", "sequence", "lacing", "body")
+
+    def __init__(self, header, lacing, body):
+        self.flags = header[5]
+        self.granule, self.serial, self.sequence = unpack_from('<qII', header, 6)
+        self.lacing = lacing
+        self.body = body
+
+    @property
+    def continued(self):
+        return bool(self.flags & 0x01)
+
+    def segments(self):
+        """
+        Yields (memoryview, complete) for each packet piece of the page;
+        complete is False when the packet carries on into the next page.
+        """
+        view = memoryview(self.body)
+        start = offset = 0
+        for size in self.lacing:
+            offset += size
+            if size < 255:
+                yield view[start:offset], True
+                start = offset
+        if start < offset:
+            yield view[start:offset], False
+
+
+async def read_page(stream):
+    """
+    Reads one Ogg page from anything with an async readexactly (asyncio.StreamReader).
+
+    Returns:
+        OggPage, or None at end of stream.
+    """
+    try:
+        header = await stream.readexactly(OGG_HEADER_SIZE)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise OggError("Truncated Ogg page header")
+        return None
+    if header[:4] != OGG_CAPTURE:
+        raise OggError(f"Lost Ogg page sync: {bytes(header[:4])!r}")
+    lacing = await stream.readexactly(header[26])
+    body = await stream.readexactly(sum(lacing))
+    return OggPage(header, lacing, body)
+
+
+async def ogg_packets(stream, skip_headers=True):
+    """
+    Async iterator over the Opus packets of an Ogg stream.
+
+    Args:
+        stream: Object with an async readexactly(n) method.
+        skip_headers (bool): Drop the OpusHead and OpusTags packets.
+    """
+    partial = None
+    while True:
+        page = await read_page(stream)
+        if page is None:
+            return
+        for piece, complete in page.segments():
+            if partial is not None:
+                partial += piece
+                if not complete:
+                    continue
+                piece, partial = memoryview(bytes(partial)), None
+            elif not complete:
+                partial = bytearray(piece)
+                continue
+            if skip_headers and (piece[:8] == OPUS_HEAD or piece[:8] == OPUS_TAGS):
+                continue
+            if len(piece):
+                yield piece
+
+
+class BytesStream:
+    """
+    readexactly() over an in-memory buffer, for demuxing files already loaded.
+    """
+    def __init__(self, data):
+        self.view = memoryview(data)
+        self.offset = 0
+
+    async def readexactly(self, n):
+        chunk = self.view[self.offset:self.offset + n]
+        self.offset += len(chunk)
+        if len(chunk) < n:
+            raise asyncio.IncompleteReadError(bytes(chunk), n)
+        return chunk
+
+
+# libopus constants (opus_defines.h)
+OPUS_OK = 0
+OPUS_APPLICATION_AUDIO = 2049
+OPUS_SET_BITRATE_REQUEST = 4002
+OPUS_SET_GAIN_REQUEST = 4034
+CHANNELS = 2
+MAX_FRAME_SAMPLES = 5760  # 120 ms at 48 kHz, the longest Opus packet
+MAX_PACKET_SIZE = 4000
+
+_libopus = None
+
+
+class OpusError(Exception):
+    pass
+
+
+def load_libopus(name=None):
+    """
+    Loads libopus once. `name` may be a path; by default the system library is used.
+    """
+    global _libopus
+    if _libopus is not None:
+        return _libopus
+    name = name or ctypes.util.find_library("opus")
+    if not name:
+        raise OpusError("libopus not found; install it (e.g. apt install libopus0) or pass its path")
+    lib = ctypes.CDLL(name)
+    c_int_p = ctypes.POINTER(ctypes.c_int)
+    lib.opus_encoder_create.argtypes = [ctypes.c_int32, ctypes.c_int, ctypes.c_int, c_int_p]
+    lib.opus_encoder_create.restype = ctypes.c_void_p
+    lib.opus_encode.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int32]
+    lib.opus_encode.restype = ctypes.c_int32
+    lib.opus_encoder_destroy.argtypes = [ctypes.c_void_p]
+    lib.opus_decoder_create.argtypes = [ctypes.c_int32, ctypes.c_int, c_int_p]
+    lib.opus_decoder_create.restype = ctypes.c_void_p
+    lib.opus_decode.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int32, ctypes.c_void_p, ctypes.c_int, ctypes.c_int]
+    lib.opus_decode.restype = ctypes.c_int
+    lib.opus_decoder_destroy.argtypes = [ctypes.c_void_p]
+    lib.opus_strerror.argtypes = [ctypes.c_int]
+    lib.opus_strerror.restype = ctypes.c_char_p
+    _libopus = lib
+    return lib
+
+
+def _check(lib, code):
+    if code < 0:
+        raise OpusError(lib.opus_strerror(code).decode())
+    return code
+
+
+class OpusDecoder:
+    def __init__(self, lib=None):
+        self.lib = lib or load_libopus()
+        error = ctypes.c_int()
+        self.state = self.lib.opus_decoder_create(SAMPLE_RATE, CHANNELS, ctypes.byref(error))
+        _check(self.lib, error.value)
+        self.pcm = (ctypes.c_int16 * (MAX_FRAME_SAMPLES * CHANNELS))()
+        self.frame_samples = 960  # Of the last packet; the length concealment fills in
+
+    def set_gain(self, gain_q8):
+        # Output gain in 1/256 dB, applied inside the decoder
+        _check(self.lib, self.lib.opus_decoder_ctl(ctypes.c_void_p(self.state), OPUS_SET_GAIN_REQUEST, ctypes.c_int(gain_q8)))
+
+    def decode_into(self, packet):
+        """
+        Decodes into the reusable PCM buffer (None = packet loss concealment,
+        one frame as long as the last packet).
+
+        Returns:
+            int: Samples per channel written to self.pcm.
+        """
+        if packet is None:
+            # libopus conceals as much as frame_size asks for
+            return _check(self.lib, self.lib.opus_decode(self.state, None, 0, self.pcm, self.frame_samples, 0))
+        data = bytes(packet)
+        self.frame_samples = packet_samples(data) or self.frame_samples
+        return _check(self.lib, self.lib.opus_decode(
+            self.state, data, len(data), self.pcm, MAX_FRAME_SAMPLES, 0
+        ))
+
+    def decode(self, packet):
+        """
+        Returns:
+            bytes: Interleaved s16le stereo PCM.
+        """
+        samples = self.decode_into(packet)
+        return ctypes.string_at(self.pcm, samples * CHANNELS * 2)
+
+    def __del__(self):
+        if getattr(self, "state", None):
+            self.lib.opus_decoder_destroy(self.state)
+            self.state = None
+
+
+class OpusEncoder:
+    def __init__(self, bitrate=64000, lib=None):
+        self.lib = lib or load_libopus()
+        error = ctypes.c_int()
+        self.state = self.lib.opus_encoder_create(SAMPLE_RATE, CHANNELS, OPUS_APPLICATION_AUDIO, ctypes.byref(error))
+        _check(self.lib, error.value)
+        _check(self.lib, self.lib.opus_encoder_ctl(ctypes.c_void_p(self.state), OPUS_SET_BITRATE_REQUEST, ctypes.c_int(bitrate)))
+        self.out = (ctypes.c_ubyte * MAX_PACKET_SIZE)()
+
+    def encode(self, pcm, samples):
+        size = _check(self.lib, self.lib.opus_encode(self.state, pcm, samples, self.out, MAX_PACKET_SIZE))
+        return ctypes.string_at(self.out, size)
+
+    def __del__(self):
+        if getattr(self, "state", None):
+            self.lib.opus_encoder_destroy(self.state)
+            self.state = None
+
+
+class GainAdjuster:
+    """
+    Re-encodes Opus packets at another volume: decode with libopus' own
+    output gain, then encode again. Only used while the volume is not 1.0.
+    """
+    def __init__(self, volume, bitrate=64000):
+        self.decoder = OpusDecoder()
+        self.encoder = OpusEncoder(bitrate, self.decoder.lib)
+        self.volume = None
+        self.set_volume(volume)
+
+    def set_volume(self, volume):
+        if volume == self.volume:
+            return
+        self.volume = volume
+        gain = -32768 if volume <= 0 else round(20 * math.log10(volume) * 256)
+        self.decoder.set_gain(max(-32768, min(32767, gain)))
+
+    def process(self, packet):
+        samples = self.decoder.decode_into(packet)
+        return self.encoder.encode(self.decoder.pcm, samples)
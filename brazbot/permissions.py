@@ -0,0 +1,260 @@
+"""
+Local permission engine.
+
+Computes guild (base) and channel permissions the way Discord does, as integer
+bitsets, from cached roles, permission overwrites and the owner id. Results are
+memoized per (role set, channel) and invalidated by the gateway events that
+change roles, overwrites or the owner, so a check is a dict lookup instead of
+an HTTP call.
+
+SEE: https://discord.com/developers/docs/topics/permissions#permission-overwrites
+"""
+
+import logging
+import aiohttp
+
+CREATE_INSTANT_INVITE = 1 << 0
+KICK_MEMBERS = 1 << 1
+BAN_MEMBERS = 1 << 2
+ADMINISTRATOR = 1 << 3
+MANAGE_CHANNELS = 1 << 4
+MANAGE_GUILD = 1 << 5
+ADD_REACTIONS = 1 << 6
+VIEW_AUDIT_LOG = 1 << 7
+VIEW_CHANNEL = 1 << 10
+SEND_MESSAGES = 1 << 11
+MANAGE_MESSAGES = 1 << 13
+ATTACH_FILES = 1 << 15
+READ_MESSAGE_HISTORY = 1 << 16
+MENTION_EVERYONE = 1 << 17
+CONNECT = 1 << 20
+SPEAK = 1 << 21
+MUTE_MEMBERS = 1 << 22
+MOVE_MEMBERS = 1 << 24
+MANAGE_ROLES = 1 << 28
+MANAGE_WEBHOOKS = 1 << 29
+MODERATE_MEMBERS = 1 << 40
+ALL = (1 << 53) - 1
+
+OVERWRITE_ROLE = 0
+OVERWRITE_MEMBER = 1
+
+
+class GuildPermissionState:
+    def __init__(self, guild_id, owner_id=None):
+        self.guild_id = guild_id
+        self.owner_id = owner_id
+        self.roles = {}        # role id -> (name, permissions int)
+        self.channels = {}     # channel id -> {target id: (type, allow, deny)}
+        self.base_memo = {}    # frozenset(role ids) -> int
+        self.channel_memo = {} # (channel id, frozenset(role ids), member id | None) -> int
+        self.member_overwrites = {}  # channel id -> set of member ids with an overwrite
+
+    def set_roles(self, roles):
+        self.roles = {role['id']: (role.get('name'), int(role.get('permissions') or 0)) for role in roles}
+        self.base_memo.clear()
+        self.channel_memo.clear()
+
+    def set_role(self, role):
+        self.roles[role['id']] = (role.get('name'), int(role.get('permissions') or 0))
+        self.base_memo.clear()
+        self.channel_memo.clear()
+
+    def remove_role(self, role_id):
+        self.roles.pop(role_id, None)
+        self.base_memo.clear()
+        self.channel_memo.clear()
+
+    def set_channel(self, channel):
+        channel_id = channel['id']
+        overwrites = {}
+        members = set()
+        for overwrite in channel.get('permission_overwrites') or []:
+            kind = int(overwrite.get('type', OVERWRITE_ROLE))
+            overwrites[overwrite['id']] = (kind, int(overwrite.get('allow') or 0), int(overwrite.get('deny') or 0))
+            if kind == OVERWRITE_MEMBER:
+                members.add(overwrite['id'])
+        self.channels[channel_id] = overwrites
+        self.member_overwrites[channel_id] = members
+        self._forget_channel(channel_id)
+
+    def remove_channel(self, channel_id):
+        self.channels.pop(channel_id, None)
+        self.member_overwrites.pop(channel_id, None)
+        self._forget_channel(channel_id)
+
+    def _forget_channel(self, channel_id):
+        for key in [key for key in self.channel_memo if key[0] == channel_id]:
+            del self.channel_memo[key]
+
+    def base_permissions(self, member_id, role_ids):
+        if member_id is not None and member_id == self.owner_id:
+            return ALL
+        role_set = frozenset(role_ids)
+        permissions = self.base_memo.get(role_set)
+        if permissions is not None:
+            return permissions
+
+        everyone = self.roles.get(self.guild_id)
+        permissions = everyone[1] if everyone else 0
+        for role_id in role_set:
+            role = self.roles.get(role_id)
+            if role is not None:
+                permissions |= role[1]
+        if permissions & ADMINISTRATOR:
+            permissions = ALL
+        self.base_memo[role_set] = permissions
+        return permissions
+
+    def channel_permissions(self, member_id, role_ids, channel_id):
+        """
+        Raises:
+            KeyError: when the channel's overwrites are not loaded; base
+                permissions would ignore their denies. Administrators
+                (and the owner) get every permission anyway.
+        """
+        base = self.base_permissions(member_id, role_ids)
+        if base & ADMINISTRATOR:
+            return base
+        if channel_id not in self.channels:
+            raise KeyError(f"Overwrites of channel {channel_id} are not loaded")
+
+        role_set = frozenset(role_ids)
+        # Member-specific overwrites only matter for members that have one
+        key_member = member_id if member_id in self.member_overwrites.get(channel_id, ()) else None
+        key = (channel_id, role_set, key_member)
+        permissions = self.channel_memo.get(key)
+        if permissions is not None:
+            return permissions
+
+        overwrites = self.channels[channel_id]
+        permissions = base
+        everyone = overwrites.get(self.guild_id)
+        if everyone is not None:
+            permissions &= ~everyone[2]
+            permissions |= everyone[1]
+
+        allow = deny = 0
+        for role_id in role_set:
+            overwrite = overwrites.get(role_id)
+            if overwrite is not None and overwrite[0] == OVERWRITE_ROLE:
+                allow |= overwrite[1]
+                deny |= overwrite[2]
+        permissions &= ~deny
+        permissions |= allow
+
+        if key_member is not None:
+            overwrite = overwrites[key_member]
+            permissions &= ~overwrite[2]
+            permissions |= overwrite[1]
+
+        self.channel_memo[key] = permissions
+        return permissions
+
+    def role_named(self, name):
+        return {role_id for role_id, role in self.roles.items() if role[0] == name}
+
+
+class PermissionResolver:
+    def __init__(self):
+        self.guilds = {}
+
+    def guild(self, guild_id):
+        state = self.guilds.get(guild_id)
+        if state is None:
+            state = self.guilds[guild_id] = GuildPermissionState(guild_id)
+        return state
+
+    def load_guild(self, data):
+        state = self.guild(data['id'])
+        state.owner_id = data.get('owner_id', state.owner_id)
+        if 'roles' in data:
+            state.set_roles(data['roles'])
+        for channel in data.get('channels') or []:
+            state.set_channel(channel)
+        return state
+
+    def handle_event(self, event_type, data):
+        """
+        Keeps the state current from gateway dispatches. Unrelated events are ignored.
+        """
+        if event_type in ('GUILD_CREATE', 'GUILD_UPDATE'):
+            self.load_guild(data)
+        elif event_type == 'GUILD_DELETE':
+            self.guilds.pop(data.get('id'), None)
+        elif event_type in ('GUILD_ROLE_CREATE', 'GUILD_ROLE_UPDATE'):
+            self.guild(data['guild_id']).set_role(data['role'])
+        elif event_type == 'GUILD_ROLE_DELETE':
+            self.guild(data['guild_id']).remove_role(data['role_id'])
+        elif event_type in ('CHANNEL_CREATE', 'CHANNEL_UPDATE') and data.get('guild_id'):
+            self.guild(data['guild_id']).set_channel(data)
+        elif event_type == 'CHANNEL_DELETE' and data.get('guild_id'):
+            self.guild(data['guild_id']).remove_channel(data['id'])
+
+    async def ensure_guild(self, bot, guild_id, channels=False):
+        """
+        Loads a guild's roles (and channels if asked) over REST, through the
+        bot cache, when no gateway data has been seen for it yet.
+        """
+        state = self.guilds.get(guild_id)
+        if state is not None and state.roles and (not channels or state.channels):
+            return state
+
+        guild = await bot.get_cache_data_async(f"guild_info_{guild_id}")
+        async with aiohttp.ClientSession() as session:
+            if not guild:
+                async with session.get(f"https://discord.com/api/v10/guilds/{guild_id}", headers=bot.headers) as response:
+                    if response.status != 200:
+                        raise Exception(f"Failed to fetch guild {guild_id}: {response.status}")
+                    guild = await response.json()
+                await bot.set_cache_data_async(f"guild_info_{guild_id}", guild, seconds=300)
+            state = self.load_guild(guild)
+
+            if channels and not state.channels:
+                async with session.get(f"https://discord.com/api/v10/guilds/{guild_id}/channels", headers=bot.headers) as response:
+                    if response.status != 200:
+                        raise Exception(f"Failed to fetch channels of guild {guild_id}: {response.status}")
+                    for channel in await response.json():
+                        state.set_channel(channel)
+        logging.debug(f"Loaded permission state for guild {guild_id}")
+        return state
+
+    async def ensure_channel(self, bot, state, channel_id):
+        """
+        Loads the overwrites of one channel the guild state does not know
+        yet, e.g. one created while the gateway was not watching.
+        """
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"https://discord.com/api/v10/channels/{channel_id}", headers=bot.headers) as response:
+                if response.status != 200:
+                    raise Exception(f"Failed to fetch channel {channel_id}: {response.status}")
+                channel = await response.json()
+        if channel.get('guild_id') != state.guild_id:
+            raise Exception(f"Channel {channel_id} is not in guild {state.guild_id}")
+        state.set_channel(channel)
+        logging.debug(f"Loaded overwrites of channel {channel_id}")
+
+    async def member_permissions(self, bot, guild_id, member_id, role_ids, channel_id=None):
+        state = await self.ensure_guild(bot, guild_id, channels=channel_id is not None)
+        if channel_id is None:
+            return state.base_permissions(member_id, role_ids)
+        if channel_id not in state.channels and not state.base_permissions(member_id, role_ids) & ADMINISTRATOR:
+            await self.ensure_channel(bot, state, channel_id)
+        return state.channel_permissions(member_id, role_ids, channel_id)
+
+    async def permissions_for(self, bot, guild_id, channel_id, member_or_role):
+        """
+        Channel permissions of a Member (or member payload) or of a Role alone.
+        """
+        if hasattr(member_or_role, 'roles') or isinstance(member_or_role, dict):
+            roles = member_or_role['roles'] if isinstance(member_or_role, dict) else member_or_role.roles
+            member_id = member_or_role.get('user', {}).get('id') if isinstance(member_or_role, dict) else member_or_role.id
+            role_ids = [role['id'] if isinstance(role, dict) else role for role in roles]
+        else:
+            member_id = None
+            role_ids = [member_or_role.id]
+        return await self.member_permissions(bot, guild_id, member_id, role_ids, channel_id)
+
+
+def has_permissions(permissions, required):
+    return permissions & ADMINISTRATOR == ADMINISTRATOR or permissions & required == required
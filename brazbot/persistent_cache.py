@@ -0,0 +1,126 @@
+"""
+Optional on-disk cache tier (SQLite) for warm restarts.
+
+DiscordBot writes selected cache entries (guild, role and channel payloads,
+the command sync state) here in batches and rehydrates its in-memory cache
+from it on boot, so a restart does not refetch everything over REST.
+"""
+
+import json
+import time
+import sqlite3
+import logging
+
+SCHEMA_VERSION = 1
+
+# Key prefix -> seconds an entry stays valid on disk
+DEFAULT_TTLS = {
+    "guild_": 3600,
+    "guild_info_": 3600,
+    "guild_roles_": 3600,
+    "role_": 3600,
+    "channel_": 3600,
+}
+
+
+class PersistentCache:
+    def __init__(self, path="brazbot_cache.sqlite3", version=1, ttls=None):
+        """
+        Args:
+            path (str): SQLite file.
+            version (int): Payload version; entries written with another one are dropped.
+            ttls (dict, optional): Key prefix -> TTL in seconds. Keys matching no prefix are not persisted.
+        """
+        self.path = path
+        self.version = version
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self._prefixes = sorted(self.ttls, key=len, reverse=True)
+        self.pending = {}
+        self.conn = sqlite3.connect(path)
+        self._setup()
+
+    def _setup(self):
+        schema = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if schema != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS entries")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL, version INTEGER NOT NULL)"
+        )
+        self.conn.execute("DELETE FROM entries WHERE version != ?", (self.version,))
+        self.conn.commit()
+
+    def ttl_for(self, key):
+        for prefix in self._prefixes:
+            if key.startswith(prefix):
+                return self.ttls[prefix]
+        return None
+
+    def wants(self, key):
+        return self.ttl_for(key) is not None
+
+    def set(self, key, data, ttl=None):
+        # Buffered; written by flush()
+        if ttl is None:
+            ttl = self.ttl_for(key)
+        expires = time.time() + ttl if ttl else None
+        self.pending[key] = (data, expires)
+
+    def delete(self, key):
+        self.pending[key] = None
+
+    def get(self, key):
+        if key in self.pending:
+            entry = self.pending[key]
+            return None if entry is None else entry[0]
+        row = self.conn.execute(
+            "SELECT data, expires FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def flush(self):
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, {}
+        upserts = []
+        deletes = []
+        for key, entry in pending.items():
+            if entry is None:
+                deletes.append((key,))
+            else:
+                upserts.append((key, json.dumps(entry[0], separators=(",", ":")), entry[1], self.version))
+        with self.conn:
+            if upserts:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, data, expires, version) VALUES (?, ?, ?, ?)", upserts
+                )
+            if deletes:
+                self.conn.executemany("DELETE FROM entries WHERE key = ?", deletes)
+        logging.debug(f"Persistent cache flushed: {len(upserts)} written, {len(deletes)} deleted")
+        return len(pending)
+
+    def purge_expired(self):
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)
+            )
+        return cursor.rowcount
+
+    def load(self):
+        """
+        Yields (key, data, expires) for every live entry, expires being an
+        epoch timestamp or None.
+        """
+        rows = self.conn.execute(
+            "SELECT key, data, expires FROM entries WHERE expires IS NULL OR expires > ?", (time.time(),)
+        )
+        for key, data, expires in rows:
+            yield key, json.loads(data), expires
+
+    def close(self):
+        self.flush()
+        self.conn.close()
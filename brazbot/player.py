@@ -0,0 +1,338 @@
+"""
+Queue-based player on top of VoiceClient.
+
+The player hands the voice client one continuous frame stream for the whole
+queue: when a track runs out the next one follows on the very next frame,
+with no speaking toggle or silence in between. While a track plays, the next
+one is already fetched and encoded into its own bounded buffer (the first
+`prefetch` seconds), so the transition does not wait on HTTP or ffmpeg.
+
+Frames of the current track are kept (bounded by `history`) so seeking
+backwards is instant and seeking forward reads ahead from the running
+source: ffmpeg is never restarted. Volume is applied on the Opus frames
+through libopus when it is not 1.0; that decode and re-encode runs in the
+default executor a few frames ahead of the sender (GAIN_LOOKAHEAD), never
+inside the send tick, so a volume change is heard after at most that much
+audio.
+
+    player = Player(voice_client)
+    await player.enqueue("https://example.com/song.mp3")
+    player.volume = 0.5
+    await player.seek(90)
+"""
+
+import asyncio
+import logging
+from collections import deque
+from brazbot.audio_sources import FrameBuffer
+from brazbot.opus import GainAdjuster, packet_samples, SAMPLE_RATE
+from brazbot.voice_transport import FRAME_DURATION
+
+GAIN_LOOKAHEAD = 10  # Frames re-encoded ahead of the sender (200 ms)
+GAIN_BATCH = 5       # Frames per executor call
+
+
+class Track:
+    def __init__(self, source, title=None):
+        self.source = source
+        self.title = title or getattr(source, "url", None) or getattr(source, "location", None)
+        self.buffer = None
+        self._producer_task = None
+
+    def start(self, capacity):
+        # Starts fetching/encoding into a bounded buffer; backpressure pauses it when full
+        if self.buffer is None:
+            self.buffer = FrameBuffer(capacity)
+            self._producer_task = asyncio.create_task(self.buffer.fill(self.source.frames()))
+        return self.buffer
+
+    async def close(self):
+        if self._producer_task is not None:
+            self._producer_task.cancel()
+            await asyncio.gather(self._producer_task, return_exceptions=True)
+            self._producer_task = None
+
+
+class PlayerStream:
+    """
+    The frame stream a Player gives to its VoiceClient; exposes the same
+    get/get_nowait/exhausted interface as FrameBuffer.
+    """
+    def __init__(self, player):
+        self.player = player
+        self.underruns = 0
+
+    def __len__(self):
+        track = self.player.current
+        buffered = len(track.buffer) if track is not None and track.buffer is not None else 0
+        return buffered + len(self.player._ready)
+
+    @property
+    def exhausted(self):
+        player = self.player
+        return player.current is None and not player._ready and player._gain_task is None
+
+    def get_nowait(self):
+        return self.player._next_frame()
+
+    async def get(self):
+        while True:
+            frame = self.player._next_frame()
+            if frame is not None or self.exhausted:
+                return frame
+            await self.player._wait_for_frames()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await self.get()
+        if frame is None:
+            raise StopAsyncIteration
+        return frame
+
+    async def aclose(self):
+        pass
+
+
+class Player:
+    def __init__(self, voice_client, prefetch=5.0, history=900.0):
+        """
+        Args:
+            voice_client (VoiceClient): Connected voice client.
+            prefetch (float): Seconds of the next track encoded ahead of time.
+            history (float): Seconds of the current track kept for seeking back.
+        """
+        self.voice_client = voice_client
+        self.queue = deque()
+        self.current = None
+        self.prefetch_frames = max(1, int(prefetch / FRAME_DURATION))
+        self.history_frames = max(1, int(history / FRAME_DURATION))
+        self.on_track_start = None  # Optional async callbacks taking the Track
+        self.on_track_end = None
+        self._history = []          # Frames of the current track
+        self._history_base = 0      # Track frame index of _history[0]
+        self._index = 0             # Track frame index of the next frame to send
+        self._frame_duration = FRAME_DURATION
+        self._volume = 1.0
+        self._gain = None
+        self._ready = deque()        # Frames already at the current volume, sent before anything else
+        self._ready_event = asyncio.Event()
+        self._gain_task = None
+        self._gain_generation = 0    # Bumped when _ready is dropped (seek, skip, stop)
+        self._seeking = False
+        self._stream = None
+
+    # Queue
+
+    async def enqueue(self, source, title=None, codec=None):
+        """
+        Adds a URL or source object to the queue and starts playing if idle.
+
+        Returns:
+            Track
+        """
+        track = Track(self.voice_client.create_source(source, codec), title)
+        self.queue.append(track)
+        if self.current is None:
+            self._advance()
+            self._start_stream()
+        elif len(self.queue) == 1:
+            track.start(self.prefetch_frames)
+        return track
+
+    async def skip(self):
+        """
+        Ends the current track; the next one starts on the following frame.
+        """
+        track = self.current
+        if track is not None:
+            await track.close()
+            track.buffer.frames.clear()
+            track.buffer.close()
+            self._drop_ready()
+            self._index = self._history_base + len(self._history)
+
+    async def stop(self):
+        tracks = list(self.queue)
+        self.queue.clear()
+        if self.current is not None:
+            tracks.append(self.current)
+        self.current = None
+        self._drop_ready()
+        if self._gain_task is not None:
+            self._gain_task.cancel()
+        for track in tracks:
+            await track.close()
+        await self.voice_client.stop()
+        self._stream = None
+
+    @property
+    def is_playing(self):
+        return self.current is not None
+
+    @property
+    def position(self):
+        """
+        Seconds into the current track.
+        """
+        return max(0, self._index - len(self._ready)) * self._frame_duration
+
+    # Volume and seek
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, value):
+        value = max(0.0, float(value))
+        if value == 1.0:
+            self._gain = None
+        elif self._gain is None:
+            self._gain = GainAdjuster(value, self.voice_client.bitrate)
+        # A running adjuster picks the new value up in its executor thread
+        self._volume = value
+
+    async def seek(self, seconds):
+        """
+        Moves playback of the current track to `seconds`, reading ahead from
+        the source when the point has not been reached yet.
+        """
+        track = self.current
+        if track is None:
+            return
+        target = max(0, int(seconds / self._frame_duration))
+        self._drop_ready()
+        self._seeking = True
+        try:
+            while self._history_base + len(self._history) < target:
+                frame = await track.buffer.get()
+                if frame is None:
+                    break  # Past the end: the track finishes
+                self._record(frame)
+            self._index = max(self._history_base, min(target, self._history_base + len(self._history)))
+        finally:
+            self._seeking = False
+
+    # Stream internals
+
+    def _start_stream(self):
+        self._stream = PlayerStream(self)
+        self.voice_client.start_sending(self._stream)
+
+    def _record(self, frame):
+        if len(self._history) == 0:
+            self._frame_duration = (packet_samples(frame) or 960) / SAMPLE_RATE
+        self._history.append(frame)
+        if len(self._history) > self.history_frames:
+            drop = len(self._history) - self.history_frames
+            del self._history[:drop]
+            self._history_base += drop
+
+    def _advance(self):
+        previous = self.current
+        self.current = self.queue.popleft() if self.queue else None
+        self._history = []
+        self._history_base = 0
+        self._index = 0
+        if previous is not None:
+            self._notify(self.on_track_end, previous)
+        if self.current is not None:
+            self.current.start(self.prefetch_frames)
+            if self.queue:
+                self.queue[0].start(self.prefetch_frames)
+            self._notify(self.on_track_start, self.current)
+            logging.debug(f"Player now playing: {self.current.title}")
+
+    def _notify(self, callback, track):
+        if callback is not None:
+            asyncio.ensure_future(callback(track))
+
+    def _next_frame(self):
+        if self._seeking:
+            return None
+        if self._ready:
+            frame = self._ready.popleft()
+            if self._gain is not None:
+                self._fill_gain()
+            return frame
+        if self._gain is None:
+            return self._next_raw_frame()
+        self._fill_gain()
+        if self.current is not None:
+            self._stream.underruns += 1
+        return None
+
+    def _next_raw_frame(self):
+        while self.current is not None:
+            if self._index < self._history_base + len(self._history):
+                frame = self._history[self._index - self._history_base]  # Replaying after a seek back
+            else:
+                frame = self.current.buffer.get_nowait()
+                if frame is None:
+                    if not self.current.buffer.exhausted:
+                        self._stream.underruns += 1
+                        return None
+                    self._advance()  # Gapless: the next track's first frame goes out this tick
+                    continue
+                self._record(frame)
+            self._index += 1
+            return frame
+        return None
+
+    # Volume stage
+
+    def _drop_ready(self):
+        # Callers reposition _index themselves (seek, skip) or end playback
+        self._ready.clear()
+        self._gain_generation += 1
+
+    def _fill_gain(self):
+        if self._gain_task is None and self.current is not None and len(self._ready) < GAIN_LOOKAHEAD:
+            self._gain_task = asyncio.ensure_future(self._gain_loop())
+
+    @staticmethod
+    def _apply_gain(gain, volume, frames):
+        # Runs in the executor; one batch at a time, so the adjuster is never shared
+        gain.set_volume(volume)
+        return [gain.process(frame) for frame in frames]
+
+    async def _gain_loop(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._gain is not None and len(self._ready) < GAIN_LOOKAHEAD:
+                if self._seeking:
+                    await asyncio.sleep(self._frame_duration)
+                    continue
+                batch = []
+                while len(batch) < GAIN_BATCH and len(self._ready) + len(batch) < GAIN_LOOKAHEAD:
+                    frame = self._next_raw_frame()
+                    if frame is None:
+                        break
+                    batch.append(frame)
+                if not batch:
+                    if self.current is None:
+                        break
+                    await self.current.buffer.ready()
+                    continue
+                generation = self._gain_generation
+                processed = await loop.run_in_executor(None, self._apply_gain, self._gain, self._volume, batch)
+                if generation == self._gain_generation:
+                    self._ready.extend(processed)
+                    self._ready_event.set()
+        finally:
+            self._gain_task = None
+            self._ready_event.set()  # Lets a waiting sender re-check
+
+    async def _wait_for_frames(self):
+        if self._gain is not None or self._gain_task is not None:
+            self._ready_event.clear()
+            self._fill_gain()
+            await self._ready_event.wait()
+            return
+        track = self.current
+        if track is not None:
+            await track.buffer.ready()
+            if self._seeking:
+                await asyncio.sleep(self._frame_duration)
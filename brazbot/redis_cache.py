@@ -0,0 +1,214 @@
+"""
+Redis-compatible cache backend, so many shard processes can share one entity
+cache. Speaks RESP directly over asyncio streams: concurrent get() calls made
+in the same loop iteration are coalesced into a single MGET, and writes into a
+single pipeline (MSET, or SET ... PX when a TTL is given). Values are msgpack.
+"""
+
+import asyncio
+import logging
+from brazbot.cache import CacheBackend
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class RedisError(Exception):
+    pass
+
+
+def encode_command(*args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif isinstance(arg, int):
+            arg = str(arg).encode("ascii")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Redis connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RedisError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(body)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Unexpected reply: {line!r}")
+
+
+class RedisCacheBackend(CacheBackend):
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, prefix="brazbot:"):
+        if msgpack is None:
+            raise RuntimeError("RedisCacheBackend requires msgpack: pip install msgpack")
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.reader = None
+        self.writer = None
+        self._lock = asyncio.Lock()
+        self._pending_gets = {}
+        self._pending_sets = []
+        self._flush_scheduled = False
+        self._flush_task = None
+
+    async def connect(self):
+        async with self._lock:
+            try:
+                await self._open()
+            except BaseException:
+                self._reset()
+                raise
+
+    async def _open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            self.writer.write(b"".join(encode_command(*command) for command in setup))
+            await self.writer.drain()
+            for _ in setup:
+                reply = await read_reply(self.reader)
+                if isinstance(reply, RedisError):
+                    raise reply
+
+    async def _pipeline(self, commands):
+        # One write, then read the replies in order
+        async with self._lock:
+            try:
+                if self.writer is None or self.writer.is_closing():
+                    await self._open()
+                self.writer.write(b"".join(encode_command(*command) for command in commands))
+                await self.writer.drain()
+                return [await read_reply(self.reader) for _ in commands]
+            except BaseException:
+                # Replies may still be queued on the socket (failed read, or
+                # cancelled mid-reply); they would answer the next commands
+                self._reset()
+                raise
+
+    def _reset(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def _schedule_flush(self):
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._start_flush)
+
+    def _start_flush(self):
+        self._flush_task = asyncio.ensure_future(self._flush())
+
+    async def _flush(self):
+        self._flush_scheduled = False
+        gets, self._pending_gets = self._pending_gets, {}
+        sets, self._pending_sets = self._pending_sets, []
+
+        # Writes first, so reads issued in the same tick see them
+        commands = []
+        plain = {}
+        for mapping, ttl, _ in sets:
+            if ttl:
+                for key, value in mapping.items():
+                    commands.append(("SET", self._key(key), msgpack.packb(value, use_bin_type=True), "PX", int(ttl * 1000)))
+            else:
+                plain.update(mapping)
+        if plain:
+            args = []
+            for key, value in plain.items():
+                args += [self._key(key), msgpack.packb(value, use_bin_type=True)]
+            commands.append(("MSET", *args))
+        if gets:
+            commands.append(("MGET", *(self._key(key) for key in gets)))
+
+        set_futures = [future for _, _, future in sets]
+        get_futures = [future for futures in gets.values() for future in futures]
+        try:
+            replies = await self._pipeline(commands)
+        except asyncio.CancelledError:
+            for future in set_futures + get_futures:
+                future.cancel()
+            raise
+        except Exception as e:
+            logging.error(f"Redis cache pipeline failed: {e}")
+            for future in set_futures + get_futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        write_replies = replies[:-1] if gets else replies
+        error = next((reply for reply in write_replies if isinstance(reply, RedisError)), None)
+        for future in set_futures:
+            if not future.done():
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+
+        if gets:
+            values = replies[-1]
+            if isinstance(values, RedisError):
+                for future in get_futures:
+                    if not future.done():
+                        future.set_exception(values)
+                return
+            for (key, futures), raw in zip(gets.items(), values):
+                value = None if raw is None else msgpack.unpackb(raw, raw=False)
+                for future in futures:
+                    if not future.done():
+                        future.set_result(value)
+
+    async def get_many(self, keys):
+        loop = asyncio.get_running_loop()
+        futures = []
+        for key in keys:
+            future = loop.create_future()
+            self._pending_gets.setdefault(key, []).append(future)
+            futures.append(future)
+        self._schedule_flush()
+        return list(await asyncio.gather(*futures))
+
+    async def set_many(self, mapping, ttl=None):
+        future = asyncio.get_running_loop().create_future()
+        self._pending_sets.append((dict(mapping), ttl, future))
+        self._schedule_flush()
+        await future
+
+    async def delete(self, key):
+        reply = (await self._pipeline([("DEL", self._key(key))]))[0]
+        if isinstance(reply, RedisError):
+            raise reply
+
+    async def close(self):
+        if self.writer is not None:
+            writer = self.writer
+            self._reset()
+            await writer.wait_closed()
@@ -1,11 +1,12 @@
 import aiohttp
 from datetime import datetime
+from .intern import intern_string
 
 class Role:
     def __init__(self, data, bot=None, guild_id=None):
         self.bot = bot
-        self.id = data.get('id')
-        self.name = data.get('name')
+        self.id = intern_string(data.get('id'))
+        self.name = intern_string(data.get('name'))
         self.color = data.get('color')
         self.colour = self.color
         self.created_at = datetime.fromtimestamp(((int(self.id) >> 22) + 1420070400000) / 1000)
@@ -18,16 +19,16 @@ class Role:
         self.members = data.get('members', [])
         self.mention = f"<@&{self.id}>"
         self.mentionable = data.get('mentionable', False)
-        self.permissions = data.get('permissions')
+        self.permissions = intern_string(data.get('permissions'))
         self.position = data.get('position')
         self.tags = data.get('tags', {})
-        self.unicode_emoji = data.get('unicode_emoji')
+        self.unicode_emoji = intern_string(data.get('unicode_emoji'))
         self.guild_id = guild_id
 
     @classmethod
     async def from_role_id(cls, bot, guild_id, role_id):
         cache_key = f"role_{role_id}"
-        data = bot.get_cache_data(cache_key)
+        data = await bot.get_cache_data_async(cache_key)
 
         if data:
             return cls(data, bot, guild_id)
@@ -43,7 +44,7 @@ class Role:
                     roles = await response.json()
                     role_data = next((role for role in roles if role['id'] == role_id), None)
                     if role_data:
-                        bot.set_cache_data(cache_key, role_data, seconds=120)
+                        await bot.set_cache_data_async(cache_key, role_data, seconds=120)
                         return cls(role_data, bot, guild_id)
                     else:
                         raise Exception(f"Role {role_id} not found in guild {guild_id}")
@@ -0,0 +1,283 @@
+"""
+Compiled router for prefix commands.
+
+Everything that depends only on the registered commands (prefix trie, command
+path trie, per-parameter converter pipelines) is built once at registration,
+so handling a message is a trie walk plus the converters of the matched route.
+"""
+
+import re
+import inspect
+import logging
+from typing import Union, Literal, get_args, get_origin
+from brazbot.greedy_union import Greedy
+from brazbot.member import Member
+from brazbot.roles import Role
+from brazbot.channels import Channel, TextChannel, VoiceChannel
+
+MENTION_RE = re.compile(r"<@[!&]?(\d+)>$")
+CHANNEL_MENTION_RE = re.compile(r"<#(\d+)>$")
+
+class PrefixTrie:
+    def __init__(self, prefixes=()):
+        self.root = {}
+        for prefix in prefixes:
+            self.add(prefix)
+
+    def add(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[None] = prefix
+
+    def match(self, content):
+        # Longest registered prefix at the start of content, or None
+        node = self.root
+        found = None
+        for char in content:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found = node[None]
+        return found
+
+
+def _to_bool(value):
+    lowered = value.lower()
+    if lowered in ("yes", "y", "true", "t", "1", "on", "sim", "s"):
+        return True
+    if lowered in ("no", "n", "false", "f", "0", "off", "nao", "não"):
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+
+def _snowflake_from(value, pattern):
+    match = pattern.match(value)
+    if match:
+        return match.group(1)
+    if value.isdigit():
+        return value
+    raise ValueError(f"Invalid mention or id: {value}")
+
+
+def _entity_converter(annotation):
+    if isinstance(annotation, type) and issubclass(annotation, Member):
+        async def convert(ctx, value):
+            return await annotation.from_user_id(ctx.bot, _snowflake_from(value, MENTION_RE), ctx.guild_id)
+        return convert
+    if isinstance(annotation, type) and issubclass(annotation, Role):
+        async def convert(ctx, value):
+            return await annotation.from_role_id(ctx.bot, ctx.guild_id, _snowflake_from(value, MENTION_RE))
+        return convert
+    if annotation in (Channel, TextChannel, VoiceChannel):
+        async def convert(ctx, value):
+            author_id = ctx.author['id'] if ctx.author else None
+            return await annotation.from_channel_id(ctx.bot, ctx.guild_id, _snowflake_from(value, CHANNEL_MENTION_RE), author_id)
+        return convert
+    return None
+
+
+async def run_converter(converter, ctx, value):
+    """
+    Runs one converter, awaiting it if needed. Any failure (a TypeError from
+    a constructor, a REST error from an entity lookup) comes out as
+    ValueError, the one error the command handler replies to.
+    """
+    try:
+        result = converter(ctx, value)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Could not convert {value}: {e}") from e
+
+
+def compile_converter(annotation):
+    """
+    Builds the converter for one annotation. A converter is a callable
+    (ctx, str) -> value, optionally async, that raises ValueError on bad input;
+    run it through run_converter, which turns any other error into one.
+    """
+    if annotation is inspect.Parameter.empty or annotation is str:
+        return lambda ctx, value: value
+    if annotation is bool:
+        return lambda ctx, value: _to_bool(value)
+    if annotation in (int, float):
+        return lambda ctx, value: annotation(value)
+
+    origin = get_origin(annotation)
+    if origin is Literal:
+        choices = {str(choice): choice for choice in get_args(annotation)}
+
+        def convert(ctx, value):
+            if value not in choices:
+                raise ValueError(f"Expected one of {', '.join(choices)}, got {value}")
+            return choices[value]
+        return convert
+    if origin is Union:
+        members = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(members) == 1:
+            return compile_converter(members[0])
+        converters = [compile_converter(arg) for arg in members]
+
+        async def convert(ctx, value):
+            for converter in converters:
+                try:
+                    return await run_converter(converter, ctx, value)
+                except ValueError:
+                    continue
+            raise ValueError(f"Could not convert {value}")
+        return convert
+
+    converter = _entity_converter(annotation)
+    if converter is not None:
+        return converter
+    if callable(annotation):
+        return lambda ctx, value: annotation(value)
+    return lambda ctx, value: value
+
+
+class ParameterPipeline:
+    GREEDY = "greedy"
+    REST = "rest"
+    VARIADIC = "variadic"
+    SINGLE = "single"
+
+    def __init__(self, parameter):
+        annotation = parameter.annotation
+        self.name = parameter.name
+        self.optional = False
+        self.default = None if parameter.default is inspect.Parameter.empty else parameter.default
+        self.mode = self.SINGLE
+
+        if parameter.default is not inspect.Parameter.empty:
+            self.optional = True
+        if get_origin(annotation) is Union and type(None) in get_args(annotation):
+            self.optional = True
+        if get_origin(annotation) is Greedy:
+            self.mode = self.GREEDY
+            annotation = get_args(annotation)[0]
+        elif parameter.kind is inspect.Parameter.VAR_POSITIONAL:
+            self.mode = self.VARIADIC
+        elif parameter.kind is inspect.Parameter.KEYWORD_ONLY:
+            self.mode = self.REST
+
+        self.keyword = parameter.kind is inspect.Parameter.KEYWORD_ONLY
+        self.converter = compile_converter(annotation)
+
+    async def convert(self, ctx, value):
+        return await run_converter(self.converter, ctx, value)
+
+
+class Route:
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.pipelines = []
+        parameters = list(inspect.signature(func).parameters.values())[1:]  # skip ctx
+        for parameter in parameters:
+            if parameter.kind is inspect.Parameter.VAR_KEYWORD:
+                continue
+            self.pipelines.append(ParameterPipeline(parameter))
+
+    async def convert(self, ctx, tokens):
+        args = []
+        kwargs = {}
+        index = 0
+        for pipeline in self.pipelines:
+            if pipeline.mode == pipeline.VARIADIC:
+                for token in tokens[index:]:
+                    args.append(await pipeline.convert(ctx, token))
+                index = len(tokens)
+                continue
+
+            if pipeline.mode == pipeline.GREEDY:
+                values = []
+                while index < len(tokens):
+                    try:
+                        values.append(await pipeline.convert(ctx, tokens[index]))
+                    except ValueError:
+                        break
+                    index += 1
+                value = Greedy(values)
+            elif index >= len(tokens):
+                if not pipeline.optional:
+                    raise ValueError(f"Missing required argument: {pipeline.name}")
+                value = pipeline.default
+            elif pipeline.mode == pipeline.REST:
+                value = await pipeline.convert(ctx, " ".join(tokens[index:]))
+                index = len(tokens)
+            else:
+                try:
+                    value = await pipeline.convert(ctx, tokens[index])
+                    index += 1
+                except ValueError:
+                    if not pipeline.optional:
+                        raise
+                    value = pipeline.default
+
+            if pipeline.keyword:
+                kwargs[pipeline.name] = value
+            else:
+                args.append(value)
+        return args, kwargs
+
+
+class CommandRouter:
+    def __init__(self, prefixes=None):
+        self.routes = {}
+        self.tree = {}
+        self.prefixes = ()
+        self.mention_id = None
+        self.trie = PrefixTrie()
+        self.set_prefixes(prefixes)
+
+    def set_prefixes(self, prefixes, mention_id=None):
+        if prefixes is None:
+            prefixes = ()
+        elif isinstance(prefixes, str):
+            prefixes = (prefixes,)
+        self.prefixes = tuple(prefixes)
+        self.mention_id = mention_id
+        mentions = (f"<@{mention_id}> ", f"<@!{mention_id}> ", f"<@{mention_id}>", f"<@!{mention_id}>") if mention_id else ()
+        self.trie = PrefixTrie(self.prefixes + mentions)
+
+    def add(self, name, func, aliases=None):
+        route = Route(name, func)
+        self.routes[name] = route
+        for path in (name, *(aliases or ())):
+            node = self.tree
+            for token in path.split():
+                node = node.setdefault(token, {})
+            node[None] = route
+        logging.debug(f"Compiled route: {name} with parameters: {[p.name for p in route.pipelines]}")
+        return route
+
+    def resolve(self, content):
+        """
+        Matches prefix and the longest command path (sub-commands included).
+
+        Returns:
+            tuple: (route, remaining tokens) or (None, None).
+        """
+        prefix = self.trie.match(content)
+        if prefix is None:
+            return None, None
+        tokens = content[len(prefix):].split()
+
+        node = self.tree
+        route = None
+        consumed = 0
+        for depth, token in enumerate(tokens):
+            node = node.get(token)
+            if node is None:
+                break
+            if None in node:
+                route = node[None]
+                consumed = depth + 1
+        if route is None:
+            return None, None
+        return route, tokens[consumed:]
@@ -7,6 +7,7 @@ class Thread:
         self.id = data.get('id')
         self.name = data.get('name')
         self.guild = data.get('guild')
+        self.guild_id = data.get('guild_id') or self.guild
         self.parent_id = data.get('parent_id')
         self.owner_id = data.get('owner_id')
         self.archived = data.get('archived')
@@ -33,7 +34,7 @@ class Thread:
     @classmethod
     async def from_thread_id(cls, bot, guild_id, thread_id):
         cache_key = f"thread_{guild_id}"
-        data = bot.get_cache_data(cache_key)
+        data = await bot.get_cache_data_async(cache_key)
 
         if data:
             return cls(data, bot)
@@ -47,7 +48,7 @@ class Thread:
             async with session.get(url, headers=headers) as response:
                 if response.status == 200:
                     data = await response.json()
-                    bot.set_cache_data(cache_key, data, seconds=120)
+                    await bot.set_cache_data_async(cache_key, data, seconds=120)
                     data['guild'] = guild_id
                     return cls(data, bot)
                 else:
@@ -193,16 +194,8 @@ class Thread:
                     raise Exception(f"Failed to leave thread: {response.status}")
 
     async def permissions_for(self, member_or_role):
-        url = f"https://discord.com/api/v10/channels/{self.id}/permissions/{member_or_role.id}"
-        headers = {
-            "Authorization": f"Bot {self.bot.token}"
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"Failed to fetch permissions: {response.status}")
+        # Threads inherit the overwrites of their parent channel
+        return await self.bot.permissions.permissions_for(self.bot, self.guild_id, self.parent_id, member_or_role)
 
     async def pins(self):
         url = f"https://discord.com/api/v10/channels/{self.id}/pins"
@@ -249,17 +242,11 @@ class Thread:
                 if response.status != 204:
                     raise Exception(f"Failed to remove user from thread: {response.status}")
 
-    async def send(self, content):
-        url = f"https://discord.com/api/v10/channels/{self.id}/messages"
-        headers = {
-            "Authorization": f"Bot {self.bot.token}",
-            "Content-Type": "application/json"
-        }
-        json_data = {"content": content}
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=json_data) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to send message: {response.status}")
+    async def send(self, content=None, embed=None, embeds=None, files=None, components=None):
+        message = await self.bot.message_handler.send_message(self.id, content, embed, embeds, files, components)
+        if message is None:
+            raise Exception(f"Failed to send message to thread {self.id}")
+        return message
 
     async def typing(self):
         url = f"https://discord.com/api/v10/channels/{self.id}/typing"
@@ -0,0 +1,257 @@
+"""
+On-disk cache of encoded tracks.
+
+The first full play of a URL stores the Opus frames ffmpeg produced; later
+plays at the same bitrate read them back through mmap, with no HTTP request
+and no ffmpeg process. A track file is
+
+    MAGIC | frame 0 | frame 1 | ... | offsets (count + 1 uint32) | count (uint32) | MAGIC
+
+written under a temporary name and renamed once complete, so a stopped or
+failed play never leaves a partial entry. Frames are copied out of the
+mapping one at a time (a few hundred bytes each), so the map is closed as
+soon as the play ends. Files are evicted least recently played first once
+the directory grows past max_bytes; an entry that fails validation is
+evicted when it is looked up.
+
+    voice_client.track_cache = TrackCache("tracks", max_bytes=2 * 1024 ** 3)
+"""
+
+import os
+import mmap
+import time
+import hashlib
+import logging
+from array import array
+from collections import OrderedDict
+from struct import pack, unpack_from
+from brazbot.audio_sources import FFmpegOpusSource
+
+MAGIC = b"BZOPUS\x00\x01"
+FOOTER_SIZE = 4 + len(MAGIC)
+SUFFIX = ".bzopus"
+MAX_TRACKED_PLAYS = 10000  # URLs counted towards min_plays before the oldest are forgotten
+STALE_TEMP_SECONDS = 24 * 3600  # Untouched this long, a temp file is a crashed write, not a slow one
+
+
+def cache_key(url, bitrate, codec=None):
+    return hashlib.sha1(f"{url}\n{bitrate}\n{codec or ''}".encode()).hexdigest()
+
+
+class CachedTrack:
+    """
+    A cached track mapped in memory.
+
+    Raises:
+        ValueError: when the file is truncated or not a cached track.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.offsets = self._read_offsets(path)
+        except Exception:
+            self.map.close()
+            raise
+
+    def _read_offsets(self, path):
+        data = self.map
+        if len(data) < len(MAGIC) + FOOTER_SIZE or data[:len(MAGIC)] != MAGIC or data[-len(MAGIC):] != MAGIC:
+            raise ValueError(f"Not a cached track: {path}")
+        count = unpack_from('<I', data, len(data) - FOOTER_SIZE)[0]
+        start = len(data) - FOOTER_SIZE - 4 * (count + 1)
+        if start < len(MAGIC):
+            raise ValueError(f"Corrupt cached track: {path}")
+        offsets = array('I')
+        offsets.frombytes(data[start:len(data) - FOOTER_SIZE])  # Native order: the cache is local
+        if offsets[0] != len(MAGIC) or offsets[-1] != start:
+            raise ValueError(f"Corrupt cached track: {path}")
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def frame(self, index):
+        return self.map[self.offsets[index]:self.offsets[index + 1]]
+
+    def close(self):
+        self.map.close()
+
+    @classmethod
+    def validate(cls, path):
+        cls(path).close()
+
+
+class CachedOpusSource:
+    def __init__(self, path, url=None):
+        self.path = path
+        self.url = url
+        self.frame_count = 0
+
+    async def frames(self):
+        track = CachedTrack(self.path)
+        logging.debug(f"Playing {len(track)} cached frames: {self.url or self.path}")
+        try:
+            for index in range(len(track)):
+                self.frame_count += 1
+                yield track.frame(index)
+        finally:
+            track.close()
+
+
+class CachingSource:
+    """
+    Wraps a source and records its frames; the entry is committed only when
+    the source ran to the end.
+    """
+    def __init__(self, source, cache, key):
+        self.source = source
+        self.cache = cache
+        self.key = key
+        self.url = getattr(source, "url", None)
+
+    @property
+    def frame_count(self):
+        return self.source.frame_count
+
+    async def frames(self):
+        temp = self.cache.path_for(self.key) + f".{os.getpid()}.{id(self)}.tmp"
+        file = open(temp, "wb", buffering=65536)
+        offsets = array('I', [len(MAGIC)])
+        frames = self.source.frames()
+        complete = False
+        try:
+            file.write(MAGIC)
+            async for frame in frames:
+                # Small buffered writes, done inline like FileStream reads
+                file.write(frame)
+                offsets.append(offsets[-1] + len(frame))
+                yield frame
+            complete = True
+        finally:
+            await frames.aclose()  # Stops ffmpeg when playback was cut short
+            if complete:
+                file.write(offsets.tobytes())
+                file.write(pack('<I', len(offsets) - 1))
+                file.write(MAGIC)
+            file.close()
+            try:
+                if complete:
+                    self.cache.commit(self.key, temp)
+                else:
+                    os.unlink(temp)
+            except OSError as e:
+                # Losing the entry must not fail the play that produced it
+                logging.warning(f"Could not store cached track {self.key}: {e}")
+                if os.path.exists(temp):
+                    os.unlink(temp)
+
+
+class TrackCache:
+    def __init__(self, directory="brazbot_tracks", max_bytes=1024 ** 3, min_plays=1):
+        """
+        Args:
+            directory (str): Where track files are kept.
+            max_bytes (int): Total size kept on disk before evicting the least recently played.
+            min_plays (int): Plays of a URL before it is stored, to keep one-off tracks out.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.entries = OrderedDict()  # key -> size in bytes, least recently played first
+        self.total_bytes = 0
+        self.plays = OrderedDict()  # key -> plays so far, bounded by MAX_TRACKED_PLAYS
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = []
+        stale = time.time() - STALE_TEMP_SECONDS
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                if name.endswith(".tmp"):
+                    # Another process sharing the directory may still be
+                    # writing it: only remove what a crash left behind
+                    if stat.st_mtime < stale:
+                        os.unlink(path)
+                elif name.endswith(SUFFIX):
+                    found.append((stat.st_mtime, name[:-len(SUFFIX)], stat.st_size))
+            except OSError:
+                continue  # Renamed or evicted by another process meanwhile
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def source(self, url, bitrate=64000, codec=None, headers=None):
+        """
+        Source for VoiceClient.play: the cached frames when there are any,
+        otherwise ffmpeg, recording the frames for next time.
+        """
+        key = cache_key(url, bitrate, codec)
+        if key in self.entries:
+            path = self.path_for(key)
+            try:
+                CachedTrack.validate(path)
+                os.utime(path)  # mtime orders the LRU across restarts
+            except (OSError, ValueError) as e:
+                logging.warning(f"Dropping unusable cached track {key}: {e}")
+                self.discard(key)
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return CachedOpusSource(path, url)
+        self.misses += 1
+        source = FFmpegOpusSource(url, bitrate, codec, headers)
+        if self.min_plays > 1:
+            self.plays[key] = self.plays.get(key, 0) + 1
+            self.plays.move_to_end(key)
+            while len(self.plays) > MAX_TRACKED_PLAYS:
+                self.plays.popitem(last=False)
+            if self.plays[key] < self.min_plays:
+                return source
+        return CachingSource(source, self, key)
+
+    def commit(self, key, temp):
+        path = self.path_for(key)
+        os.replace(temp, path)
+        self.plays.pop(key, None)
+        self.total_bytes -= self.entries.pop(key, 0)
+        self.entries[key] = os.path.getsize(path)
+        self.total_bytes += self.entries[key]
+        self._evict()
+
+    def discard(self, key):
+        self.total_bytes -= self.entries.pop(key, 0)
+        self._unlink(key)
+
+    def _unlink(self, key):
+        try:
+            os.unlink(self.path_for(key))  # Mapped copies stay readable until closed
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # e.g. Windows refuses while a play still maps it; _load finds it again on the next start
+            logging.warning(f"Could not remove cached track {key}: {e}")
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self._unlink(key)
+            logging.debug(f"Evicted cached track {key}")
+
+    def stats(self):
+        return {
+            "tracks": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,239 @@
+"""
+RTP packetizing and encryption for voice, one PacketEncryptor per session.
+
+The key, cipher and the RTP header template are set up once; each frame only
+packs sequence/timestamp (and the nonce counter) into preallocated buffers
+and runs the cipher. Supported modes, best first:
+
+    aead_aes256_gcm_rtpsize         (needs the cryptography package)
+    aead_xchacha20_poly1305_rtpsize
+    xsalsa20_poly1305_lite
+    xsalsa20_poly1305
+
+The *_rtpsize and _lite modes use a 32-bit incrementing nonce counter sent as
+the last 4 bytes of the packet; the rtpsize modes authenticate the RTP header
+as associated data. PacketDecryptor is the receiving side: it opens packets
+from other speakers and strips CSRCs and the RTP header extension.
+
+SEE: https://discord.com/developers/docs/topics/voice-connections#transport-encryption-modes
+"""
+
+import os
+import time
+from struct import pack_into, unpack_from
+import nacl.bindings
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+RTP_HEADER_SIZE = 12
+RTP_VERSION = 0x80
+OPUS_PAYLOAD_TYPE = 0x78
+
+SUPPORTED_MODES = (
+    "aead_aes256_gcm_rtpsize",
+    "aead_xchacha20_poly1305_rtpsize",
+    "xsalsa20_poly1305_lite",
+    "xsalsa20_poly1305",
+)
+
+
+def available_modes():
+    return [mode for mode in SUPPORTED_MODES if mode != "aead_aes256_gcm_rtpsize" or AESGCM is not None]
+
+
+def choose_mode(offered):
+    """
+    Best mode we support among the ones offered by the voice server (op 2 `modes`).
+    """
+    offered = set(offered or ())
+    for mode in available_modes():
+        if mode in offered:
+            return mode
+    return "xsalsa20_poly1305"
+
+
+class PacketEncryptor:
+    def __init__(self, mode, secret_key, ssrc):
+        if mode not in SUPPORTED_MODES:
+            raise ValueError(f"Unsupported voice encryption mode: {mode}")
+        self.mode = mode
+        self.key = bytes(secret_key)
+        self.nonce = bytearray(24)
+        self.counter = 0
+        self._aes = None
+        if mode == "aead_aes256_gcm_rtpsize":
+            if AESGCM is None:
+                raise RuntimeError("aead_aes256_gcm_rtpsize requires the cryptography package")
+            self._aes = AESGCM(self.key)
+            self.nonce = bytearray(12)
+        if mode == "xsalsa20_poly1305":
+            # The nonce is the header padded with zeros: pack the header
+            # straight into it
+            self.header = memoryview(self.nonce)[:RTP_HEADER_SIZE]
+        else:
+            self.header = memoryview(bytearray(RTP_HEADER_SIZE))
+        self.header[0] = RTP_VERSION
+        self.header[1] = OPUS_PAYLOAD_TYPE
+        pack_into('>I', self.header, 8, ssrc)
+        self._nonce_suffix = memoryview(self.nonce)[:4]  # Sent after the ciphertext
+        self._encrypt = getattr(self, f"_encrypt_{mode}")
+
+    def encrypt(self, sequence, timestamp, payload):
+        """
+        Returns:
+            bytes: Full RTP packet (header + encrypted payload [+ nonce suffix]).
+        """
+        pack_into('>HI', self.header, 2, sequence, timestamp)
+        return self._encrypt(payload)
+
+    def _next_nonce(self):
+        pack_into('>I', self.nonce, 0, self.counter)
+        self.counter = (self.counter + 1) & 0xFFFFFFFF
+
+    # PyNaCl wants bytes for nonces (and for every argument of the AEAD
+    # call), so those are the only copies made besides the packet itself;
+    # secretbox messages and all of AES-GCM take the buffers as they are
+
+    def _encrypt_xsalsa20_poly1305(self, payload):
+        box = nacl.bindings.crypto_secretbox(payload, bytes(self.nonce), self.key)
+        return b"".join((self.header, box))
+
+    def _encrypt_xsalsa20_poly1305_lite(self, payload):
+        self._next_nonce()
+        box = nacl.bindings.crypto_secretbox(payload, bytes(self.nonce), self.key)
+        return b"".join((self.header, box, self._nonce_suffix))
+
+    def _encrypt_aead_xchacha20_poly1305_rtpsize(self, payload):
+        self._next_nonce()
+        if type(payload) is not bytes:
+            payload = bytes(payload)
+        header = bytes(self.header)
+        box = nacl.bindings.crypto_aead_xchacha20poly1305_ietf_encrypt(payload, header, bytes(self.nonce), self.key)
+        return b"".join((header, box, self._nonce_suffix))
+
+    def _encrypt_aead_aes256_gcm_rtpsize(self, payload):
+        self._next_nonce()
+        box = self._aes.encrypt(self.nonce, payload, self.header)
+        return b"".join((self.header, box, self._nonce_suffix))
+
+
+RTP_EXTENSION_BIT = 0x10
+RTP_CSRC_MASK = 0x0F
+
+
+class PacketDecryptor:
+    def __init__(self, mode, secret_key):
+        if mode not in SUPPORTED_MODES:
+            raise ValueError(f"Unsupported voice encryption mode: {mode}")
+        self.mode = mode
+        self.key = bytes(secret_key)
+        self._rtpsize = mode.endswith("_rtpsize")
+        self._aes = None
+        if mode == "aead_aes256_gcm_rtpsize":
+            if AESGCM is None:
+                raise RuntimeError("aead_aes256_gcm_rtpsize requires the cryptography package")
+            self._aes = AESGCM(self.key)
+        self._decrypt = getattr(self, f"_decrypt_{mode}")
+
+    def decrypt(self, packet):
+        """
+        Opens an RTP voice packet.
+
+        Returns:
+            tuple: (sequence, timestamp, ssrc, opus payload as bytes).
+
+        Raises:
+            nacl.exceptions.CryptoError, cryptography InvalidTag, or ValueError
+            for packets that do not authenticate or are truncated.
+        """
+        if len(packet) < RTP_HEADER_SIZE + 4:
+            raise ValueError("Voice packet too short")
+        sequence, timestamp, ssrc = unpack_from('>HII', packet, 2)
+        # Fixed header + CSRCs; the rtpsize modes also leave the 4-byte
+        # extension header in the clear (its body is encrypted)
+        header_size = RTP_HEADER_SIZE + 4 * (packet[0] & RTP_CSRC_MASK)
+        extended = packet[0] & RTP_EXTENSION_BIT
+        payload = self._decrypt(packet, header_size, extended)
+        if extended:
+            if self._rtpsize:
+                skip = 4 * unpack_from('>H', packet, header_size + 2)[0]
+            else:
+                skip = 4 + 4 * unpack_from('>H', payload, 2)[0]
+            payload = payload[skip:]
+        return sequence, timestamp, ssrc, payload
+
+    def _decrypt_xsalsa20_poly1305(self, packet, header_size, extended):
+        nonce = bytes(packet[:RTP_HEADER_SIZE]) + bytes(12)
+        return nacl.bindings.crypto_secretbox_open(bytes(packet[RTP_HEADER_SIZE:]), nonce, self.key)
+
+    def _decrypt_xsalsa20_poly1305_lite(self, packet, header_size, extended):
+        nonce = bytes(packet[-4:]) + bytes(20)
+        return nacl.bindings.crypto_secretbox_open(bytes(packet[RTP_HEADER_SIZE:-4]), nonce, self.key)
+
+    def _decrypt_aead_xchacha20_poly1305_rtpsize(self, packet, header_size, extended):
+        if extended:
+            header_size += 4
+        nonce = bytes(packet[-4:]) + bytes(20)
+        return nacl.bindings.crypto_aead_xchacha20poly1305_ietf_decrypt(
+            bytes(packet[header_size:-4]), bytes(packet[:header_size]), nonce, self.key
+        )
+
+    def _decrypt_aead_aes256_gcm_rtpsize(self, packet, header_size, extended):
+        if extended:
+            header_size += 4
+        nonce = bytes(packet[-4:]) + bytes(8)
+        view = memoryview(packet)  # AES-GCM reads slices in place
+        return self._aes.decrypt(nonce, view[header_size:-4], view[:header_size])
+
+
+def benchmark(mode="aead_xchacha20_poly1305_rtpsize", payload_size=160, seconds=2.0):
+    """
+    Packets encrypted per second on one core, for a typical 64 kbps Opus frame.
+    """
+    encryptor = PacketEncryptor(mode, os.urandom(32), 1234)
+    payload = os.urandom(payload_size)
+    count = 0
+    sequence = timestamp = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            encryptor.encrypt(sequence, timestamp, payload)
+            sequence = (sequence + 1) & 0xFFFF
+            timestamp = (timestamp + 960) & 0xFFFFFFFF
+        count += 1000
+    return count / (time.perf_counter() - started)
+
+
+def legacy_benchmark(payload_size=160, seconds=2.0):
+    # The previous per-frame path: new SecretBox and buffers for each packet
+    import nacl.secret
+    from struct import pack
+    key = os.urandom(32)
+    payload = os.urandom(payload_size)
+    count = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            header = bytearray(12)
+            header[0] = 0x80
+            header[1] = 0x78
+            header[2:4] = pack('>H', count & 0xFFFF)
+            header[4:8] = pack('>I', 0)
+            header[8:12] = pack('>I', 1234)
+            nonce = bytearray(24)
+            nonce[:12] = header
+            box = nacl.secret.SecretBox(bytes(key))
+            header + box.encrypt(bytes(payload), bytes(nonce)).ciphertext
+            count += 1
+    return count / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    print(f"{'legacy (SecretBox per packet)':34} {legacy_benchmark():>10,.0f} packets/s")
+    for mode in available_modes():
+        print(f"{mode:34} {benchmark(mode):>10,.0f} packets/s")
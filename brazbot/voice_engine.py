@@ -0,0 +1,167 @@
+"""
+Multi-guild voice engine.
+
+Instead of one sender task and timer per VoiceClient, a VoiceEngine runs a
+single 20 ms tick loop for every connection it owns. Each tick it takes the
+frames that are due from every connection's FrameBuffer, encrypts them all,
+then sends the batch, over a small pool of shared UDP sockets.
+
+    engine = VoiceEngine()
+    voice_client = VoiceClient(bot, channel, engine=engine)
+"""
+
+import time
+import asyncio
+import logging
+from brazbot.opus import packet_samples, SILENCE_FRAME, SAMPLE_RATE
+from brazbot.voice_transport import FramePacer, UDPSocketPool, FRAME_DURATION, SAMPLES_PER_FRAME
+
+TRAILING_SILENCE_FRAMES = 5
+
+
+class EngineStream:
+    __slots__ = ("client", "buffer", "position", "started", "silence_left", "finished")
+
+    def __init__(self, client, buffer):
+        self.client = client
+        self.buffer = buffer
+        self.position = 0.0   # Seconds of audio sent
+        self.started = None   # Engine clock when the stream began
+        self.silence_left = TRAILING_SILENCE_FRAMES
+        self.finished = asyncio.get_running_loop().create_future()
+
+
+class VoiceEngine:
+    def __init__(self, sockets=4, frame_duration=FRAME_DURATION):
+        """
+        Args:
+            sockets (int): Size of the shared UDP socket pool.
+            frame_duration (float): Tick length in seconds.
+        """
+        self.pool = UDPSocketPool(sockets)
+        self.pacer = FramePacer(frame_duration)
+        self.frame_duration = frame_duration
+        self.streams = {}  # guild id -> EngineStream
+        self._task = None
+        self._speaking_tasks = set()  # Kept referenced until done, errors logged
+        self.ticks = 0
+        self.packets = 0
+        self.batch_time = 0.0
+        self.max_batch_time = 0.0
+
+    def __len__(self):
+        return len(self.streams)
+
+    def add(self, client, buffer):
+        """
+        Starts sending `buffer` for `client`, replacing what it was playing.
+
+        Returns:
+            asyncio.Future: Resolved when the stream has been sent out.
+        """
+        self._drop(client)  # Still speaking: the new stream follows on
+        stream = EngineStream(client, buffer)
+        self.streams[client.guild_id] = stream
+        self._set_speaking(client, True)
+        if self._task is None or self._task.done():
+            self.pacer.reset()
+            self._task = asyncio.create_task(self._run())
+        return stream.finished
+
+    def remove(self, client):
+        if self._drop(client):
+            self._set_speaking(client, False)
+
+    def _drop(self, client):
+        stream = self.streams.pop(client.guild_id, None)
+        if stream is None:
+            return False
+        if not stream.finished.done():
+            stream.finished.set_result(False)
+        return True
+
+    def _finish(self, guild_id, stream):
+        del self.streams[guild_id]
+        if not stream.finished.done():
+            stream.finished.set_result(True)
+        self._set_speaking(stream.client, False)
+
+    def _set_speaking(self, client, speaking):
+        task = asyncio.create_task(client.set_speaking(speaking))
+        self._speaking_tasks.add(task)
+        task.add_done_callback(self._speaking_done)
+
+    def _speaking_done(self, task):
+        self._speaking_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Voice engine could not update speaking state: {task.exception()}")
+
+    def _collect(self, now):
+        # Frames due this tick from every stream; a stream is due while the
+        # audio it has sent is not ahead of the time it has been playing
+        batch = []
+        for guild_id, stream in list(self.streams.items()):
+            client = stream.client
+            if not client.connected:
+                # Paused while the voice connection recovers: keep the frames, shift the clock
+                stream.started = now - stream.position
+                continue
+            if stream.started is None:
+                stream.started = now
+            # Half a tick of slack so a timer firing slightly early does not skip a frame
+            while stream.position <= now - stream.started + self.frame_duration / 2:
+                frame = stream.buffer.get_nowait()
+                if frame is None:
+                    if not stream.buffer.exhausted:
+                        # Underrun: skip the tick rather than fall behind
+                        stream.position = now - stream.started + self.frame_duration
+                        break
+                    if stream.silence_left == 0:
+                        self._finish(guild_id, stream)
+                        break
+                    stream.silence_left -= 1
+                    frame = SILENCE_FRAME
+                samples = packet_samples(frame) or SAMPLES_PER_FRAME
+                try:
+                    batch.append((client.transport, client._next_packet(frame, samples)))
+                except Exception as e:
+                    logging.error(f"Voice engine dropped guild {guild_id}: {e}")
+                    self.remove(client)
+                    break
+                stream.position += samples / SAMPLE_RATE
+        return batch
+
+    async def _run(self):
+        while self.streams:
+            await self.pacer.wait()
+            started = time.perf_counter()
+            batch = self._collect(time.monotonic())
+            for transport, packet in batch:
+                if transport is not None and not transport.closed:
+                    transport.send(packet)
+            elapsed = time.perf_counter() - started
+            self.ticks += 1
+            self.packets += len(batch)
+            self.batch_time += elapsed
+            if elapsed > self.max_batch_time:
+                self.max_batch_time = elapsed
+        logging.debug("Voice engine idle")
+
+    def stats(self):
+        stats = self.pacer.stats()
+        stats.update({
+            "connections": len(self.streams),
+            "sockets": len(self.pool.sockets),
+            "packets": self.packets,
+            "avg_batch_ms": self.batch_time / self.ticks * 1000 if self.ticks else 0.0,
+            "max_batch_ms": self.max_batch_time * 1000
+        })
+        return stats
+
+    async def close(self):
+        for stream in list(self.streams.values()):
+            self.remove(stream.client)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.pool.close()
@@ -0,0 +1,289 @@
+"""
+Voice receive path.
+
+Datagrams from the voice socket are handled right in the protocol callback:
+decrypted with the session key, then reordered per SSRC in a small jitter
+buffer. Packets held behind a gap are flushed once their speaker has been
+quiet for `flush_after` seconds, so the end of a talk spurt is not kept
+back until that person speaks again. With decode=True the released frames
+are decoded to PCM in a thread pool (libopus runs without the GIL), one
+batch at a time per speaker so each decoder sees its packets in order while
+different speakers decode in parallel. Frames come out of an async iterator:
+
+    receiver = voice_client.listen(decode=True)
+    async for user_id, frame in receiver:
+        recorder.write(user_id, frame.timestamp, frame.data)
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from brazbot.opus import OpusDecoder, SILENCE_FRAME
+from brazbot.voice_crypto import PacketDecryptor, OPUS_PAYLOAD_TYPE
+
+
+class VoiceFrame:
+    __slots__ = ("ssrc", "sequence", "timestamp", "data", "pcm")
+
+    def __init__(self, ssrc, sequence, timestamp, data, pcm=False):
+        self.ssrc = ssrc
+        self.sequence = sequence
+        self.timestamp = timestamp  # RTP timestamp, 48 kHz samples
+        self.data = data            # Opus packet, or s16le stereo PCM when pcm is True
+        self.pcm = pcm
+
+
+class JitterBuffer:
+    def __init__(self, depth=3):
+        """
+        Args:
+            depth (int): Packets held back waiting for a missing one before
+                it is given up as lost (3 = 60 ms).
+        """
+        self.depth = depth
+        self.packets = {}  # sequence -> (timestamp, payload)
+        self.next_sequence = None
+        self.lost = 0
+        self.late = 0
+
+    def push(self, sequence, timestamp, payload):
+        """
+        Returns:
+            list: (sequence, timestamp, payload) now in order; payload is None
+                for a lost packet the decoder should conceal.
+        """
+        if self.next_sequence is None:
+            self.next_sequence = sequence
+        if (sequence - self.next_sequence) & 0xFFFF >= 0x8000:
+            self.late += 1  # Already played out (or a duplicate)
+            return []
+        self.packets[sequence] = (timestamp, payload)
+        released = []
+        while True:
+            self._release(released)
+            if len(self.packets) <= self.depth:
+                return released
+            # Still missing with `depth` packets waiting behind it: skip the gap
+            self._skip_gap(released)
+
+    def flush(self):
+        """
+        Releases every held packet, giving up on the gaps before them; used
+        when the speaker went quiet and nothing more will fill them.
+        """
+        released = []
+        while True:
+            self._release(released)
+            if not self.packets:
+                return released
+            self._skip_gap(released)
+
+    def _skip_gap(self, released):
+        gap = min((seq - self.next_sequence) & 0xFFFF for seq in self.packets)
+        self.lost += gap
+        if gap <= self.depth:
+            for _ in range(gap):
+                released.append((self.next_sequence, None, None))
+                self.next_sequence = (self.next_sequence + 1) & 0xFFFF
+        else:
+            self.next_sequence = (self.next_sequence + gap) & 0xFFFF  # Too long to conceal
+
+    def _release(self, released):
+        packets = self.packets
+        while self.next_sequence in packets:
+            timestamp, payload = packets.pop(self.next_sequence)
+            released.append((self.next_sequence, timestamp, payload))
+            self.next_sequence = (self.next_sequence + 1) & 0xFFFF
+
+
+class SpeakerState:
+    __slots__ = ("jitter", "decoder", "timestamp", "pending", "decoding", "arrived", "user_id")
+
+    def __init__(self, depth):
+        self.jitter = JitterBuffer(depth)
+        self.decoder = None
+        self.arrived = 0.0     # Loop time of the last packet, for the idle flush
+        self.user_id = None    # Kept once the speaker left and ssrc_map forgot them
+        self.timestamp = 0     # Of the last decoded frame, to stamp concealed ones
+        self.pending = []      # Frames waiting for the decode thread
+        self.decoding = False  # A batch of this speaker is in the executor
+
+
+class VoiceReceiver:
+    def __init__(self, client, decode=False, depth=3, max_queue=1000, executor=None, workers=2, flush_after=0.1):
+        """
+        Args:
+            client (VoiceClient): Connected voice client.
+            decode (bool): Yield PCM (s16le, 48 kHz stereo) instead of Opus.
+            depth (int): Jitter buffer depth in packets.
+            max_queue (int): Frames kept for a slow consumer; newer ones are dropped beyond it.
+            executor (Executor, optional): Shared decode pool, e.g. for many guilds.
+            workers (int): Threads of the pool created when none is given.
+            flush_after (float): Seconds a speaker is quiet before the packets
+                held behind a gap are released anyway.
+        """
+        self.client = client
+        self.decode = decode
+        self.depth = depth
+        self.speakers = {}  # ssrc -> SpeakerState
+        self.queue = asyncio.Queue(max_queue)
+        self.executor = executor
+        self._own_executor = False
+        if decode and executor is None:
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix="voice-decode")
+            self._own_executor = True
+        self.flush_after = flush_after
+        self._loop = asyncio.get_running_loop()
+        self._flush_handle = self._loop.call_later(flush_after, self._flush_idle)
+        self._decryptor = None
+        self._key = None
+        self.closed = False
+        self.received = 0
+        self.invalid = 0
+        self.dropped = 0
+
+    def packet_received(self, data):
+        # Called from the datagram protocol for every voice packet
+        if self.closed or len(data) < 12 or data[1] & 0x7F != OPUS_PAYLOAD_TYPE:
+            return  # RTCP reports and anything else that is not Opus
+        client = self.client
+        if client.secret_key is None:
+            return
+        if self._key is not client.secret_key:
+            # New session (reconnect): new key, maybe another mode
+            self._decryptor = PacketDecryptor(client.mode, client.secret_key)
+            self._key = client.secret_key
+        try:
+            sequence, timestamp, ssrc, payload = self._decryptor.decrypt(data)
+        except Exception:
+            self.invalid += 1
+            return
+        self.received += 1
+        speaker = self.speakers.get(ssrc)
+        if speaker is None:
+            speaker = self.speakers[ssrc] = SpeakerState(self.depth)
+        speaker.arrived = self._loop.time()
+        released = speaker.jitter.push(sequence, timestamp, payload)
+        if released:
+            self._deliver(ssrc, speaker, released)
+
+    def _flush_idle(self):
+        # Periodic: speakers quiet for flush_after still holding packets behind a gap
+        if self.closed:
+            return
+        now = self._loop.time()
+        for ssrc, speaker in self.speakers.items():
+            if speaker.jitter.packets and now - speaker.arrived >= self.flush_after:
+                released = speaker.jitter.flush()
+                if released:
+                    self._deliver(ssrc, speaker, released)
+        self._flush_handle = self._loop.call_later(self.flush_after / 2, self._flush_idle)
+
+    def remove_speaker(self, ssrc):
+        """
+        Forgets a speaker that left (op 13): what it still held is delivered,
+        then its jitter buffer and decoder are dropped.
+        """
+        speaker = self.speakers.pop(ssrc, None)
+        if speaker is None:
+            return
+        speaker.user_id = self.client.ssrc_map.get(ssrc)
+        released = speaker.jitter.flush()
+        if released:
+            self._deliver(ssrc, speaker, released)
+
+    def _deliver(self, ssrc, speaker, released):
+        # Silence frames only mark the end of speech; lost packets (None) are
+        # concealed by the decoder, or skipped when passing Opus through
+        if not self.decode:
+            for sequence, timestamp, payload in released:
+                if payload is not None and payload != SILENCE_FRAME:
+                    self._put(ssrc, speaker, VoiceFrame(ssrc, sequence, timestamp, payload))
+            return
+        speaker.pending.extend(frame for frame in released if frame[2] != SILENCE_FRAME)
+        if not speaker.pending:
+            return
+        if not speaker.decoding:
+            self._start_decode(ssrc, speaker)
+
+    def _start_decode(self, ssrc, speaker):
+        batch, speaker.pending = speaker.pending, []
+        speaker.decoding = True
+        future = self._loop.run_in_executor(self.executor, self._decode_batch, ssrc, speaker, batch)
+        future.add_done_callback(lambda done: self._decoded(ssrc, speaker, done))
+
+    def _decode_batch(self, ssrc, speaker, batch):
+        # Runs in the pool; only one batch per speaker at a time, so the decoder is not shared
+        if speaker.decoder is None:
+            speaker.decoder = OpusDecoder()
+        frames = []
+        for sequence, timestamp, payload in batch:
+            if timestamp is None:
+                # Concealed frame: as long as the one before it
+                timestamp = (speaker.timestamp + speaker.decoder.frame_samples) & 0xFFFFFFFF
+            speaker.timestamp = timestamp
+            try:
+                pcm = speaker.decoder.decode(payload)
+            except Exception as e:
+                logging.debug(f"Voice decode failed for SSRC {ssrc}: {e}")
+                continue
+            frames.append(VoiceFrame(ssrc, sequence, timestamp, pcm, pcm=True))
+        return frames
+
+    def _decoded(self, ssrc, speaker, future):
+        speaker.decoding = False
+        if future.cancelled() or self.closed:
+            return
+        if future.exception() is not None:
+            logging.error(f"Voice decode batch failed for SSRC {ssrc}: {future.exception()}")
+        else:
+            for frame in future.result():
+                self._put(ssrc, speaker, frame)
+        if speaker.pending:
+            self._start_decode(ssrc, speaker)
+
+    def _put(self, ssrc, speaker, frame):
+        user_id = speaker.user_id or self.client.ssrc_map.get(ssrc)
+        try:
+            self.queue.put_nowait((user_id, frame))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def stats(self):
+        return {
+            "speakers": len(self.speakers),
+            "received": self.received,
+            "invalid": self.invalid,
+            "dropped": self.dropped,
+            "lost": sum(speaker.jitter.lost for speaker in self.speakers.values()),
+            "late": sum(speaker.jitter.late for speaker in self.speakers.values()),
+            "queued": self.queue.qsize()
+        }
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+        item = await self.queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._flush_handle.cancel()
+        if self.client.receiver is self:
+            self.client.receiver = None
+            if self.client.transport is not None:
+                self.client.transport.on_packet = None
+        if self._own_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        try:
+            self.queue.put_nowait(None)  # Wakes the consumer
+        except asyncio.QueueFull:
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
@@ -0,0 +1,253 @@
+"""
+UDP side of a voice connection.
+
+VoiceTransport wraps a non-blocking asyncio datagram endpoint connected to
+the voice server (IP discovery included), or a route on a socket shared
+through a UDPSocketPool when many connections run in one process. FramePacer schedules 20 ms frames
+against the monotonic clock: a frame is due at start + the summed duration
+of the frames before it, so sleep overshoot never accumulates, and it
+records how late each frame went out.
+
+SEE: https://discord.com/developers/docs/topics/voice-connections#ip-discovery
+"""
+
+import time
+import asyncio
+import logging
+from struct import pack, unpack_from
+
+FRAME_DURATION = 0.02           # 20 ms of audio per packet
+SAMPLES_PER_FRAME = 960         # 48 kHz * 20 ms
+DISCOVERY_REQUEST = 0x1
+DISCOVERY_RESPONSE = 0x2
+DISCOVERY_LENGTH = 70
+
+
+class VoiceProtocol(asyncio.DatagramProtocol):
+    def __init__(self, transport):
+        self.owner = transport
+
+    def connection_made(self, transport):
+        self.owner._transport = transport
+
+    def datagram_received(self, data, addr):
+        self.owner._datagram_received(data)
+
+    def error_received(self, exc):
+        logging.warning(f"Voice UDP error: {exc}")
+
+    def connection_lost(self, exc):
+        self.owner._transport = None
+
+
+class SharedSocketProtocol(asyncio.DatagramProtocol):
+    """
+    One unconnected UDP socket serving several voice connections. Incoming
+    datagrams are routed by source address, then by SSRC when several
+    connections talk to the same voice server.
+    """
+    def __init__(self):
+        self.transport = None
+        self.routes = {}  # (ip, port) -> [VoiceTransport]
+        self.count = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        owners = self.routes.get(addr[:2])
+        if not owners:
+            return
+        if len(owners) > 1 and len(data) >= 12:
+            # IP discovery answers carry our SSRC at offset 4, RTP at offset 8
+            ssrc = unpack_from('>I', data, 4 if unpack_from('>H', data)[0] == DISCOVERY_RESPONSE else 8)[0]
+            for owner in owners:
+                if owner.claims(ssrc):
+                    owner._datagram_received(data)
+                    return
+        owners[0]._datagram_received(data)
+
+    def error_received(self, exc):
+        logging.warning(f"Voice UDP error: {exc}")
+
+    def connection_lost(self, exc):
+        for owners in self.routes.values():
+            for owner in owners:
+                owner._transport = None
+        self.routes.clear()
+        self.count = 0
+        self.transport = None
+
+
+class UDPSocketPool:
+    def __init__(self, size=4):
+        """
+        Args:
+            size (int): Max sockets; connections go to the least loaded one.
+        """
+        self.size = size
+        self.sockets = []
+
+    async def attach(self, owner, addr):
+        open_sockets = [sock for sock in self.sockets if sock.transport is not None]
+        if len(open_sockets) < self.size and all(sock.count for sock in open_sockets):
+            loop = asyncio.get_running_loop()
+            _, sock = await loop.create_datagram_endpoint(SharedSocketProtocol, local_addr=("0.0.0.0", 0))
+            self.sockets.append(sock)
+            open_sockets.append(sock)
+        sock = min(open_sockets, key=lambda candidate: candidate.count)
+        sock.routes.setdefault(addr, []).append(owner)
+        sock.count += 1
+        return sock
+
+    def detach(self, owner):
+        for sock in self.sockets:
+            for addr, owners in list(sock.routes.items()):
+                if owner in owners:
+                    owners.remove(owner)
+                    sock.count -= 1
+                    if not owners:
+                        del sock.routes[addr]
+
+    def close(self):
+        for sock in self.sockets:
+            if sock.transport is not None:
+                sock.transport.close()
+        self.sockets.clear()
+
+
+class VoiceTransport:
+    def __init__(self):
+        self._transport = None
+        self._addr = None   # Destination when sending through a shared socket
+        self._pool = None
+        self._discovery = None
+        self.ssrc = None
+        self.remote_ssrcs = set()  # SSRCs of other speakers, filled by the receive path
+        self.on_packet = None  # Callback for incoming voice packets, set by the receive path
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+    @property
+    def closed(self):
+        return self._transport is None or self._transport.is_closing()
+
+    async def open(self, ip, port, pool=None):
+        if pool is not None:
+            self._pool = pool
+            self._addr = (ip, port)
+            self._transport = (await pool.attach(self, self._addr)).transport
+            return
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: VoiceProtocol(self), remote_addr=(ip, port))
+
+    async def discover_ip(self, ssrc, timeout=5.0):
+        """
+        Asks the voice server which address and port it sees us on.
+
+        Returns:
+            tuple: (external ip, external port)
+        """
+        self.ssrc = ssrc
+        self._discovery = asyncio.get_running_loop().create_future()
+        request = pack('>HHI', DISCOVERY_REQUEST, DISCOVERY_LENGTH, ssrc) + bytes(66)
+        try:
+            for _ in range(3):
+                self._transport.sendto(request, self._addr)
+                try:
+                    response = await asyncio.wait_for(asyncio.shield(self._discovery), timeout / 3)
+                    break
+                except asyncio.TimeoutError:
+                    logging.debug("IP discovery timed out, retrying")
+            else:
+                raise TimeoutError("Voice IP discovery got no answer")
+        finally:
+            self._discovery = None
+        ip = response[8:72].split(b'\x00', 1)[0].decode('ascii')
+        port = unpack_from('>H', response, 72)[0]
+        return ip, port
+
+    def claims(self, ssrc):
+        return ssrc == self.ssrc or ssrc in self.remote_ssrcs
+
+    def _datagram_received(self, data):
+        if self._discovery is not None and not self._discovery.done() and len(data) >= 74 \
+                and unpack_from('>H', data)[0] == DISCOVERY_RESPONSE:
+            self._discovery.set_result(data)
+        elif self.on_packet is not None:
+            self.on_packet(data)
+
+    def send(self, packet):
+        # Never blocks: the datagram goes to the kernel or is dropped, as UDP should
+        self._transport.sendto(packet, self._addr)
+        self.packets_sent += 1
+        self.bytes_sent += len(packet)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.detach(self)
+        elif self._transport is not None:
+            self._transport.close()
+        self._transport = None
+
+
+class FramePacer:
+    def __init__(self, frame_duration=FRAME_DURATION, resync_after=0.2):
+        """
+        Args:
+            frame_duration (float): Seconds between frames.
+            resync_after (float): When a frame is this late (e.g. the loop was
+                blocked), the schedule restarts from now instead of bursting
+                the backlog out.
+        """
+        self.frame_duration = frame_duration
+        self.resync_after = resync_after
+        self.start = None
+        self.offset = 0.0
+        self.frames = 0
+        self.late_frames = 0
+        self.resyncs = 0
+        self.max_lateness = 0.0
+        self.jitter = 0.0  # Smoothed mean deviation from the schedule (RFC 3550 style)
+
+    def reset(self):
+        self.start = time.monotonic()
+        self.offset = 0.0
+
+    def deadline(self):
+        return self.start + self.offset
+
+    async def wait(self, duration=None):
+        """
+        Sleeps until the next frame is due and records its lateness.
+
+        Args:
+            duration (float, optional): Length of this frame, frame_duration by default.
+        """
+        if self.start is None:
+            self.reset()
+        deadline = self.deadline()
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lateness = time.monotonic() - deadline
+        self.jitter += (abs(lateness) - self.jitter) / 16
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+        if lateness > self.frame_duration:
+            self.late_frames += 1
+        if lateness > self.resync_after:
+            self.resyncs += 1
+            self.reset()
+        self.offset += self.frame_duration if duration is None else duration
+        self.frames += 1
+        return lateness
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "late_frames": self.late_frames,
+            "resyncs": self.resyncs,
+            "jitter_ms": self.jitter * 1000,
+            "max_lateness_ms": self.max_lateness * 1000
+        }
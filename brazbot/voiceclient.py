@@ -1,43 +1,133 @@
+"""
+Voice connection.
+
+The voice websocket is owned by one connection task running a small state
+machine; it is the only reader of the socket, so every opcode is handled
+in one place:
+
+    connecting -> connected -> (closed by the server or a missed heartbeat ACK)
+        -> resuming (op 7)             same session, UDP and key kept
+        -> reconnecting (op 0)         new voice server (region move, 4014)
+                                       or new session (4006, 4009)
+        -> closed                      fatal close code or out of attempts
+
+While the connection is down, playback pauses instead of stopping: the
+sender waits and the FrameBuffer keeps its frames, so the track carries on
+from where it was once the session is back.
+
+SEE: https://discord.com/developers/docs/topics/voice-connections
+"""
+
 import aiohttp
 import asyncio
 import json
+import random
 import websockets
-import subprocess
-from subprocess import PIPE
-import nacl.secret
-import nacl.utils
-from struct import pack
 import logging
-import socket
+from brazbot.voice_transport import VoiceTransport, FramePacer, SAMPLES_PER_FRAME
+from brazbot.opus import packet_samples, SILENCE_FRAME, SAMPLE_RATE
+from brazbot.audio_sources import FFmpegOpusSource, FrameBuffer
+from brazbot.voice_crypto import PacketEncryptor, choose_mode
+from brazbot.voice_receive import VoiceReceiver
 
 logging.basicConfig(level=logging.DEBUG)
 
+# Connection states
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+RESUMING = "resuming"
+RECONNECTING = "reconnecting"
+CLOSED = "closed"
+
+# Recovery actions
+RESUME = "resume"        # op 7 on a new websocket to the same server
+IDENTIFY = "identify"    # op 0 to a new voice server, same voice session
+REJOIN = "rejoin"        # voice state update for a new session, then op 0
+
+SESSION_INVALID_CODES = frozenset((4006, 4009))  # Session no longer valid / timed out
+DISCONNECTED_CODE = 4014  # Voice server changed (region move), kicked or channel deleted
+FATAL_CODES = frozenset((4001, 4002, 4003, 4004, 4005, 4011, 4012, 4016))
+HEARTBEAT_MISSED_CODE = 4000  # Our close code for a dead socket; keeps the session resumable
+
+RECONNECT_ATTEMPTS = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+HANDSHAKE_TIMEOUT = 10.0
+SERVER_MOVE_TIMEOUT = 5.0  # How long a 4014 waits for the new VOICE_SERVER_UPDATE
+
+
 class VoiceClient:
-    def __init__(self, bot, channel):
+    def __init__(self, bot, channel, engine=None):
+        """
+        Args:
+            engine (VoiceEngine, optional): Shared sender loop and socket pool;
+                without one the client runs its own sender task.
+        """
         self.bot = bot
         self.channel = channel
+        self.engine = engine
         self.token = None
         self.session_id = None
         self.endpoint = None
         self.heartbeat_interval = None
         self.ws = None
+        self.state = DISCONNECTED
+        self.latency = None  # Seconds between the last heartbeat and its op 6 ACK
+        self.reconnects = 0
+        self.speaking = False
         self.guild_id = channel.guild_id
         self.ssrc = None
-        self._encoder_process = None
+        self.ssrc_map = {}  # SSRC of other speakers -> user id, from op 5
+        self.receiver = None
+        self.source = None
+        self.buffer = None
+        self.buffer_frames = 100  # Frames buffered ahead of the sender (20ms each)
+        self.track_cache = None  # Optional TrackCache for URLs played again
+        self._producer_task = None
         self._send_audio_task = None
+        self._connection_task = None
+        self._heartbeat_task = None
+        self._server_update_task = None
+        self._speaking_tasks = set()  # Re-announcements after a reconnect, kept referenced until done
+        self._heartbeat_nonce = None
+        self._heartbeat_sent = None
+        self._heartbeat_acked = True
+        self._ready = asyncio.Event()
+        self._server_update = asyncio.Event()
+        self._closing = False
         self.secret_key = None
+        self.modes = None  # Encryption modes offered by the voice server
+        self.mode = None
+        self.encryptor = None
         self._udp_ip = None
         self._udp_port = None
         self.bitrate = 64000  # Default bitrate in bits per second (64 kbps)
-        self.udp_socket = None
+        self.transport = None
+        self.pacer = FramePacer()
+        self.sequence = 0
+        self.timestamp = 0
         self.external_ip = None
         self.external_port = None
 
+    @property
+    def connected(self):
+        return self._ready.is_set()
+
     async def connect(self):
-        await self._update_voice_state()
-        await self._handle_voice_server_update()
-        await self._connect_to_websocket()
-        await self.identify()
+        """
+        Joins the channel and returns once the voice session is ready; from
+        then on the connection task keeps it up until disconnect().
+        """
+        self._closing = False
+        self.state = CONNECTING
+        self._server_update_task = asyncio.create_task(self._watch_server_updates())
+        try:
+            await self._open_session(REJOIN)
+        except BaseException:
+            await self.disconnect()
+            raise
+        self._connection_task = asyncio.create_task(self._run())
         await self.update_bitrate()
 
     async def update_bitrate(self):
@@ -54,6 +144,12 @@ class VoiceClient:
                 else:
                     logging.error(f"Failed to get channel info: {response.status}")
 
+    async def _join_channel(self):
+        # The server update may arrive before the state update; the watcher task catches it either way
+        self._server_update.clear()
+        await self._update_voice_state()
+        await self._handle_voice_server_update()
+
     async def _update_voice_state(self):
         voice_state_update = {
             "op": 4,
@@ -68,7 +164,8 @@ class VoiceClient:
 
         voice_state_update = await self.bot.wait_for(
             'VOICE_STATE_UPDATE',
-            check=self._check_voice_state_update
+            check=self._check_voice_state_update,
+            timeout=HANDSHAKE_TIMEOUT
         )
         
         if 'd' in voice_state_update:
@@ -76,23 +173,30 @@ class VoiceClient:
         else:
             raise Exception("Failed to update voice state")
 
-    async def _handle_voice_server_update(self):
-        voice_server_update = await self.bot.wait_for(
-            'VOICE_SERVER_UPDATE',
-            check=self._check_voice_server_update
-        )
-
-        if 'd' in voice_server_update:
-            self.endpoint = voice_server_update['d']['endpoint']
-            self.token = voice_server_update['d']['token']
-        else:
-            raise Exception("Failed to handle voice server update")
+    async def _handle_voice_server_update(self, timeout=HANDSHAKE_TIMEOUT):
+        await asyncio.wait_for(self._server_update.wait(), timeout)
+        self._server_update.clear()
 
+    def _set_voice_server(self, data):
+        self.endpoint = data['endpoint']
+        self.token = data['token']
         if not self.endpoint.startswith("wss://"):
             self.endpoint = "wss://" + self.endpoint
 
+    async def _watch_server_updates(self):
+        # Sole consumer of VOICE_SERVER_UPDATE for this guild; one arriving
+        # while connected is a region move: reconnect to the new server
+        while True:
+            event = await self.bot.wait_for('VOICE_SERVER_UPDATE', check=self._check_voice_server_update)
+            self._set_voice_server(event['d'])
+            self._server_update.set()
+            if self.state == CONNECTED and self.ws is not None:
+                logging.info(f"Voice server moved to {self.endpoint}")
+                await self.ws.close(code=DISCONNECTED_CODE)
+
     async def _connect_to_websocket(self):
-        self.ws = await websockets.connect(f"{self.endpoint}?v=4")
+        # A short close timeout: a dead socket should not hold up the resume
+        self.ws = await websockets.connect(f"{self.endpoint}?v=4", close_timeout=1)
 
     def _check_voice_state_update(self, event):
         if 'user_id' in event['d']:
@@ -102,7 +206,8 @@ class VoiceClient:
         return False
 
     def _check_voice_server_update(self, event):
-        return 'd' in event and event['d']['guild_id'] == self.channel.guild_id
+        # A null endpoint means the server is being allocated; a later update carries it
+        return event['d']['guild_id'] == self.channel.guild_id and event['d'].get('endpoint') is not None
 
     async def identify(self):
         payload = {
@@ -116,23 +221,16 @@ class VoiceClient:
         }
         await self.ws.send(json.dumps(payload))
 
-        while True:
-            response = await self.ws.recv()
-            response_data = json.loads(response)
-
-            if response_data['op'] == 5:
-                self.ssrc = response_data['d']['ssrc']
-
-            if response_data['op'] == 8:  # Opcode 8: Hello
-                self.heartbeat_interval = response_data['d']['heartbeat_interval']
-                asyncio.create_task(self.heartbeat())
-
-            if response_data['op'] == 2:  # Opcode 2: Ready
-                self._udp_ip = response_data['d']['ip']
-                self._udp_port = response_data['d']['port']
-                self.ssrc = response_data['d']['ssrc']
-                await self.setup_udp_connection()
-                break
+    async def resume(self):
+        payload = {
+            "op": 7,
+            "d": {
+                "server_id": str(self.guild_id),
+                "session_id": str(self.session_id),
+                "token": self.token
+            }
+        }
+        await self.ws.send(json.dumps(payload))
 
     async def select_protocol(self):
         payload = {
@@ -142,253 +240,391 @@ class VoiceClient:
                 "data": {
                     "address": self.external_ip,
                     "port": self.external_port,
-                    "mode": "xsalsa20_poly1305"  # Escolha do modo
+                    "mode": choose_mode(self.modes)  # Escolha do modo
                 }
             }
         }
         await self.ws.send(json.dumps(payload))
 
-        while True:
-            response = await self.ws.recv()
-            response_data = json.loads(response)
-            if response_data['op'] == 4:  # Opcode 4: Session Description
-                self.secret_key = response_data['d']['secret_key']
-                break
+    async def _handle(self, message):
+        op = message['op']
+        data = message.get('d')
+
+        if op == 8:  # Opcode 8: Hello
+            self.heartbeat_interval = data['heartbeat_interval']
+            self._stop_heartbeat()
+            self._heartbeat_task = asyncio.create_task(self.heartbeat())
+
+        elif op == 6:  # Opcode 6: Heartbeat ACK
+            if data == self._heartbeat_nonce and self._heartbeat_sent is not None:
+                self.latency = asyncio.get_running_loop().time() - self._heartbeat_sent
+            self._heartbeat_acked = True
+
+        elif op == 2:  # Opcode 2: Ready
+            self._udp_ip = data['ip']
+            self._udp_port = data['port']
+            self.ssrc = data['ssrc']
+            self.modes = data.get('modes')
+            await self.setup_udp_connection()
+
+        elif op == 4:  # Opcode 4: Session Description
+            self.secret_key = data['secret_key']
+            self.mode = data.get('mode', choose_mode(self.modes))
+            # One cipher and set of packet buffers for the whole session
+            self.encryptor = PacketEncryptor(self.mode, self.secret_key, self.ssrc)
+            self._session_ready()
+
+        elif op == 9:  # Opcode 9: Resumed
+            logging.info("Voice session resumed")
+            self._session_ready()
+
+        elif op == 5:  # Opcode 5: Speaking (another user), maps their SSRC
+            self.ssrc_map[data['ssrc']] = data['user_id']
+            if self.transport is not None:
+                self.transport.remote_ssrcs.add(data['ssrc'])
+
+        elif op == 13:  # Opcode 13: Client Disconnect
+            for ssrc, user_id in list(self.ssrc_map.items()):
+                if user_id == data['user_id']:
+                    if self.receiver is not None:
+                        self.receiver.remove_speaker(ssrc)
+                    del self.ssrc_map[ssrc]
+                    if self.transport is not None:
+                        self.transport.remote_ssrcs.discard(ssrc)
+
+        else:
+            logging.debug(f"Voice gateway op {op}: {data}")
+
+    def _session_ready(self):
+        self.state = CONNECTED
+        self._ready.set()
+        if self.speaking:
+            # A new SSRC (or a resumed socket) must be announced before audio flows again
+            task = asyncio.create_task(self.set_speaking(True))
+            self._speaking_tasks.add(task)
+            task.add_done_callback(self._speaking_done)
+
+    def _speaking_done(self, task):
+        self._speaking_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Could not re-announce speaking for guild {self.guild_id}: {task.exception()}")
 
     async def heartbeat(self):
+        """
+        Sends op 3 every interval; a heartbeat still unacknowledged when the
+        next one is due means the socket is dead, and it is closed so the
+        connection task resumes.
+        """
+        loop = asyncio.get_running_loop()
+        ws = self.ws
+        self._heartbeat_acked = True
         try:
-            while self.heartbeat_interval is not None:
+            while True:
                 await asyncio.sleep(self.heartbeat_interval / 1000)
-                await self.ws.send(json.dumps({"op": 3, "d": None}))
-        except websockets.exceptions.ConnectionClosedError as e:
-            logging.error(f"Heartbeat error: {e}. Attempting to reconnect.")
-            await self.resume()
-
-    async def reconnect(self, new_session=False):
-        logging.debug("Reconectando...")
-        await self.disconnect()
-        if new_session:
-            self.session_id = None
-            await self.connect()
+                if not self._heartbeat_acked:
+                    logging.warning(f"Voice heartbeat not acknowledged for guild {self.guild_id}; reconnecting")
+                    await ws.close(code=HEARTBEAT_MISSED_CODE)
+                    return
+                self._heartbeat_acked = False
+                self._heartbeat_nonce = int(loop.time() * 1000)
+                self._heartbeat_sent = loop.time()
+                await ws.send(json.dumps({"op": 3, "d": self._heartbeat_nonce}))
+        except websockets.exceptions.ConnectionClosed:
+            pass  # The connection task sees the close and recovers
+
+    def _stop_heartbeat(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    async def _open_session(self, action):
+        """
+        One handshake on a new websocket, until the session is usable.
+
+        Returns:
+            bool: False when a 4014 was not followed by a new voice server,
+                i.e. we were kicked or the channel is gone.
+        """
+        self._ready.clear()
+        if action == REJOIN:
+            self.state = CONNECTING if self.state == CONNECTING else RECONNECTING
+            await self._join_channel()
+        elif action == IDENTIFY:
+            self.state = RECONNECTING
+            try:
+                await self._handle_voice_server_update(SERVER_MOVE_TIMEOUT)
+            except asyncio.TimeoutError:
+                return False
         else:
-            await self.resume()
+            self.state = RESUMING
 
-    async def resume(self):
-        logging.debug("Tentando retomar a sessão")
+        await self._connect_to_websocket()
+        if action == RESUME:
+            await self.resume()
+        else:
+            await self.identify()
+        while not self._ready.is_set():
+            message = await asyncio.wait_for(self.ws.recv(), HANDSHAKE_TIMEOUT)
+            await self._handle(json.loads(message))
+        return True
+
+    async def _poll(self):
+        """
+        Handles voice gateway messages until the websocket closes.
+
+        Returns:
+            int: The close code, None when the socket failed without one.
+        """
         try:
-            await self._connect_to_websocket()
-            payload = {
-                "op": 7,
-                "d": {
-                    "server_id": str(self.guild_id),
-                    "session_id": str(self.session_id),
-                    "token": self.token
-                }
-            }
-            await self.ws.send(json.dumps(payload))
+            async for message in self.ws:
+                await self._handle(json.loads(message))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        return self.ws.close_code
+
+    def _recovery(self, code, action, attempt):
+        # What to do after the websocket closed with `code`
+        if code in FATAL_CODES:
+            return None
+        if code in SESSION_INVALID_CODES:
+            return REJOIN
+        if code == DISCONNECTED_CODE or self._server_update.is_set():
+            return IDENTIFY
+        if code is None and action is not None:
+            # The attempt itself failed (network, timeout); resume twice at most
+            return REJOIN if action == RESUME and attempt >= 2 else action
+        return RESUME
+
+    @staticmethod
+    def _backoff(attempt):
+        if attempt == 0:
+            return 0
+        return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    async def _close_websocket(self):
+        self._ready.clear()
+        self._stop_heartbeat()
+        if self.ws is not None:
+            await self.ws.close()
 
-            while True:
-                response = await self.ws.recv()
-                response_data = json.loads(response)
-
-                if response_data['op'] == 9:  # Opcode 9: Resumed
-                    logging.info("Sessão retomada com sucesso.")
-                    break
-                elif response_data['op'] == 8:  # Opcode 8: Hello
-                    self.heartbeat_interval = response_data['d']['heartbeat_interval']
-                    asyncio.create_task(self.heartbeat())
-                    break
-                elif response_data['op'] == 4:
-                    # Handle Session Description if needed
-                    pass
+    async def _run(self):
+        """
+        Connection task: watches the websocket and resumes or reconnects it
+        with backoff, one attempt at a time, until disconnect().
+        """
+        action = None
+        attempt = 0
+        code = None
+        while not self._closing:
+            if action is None:
+                code = await self._poll()
+            else:
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                try:
+                    if not await self._open_session(action):
+                        break
+                except asyncio.CancelledError:
+                    raise
+                except websockets.exceptions.ConnectionClosed:
+                    code = self.ws.close_code
+                except Exception as e:
+                    logging.warning(f"Voice {action} failed for guild {self.guild_id}: {e!r}")
+                    code = None
                 else:
-                    logging.error(f"Erro ao retomar a sessão: {response_data}")
-                    await self.reconnect(new_session=True)
-                    break
-        except websockets.exceptions.ConnectionClosedError as e:
-            logging.error(f"ConnectionClosedError: {e}. Tentando reconectar.")
-            await self.reconnect(new_session=True)
-        except Exception as e:
-            logging.error(f"Erro durante retomar sessão: {e}")
-            await self.reconnect(new_session=True)
+                    logging.info(f"Voice connection for guild {self.guild_id} back after {action}")
+                    self.reconnects += 1
+                    action = None
+                    attempt = 0
+                    continue
+
+            await self._close_websocket()
+            if self._closing:
+                break
+            action = self._recovery(code, action, attempt)
+            if action is None or attempt >= RECONNECT_ATTEMPTS:
+                break
+            logging.warning(f"Voice websocket closed ({code}) for guild {self.guild_id}; trying {action}")
+
+        if not self._closing:
+            logging.error(f"Voice connection for guild {self.guild_id} lost (close code {code})")
+            self._connection_task = None  # disconnect() must not cancel the task running it
+            await self.disconnect()
 
     async def disconnect(self):
-        if self.heartbeat_interval:
-            self.heartbeat_interval = None
+        self._closing = True
+        self._ready.clear()
+        self.state = CLOSED
+        await self.stop()
+        if self.receiver is not None:
+            self.receiver.close()
+        tasks = [task for task in (self._connection_task, self._server_update_task) if task is not None]
+        tasks.extend(self._speaking_tasks)
+        self._connection_task = self._server_update_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._stop_heartbeat()
+        self.heartbeat_interval = None
 
         if self.ws:
             await self.ws.close()
             self.ws = None
 
-    async def play(self, source_url):
-        logging.debug("play 1")
-        async with aiohttp.ClientSession() as session:
-            async with session.get(source_url) as response:
-                logging.debug("play 2")
-                if response.status == 200:
-                    logging.debug("play 3")
-                    try:
-                        logging.debug("Creating ffmpeg process")
-                        ffmpeg_process = await self.create_ffmpeg_process()
-                        logging.debug(f"play 3: {ffmpeg_process}")
-
-                        if ffmpeg_process is None:
-                            logging.error("Process creation failed")
-                            return
-                        logging.debug("play 4")
-                        self._encoder_process = ffmpeg_process  # Ensure _encoder_process is set
-                        logging.debug(f"play 5: {self._encoder_process}")
-
-                        async for chunk in response.content.iter_chunked(1024):
-                            logging.debug("play 6")
-                            if ffmpeg_process.stdin is not None:
-                                logging.debug("play 7")
-                                ffmpeg_process.stdin.write(chunk)
-                                logging.debug("play 8")
-                            else:
-                                raise Exception("ffmpeg_process.stdin is None")
-                        logging.debug("play 9")
-                        ffmpeg_process.stdin.close()
-                        logging.debug("play 10")
-                        #await self._read_process_output(ffmpeg_process, "ffmpeg")
-                        logging.debug("play 11")
-                        if self._encoder_process:
-                            logging.debug("play 12")
-                            self._send_audio_task = asyncio.create_task(self.send_audio_packets())
-                            logging.debug("play 13")
-                    except Exception as e:
-                        logging.error(f"Error in play: {e}")
-                else:
-                    logging.error(f"Failed to fetch audio from URL: {response.status}")
-
-    async def create_ffmpeg_process(self):
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+    def listen(self, decode=False, **options):
+        """
+        Starts receiving the other speakers' audio.
+
+        Args:
+            decode (bool): Yield PCM (s16le, 48 kHz stereo) instead of Opus packets.
+            **options: depth, max_queue, executor or workers, see VoiceReceiver.
+
+        Returns:
+            VoiceReceiver: Async iterator of (user id, VoiceFrame); close() to stop.
+        """
+        if self.receiver is not None:
+            self.receiver.close()
+        self.receiver = VoiceReceiver(self, decode, **options)
+        if self.transport is not None:
+            self.transport.on_packet = self.receiver.packet_received
+        return self.receiver
+
+    async def play(self, source_url, codec=None):
+        """
+        Starts playback and returns as soon as the pipeline is running: the
+        first frame is sent while the rest is still downloading.
+
+        Args:
+            source_url (str or source): Audio URL, or a source object with a
+                frames() async iterator (e.g. OpusPassthroughSource), which is
+                sent as is without ffmpeg.
+            codec (str, optional): "opus" when the source already is Opus
+                (WebM/Ogg); it is then remuxed, not transcoded.
+        """
+        await self.stop()
+        source = self.create_source(source_url, codec)
+        self.source = source
+        buffer = FrameBuffer(self.buffer_frames)
+        self._producer_task = asyncio.create_task(buffer.fill(source.frames()))
+        self.start_sending(buffer)
+
+    def create_source(self, source_url, codec=None):
+        """
+        Source for a URL: from the track cache when one is set, else ffmpeg.
+        Source objects are returned as they are.
+        """
+        if not isinstance(source_url, str):
+            return source_url
+        if self.track_cache is not None:
+            return self.track_cache.source(source_url, self.bitrate, codec)
+        return FFmpegOpusSource(source_url, self.bitrate, codec)
+
+    def start_sending(self, buffer):
+        """
+        Sends frames from `buffer` (a FrameBuffer or anything with the same
+        get/get_nowait/exhausted interface, like a Player stream) until it is
+        exhausted.
+
+        Returns:
+            Awaitable: Done when the buffer has been sent out.
+        """
+        self.buffer = buffer
+        if self.engine is not None:
+            return self.engine.add(self, buffer)
+        self._send_audio_task = asyncio.create_task(self.send_audio_packets(buffer))
+        return self._send_audio_task
+
+    def _next_packet(self, frame, samples=SAMPLES_PER_FRAME):
+        packet = self.encryptor.encrypt(self.sequence, self.timestamp, frame)
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        self.timestamp = (self.timestamp + samples) & 0xFFFFFFFF  # 960 for 20ms at 48kHz
+        return packet
+
+    async def send_audio_packets(self, frames):
+        """
+        Paced sender stage.
+
+        Args:
+            frames (async iterator): Opus packets, usually a FrameBuffer.
+        """
+        speaking = False
         try:
-            logging.debug("create_ffmpeg_process 1")
-            ffmpeg_process = await asyncio.create_subprocess_exec(
-                'ffmpeg',
-                '-i', 'pipe:0',  # Entrada de áudio a partir do pipe
-                '-f', 's16le',
-                '-ar', '48000',
-                '-ac', '2',
-                '-b:a', str(self.bitrate),  # Configure the bitrate
-                'pipe:1',  # Saída de áudio para pipe
-                stdin=PIPE,
-                stdout=PIPE,
-                stderr=PIPE,
-                bufsize=0  # Setting bufsize to 0 as required
-            )
-            logging.debug(f"create_ffmpeg_process 2: {ffmpeg_process}")
-            logging.debug(f"ffmpeg process created with PID: {ffmpeg_process.pid}")
-            return ffmpeg_process
-
+            async for frame in frames:
+                if not speaking:
+                    # The clock starts with the first frame: ffmpeg's start-up
+                    # must not make the opening frames late
+                    await self.set_speaking(True)
+                    self.pacer.reset()
+                    speaking = True
+                samples = packet_samples(frame) or SAMPLES_PER_FRAME
+                packet = self._next_packet(frame, samples)
+                # Each frame goes out at start + duration of all frames before it,
+                # whatever the previous sleeps overshot
+                await self.pacer.wait(samples / SAMPLE_RATE)
+                if not self._ready.is_set():
+                    # Voice connection down: hold the frame (and the buffer behind it) until it is back
+                    await self._ready.wait()
+                    self.pacer.reset()
+                    packet = self._next_packet(frame, samples)  # The session key may have changed
+                self.transport.send(packet)
         except Exception as e:
-            logging.error(f"Failed to create ffmpeg process: {e}")
-            return None
+            logging.error(f"Error while sending audio packets: {e}")
+        finally:
+            await frames.aclose()
 
-    async def _read_process_output(self, process, name):
-        logging.debug(f"Reading stdout for process: {name}")
-        if process.stdout is not None:
-            while True:
-                line = await process.stdout.read(1024)
-                if not line:
-                    break
-                try:
-                    logging.debug(f"{name} stdout: {line}")
-                except Exception as e:
-                    logging.error(f"Error reading {name} stdout: {e}")
-
-        if process.stderr is not None:
-            logging.debug(f"Reading stderr for process: {name}")
-            while True:
-                line = await process.stderr.read(1024)
-                if not line:
-                    break
-                try:
-                    logging.debug(f"{name} stderr: {line.decode('utf-8', errors='replace')}")
-                except Exception as e:
-                    logging.error(f"Error reading {name} stderr: {e}")
-
-    async def send_audio_packets(self):
-        sequence_number = 0
-        timestamp = 0
-        await self.set_speaking(True)
-        while self._encoder_process is not None:
-            try:
-                data = await self._encoder_process.stdout.read(3840)  # 20ms de áudio
-                if not data:
-                    stderr_output = await self._encoder_process.stderr.read()
-                    logging.debug(f"ffmpeg stderr: {stderr_output.decode()}")
-                    break
-                logging.debug(f"Sending audio packet with sequence number: {sequence_number}")
-
-                header = bytearray(12)
-                header[0] = 0x80
-                header[1] = 0x78
-                header[2:4] = pack('>H', sequence_number)  # Sequence number
-                header[4:8] = pack('>I', timestamp)  # Timestamp
-                header[8:12] = pack('>I', self.ssrc)  # SSRC
-
-                packet = self.encrypt_packet(header, data)
-                await self.ws.send(packet)
-
-                sequence_number += 1
-                timestamp += 960  # 48kHz / 50fps = 960
-
-                await asyncio.sleep(0.02)
-
-            except websockets.exceptions.ConnectionClosedError as e:
-                if e.code == 4006:
-                    logging.error("Error 4006: Session is no longer valid. Attempting to reconnect.")
-                    await self.resume()
-                else:
-                    logging.error(f"ConnectionClosedError: {e}")
-                break
-            except Exception as e:
-                logging.error(f"Error while sending audio packets: {e}")
-                break
-
-        await self.send_silence()
-        await self.set_speaking(False)
+        if speaking:
+            await self.send_silence()
+            await self.set_speaking(False)
+        logging.debug(f"Voice send stats: {self.voice_stats()}")
 
     async def send_silence(self):
-        silence_frame = b'\xF8\xFF\xFE' * 5
+        # Five silence frames keep the receiving decoder from interpolating
         for _ in range(5):
             try:
-                header = bytearray(12)
-                header[0] = 0x80
-                header[1] = 0x78
-                header[2:4] = pack('>H', 0)  # Sequence number
-                header[4:8] = pack('>I', 0)  # Timestamp
-                header[8:12] = pack('>I', self.ssrc)  # SSRC
-
-                packet = self.encrypt_packet(header, silence_frame)
-                await self.ws.send(packet)
-                await asyncio.sleep(0.02)
+                packet = self._next_packet(SILENCE_FRAME)
+                await self.pacer.wait()
+                self.transport.send(packet)
             except Exception as e:
                 logging.error(f"Error while sending silence: {e}")
 
+    def voice_stats(self):
+        """
+        Pacing, buffer, transport and gateway counters: frames, late_frames,
+        resyncs, jitter_ms, max_lateness_ms, buffered, underruns, packets_sent,
+        bytes_sent, state, ws_latency_ms and reconnects.
+        """
+        stats = self.pacer.stats()
+        stats["state"] = self.state
+        stats["ws_latency_ms"] = self.latency * 1000 if self.latency is not None else None
+        stats["reconnects"] = self.reconnects
+        if self.buffer is not None:
+            stats["buffered"] = len(self.buffer)
+            stats["underruns"] = self.buffer.underruns
+        if self.transport is not None:
+            stats["packets_sent"] = self.transport.packets_sent
+            stats["bytes_sent"] = self.transport.bytes_sent
+        return stats
+
     async def setup_udp_connection(self):
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udp_socket.setblocking(False)
-        self.udp_socket.sendto(b'\x01\x00\x00\x00' + pack('>I', self.ssrc), (self._udp_ip, self._udp_port))
-        
-        def parse_ip_and_port(response):
-            ip = response[8:72].split(b'\x00', 1)[0].decode('ascii')
-            port = int.from_bytes(response[72:74], 'big')
-            return ip, port
-        
-        response = await asyncio.get_event_loop().sock_recv(self.udp_socket, 1024)
-        self.external_ip, self.external_port = parse_ip_and_port(response)
+        if self.transport is not None:
+            self.transport.close()  # New session after a reconnect: new SSRC and address
+        self.transport = VoiceTransport()
+        self.transport.remote_ssrcs.update(self.ssrc_map)
+        if self.receiver is not None:
+            self.transport.on_packet = self.receiver.packet_received
+        await self.transport.open(self._udp_ip, self._udp_port, pool=self.engine.pool if self.engine is not None else None)
+        self.external_ip, self.external_port = await self.transport.discover_ip(self.ssrc)
+        logging.debug(f"Voice UDP discovered as {self.external_ip}:{self.external_port}")
         await self.select_protocol()
 
-    def encrypt_packet(self, header, data):
-        nonce = bytearray(24)
-        nonce[:12] = header
-        box = nacl.secret.SecretBox(bytes(self.secret_key))
-        encrypted = box.encrypt(bytes(data), bytes(nonce)).ciphertext
-        return header + encrypted
-
     async def set_speaking(self, speaking):
+        self.speaking = speaking
+        if not self._ready.is_set():
+            return  # Sent once the session is back
         payload = {
             "op": 5,
             "d": {
@@ -397,13 +633,17 @@ class VoiceClient:
                 "ssrc": self.ssrc
             }
         }
-        await self.ws.send(json.dumps(payload))
+        try:
+            await self.ws.send(json.dumps(payload))
+        except websockets.exceptions.ConnectionClosed:
+            pass  # The connection task re-sends it after recovering
 
     async def stop(self):
-        if self._encoder_process:
-            self._encoder_process.terminate()
-            self._encoder_process = None
-        if self._send_audio_task:
-            self._send_audio_task.cancel()
-            self._send_audio_task = None
-
+        if self.engine is not None:
+            self.engine.remove(self)
+        tasks = [task for task in (self._producer_task, self._send_audio_task) if task is not None]
+        self._producer_task = self._send_audio_task = None
+        for task in tasks:
+            task.cancel()
+        # Let the stages run their cleanup (ffmpeg is killed by its source)
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,167 @@
+"""
+Minimal streaming WebM (Matroska) demuxer for Opus audio.
+
+Walks the EBML element tree from an async stream, descending only into the
+containers that lead to audio blocks (Segment, Tracks, Cluster, BlockGroup),
+finds the A_OPUS track and yields its frames. Everything else is skipped, so
+only the audio bytes are kept in memory. Unknown-size Segments and Clusters
+(live streams) are supported.
+
+SEE: https://www.matroska.org/technical/elements.html
+"""
+
+import asyncio
+import logging
+
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+CODEC_ID = 0x86
+CLUSTER = 0x1F43B675
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+SIMPLE_BLOCK = 0xA3
+
+# Containers we read into instead of skipping
+MASTERS = frozenset((SEGMENT, TRACKS, TRACK_ENTRY, CLUSTER, BLOCK_GROUP))
+
+UNKNOWN_SIZE = -1
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+
+
+class WebMError(Exception):
+    pass
+
+
+async def _read_vint(stream, keep_marker):
+    first = (await stream.readexactly(1))[0]
+    if first == 0:
+        raise WebMError("Invalid EBML variable-length integer")
+    length = 1
+    mask = 0x80
+    while not first & mask:
+        mask >>= 1
+        length += 1
+    value = first if keep_marker else first & (mask - 1)
+    all_ones = (first & (mask - 1)) == mask - 1
+    if length > 1:
+        rest = await stream.readexactly(length - 1)
+        for byte in rest:
+            value = (value << 8) | byte
+            all_ones = all_ones and byte == 0xFF
+    if not keep_marker and all_ones:
+        return UNKNOWN_SIZE
+    return value
+
+
+async def read_element_header(stream):
+    """
+    Returns:
+        tuple: (element id, data size or UNKNOWN_SIZE), or None at end of stream.
+    """
+    try:
+        element_id = await _read_vint(stream, keep_marker=True)
+    except asyncio.IncompleteReadError:
+        return None
+    return element_id, await _read_vint(stream, keep_marker=False)
+
+
+async def _skip(stream, size):
+    while size > 0:
+        chunk = await stream.readexactly(min(size, 65536))
+        size -= len(chunk)
+
+
+def _block_frames(block, track):
+    """
+    Frames of a (Simple)Block belonging to `track`, [] for other tracks.
+    """
+    view = memoryview(block)
+    first = view[0]
+    length = 1
+    mask = 0x80
+    while not first & mask:
+        mask >>= 1
+        length += 1
+    number = first & (mask - 1)
+    for byte in view[1:length]:
+        number = (number << 8) | byte
+    if number != track:
+        return []
+    flags = view[length + 2]
+    data = view[length + 3:]
+    lacing = (flags >> 1) & 0x03
+    if lacing == 0:
+        return [data]
+    count = data[0] + 1
+    data = data[1:]
+    if lacing == 2:  # Fixed-size lacing
+        size = len(data) // count
+        return [data[i * size:(i + 1) * size] for i in range(count)]
+    if lacing == 1:  # Xiph lacing
+        sizes = []
+        offset = 0
+        for _ in range(count - 1):
+            size = 0
+            while True:
+                byte = data[offset]
+                offset += 1
+                size += byte
+                if byte != 255:
+                    break
+            sizes.append(size)
+        frames = []
+        for size in sizes:
+            frames.append(data[offset:offset + size])
+            offset += size
+        frames.append(data[offset:])
+        return frames
+    raise WebMError("EBML-laced blocks are not supported")
+
+
+async def webm_opus_packets(stream):
+    """
+    Async iterator over the Opus frames of the first A_OPUS track of a WebM stream.
+
+    Args:
+        stream: Object with an async readexactly(n) method.
+    """
+    header = await read_element_header(stream)
+    if header is None or header[0] != EBML_HEADER:
+        raise WebMError("Not a WebM/Matroska stream")
+    await _skip(stream, header[1])
+
+    track = None
+    entry_number = entry_codec = None
+    while True:
+        header = await read_element_header(stream)
+        if header is None:
+            return
+        element_id, size = header
+
+        if element_id in MASTERS:
+            if element_id == TRACK_ENTRY:
+                entry_number = entry_codec = None
+            continue  # Read its children in place
+        if element_id == TRACK_NUMBER:
+            entry_number = int.from_bytes(await stream.readexactly(size), 'big')
+        elif element_id == CODEC_ID:
+            entry_codec = bytes(await stream.readexactly(size)).rstrip(b"\x00").decode('ascii')
+        elif element_id in (SIMPLE_BLOCK, BLOCK):
+            block = await stream.readexactly(size)
+            if track is None:
+                raise WebMError("Media block found before an Opus track")
+            for frame in _block_frames(block, track):
+                yield frame
+            continue
+        elif size == UNKNOWN_SIZE:
+            raise WebMError(f"Unknown-size element {element_id:#x} cannot be skipped")
+        else:
+            await _skip(stream, size)
+            continue
+
+        if track is None and entry_number is not None and entry_codec == "A_OPUS":
+            track = entry_number
+            logging.debug(f"WebM Opus track: {track}")
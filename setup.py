@@ -13,6 +13,10 @@ setup(
     install_requires=[
         "aiohttp"
     ],
+    extras_require={
+        "redis": ["msgpack"],
+        "voice": ["pynacl", "cryptography"]
+    },
     entry_points={
         'console_scripts': [
             'brazbot = brazbot.bot:main',
@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from brazbot.checks import CheckFailure, checks_ran
+from brazbot.decorators import is_admin, rate_limit
+from brazbot.permissions import PermissionResolver, ADMINISTRATOR
+
+GUILD_ID = "1"
+
+
+def make_ctx(user_id, role_ids=()):
+    permissions = PermissionResolver()
+    permissions.load_guild({
+        "id": GUILD_ID,
+        "owner_id": "100",
+        "roles": [
+            {"id": GUILD_ID, "name": "@everyone", "permissions": "0"},
+            {"id": "2", "name": "Admin", "permissions": str(ADMINISTRATOR)}
+        ]
+    })
+    bot = SimpleNamespace(permissions=permissions)
+    return SimpleNamespace(
+        bot=bot, guild_id=GUILD_ID, channel_id="10", author={"id": user_id},
+        member={"roles": list(role_ids)}
+    )
+
+
+def test_is_admin_applies_to_direct_calls():
+    calls = []
+
+    @is_admin()
+    async def handler(ctx):
+        calls.append(ctx.author["id"])
+
+    with pytest.raises(CheckFailure):
+        asyncio.run(handler(make_ctx("200")))
+    asyncio.run(handler(make_ctx("201", ["2"])))
+    assert calls == ["201"]
+
+
+def test_checks_already_run_are_skipped_once():
+    @rate_limit(1, 60)
+    async def handler(ctx):
+        return True
+
+    async def run():
+        ctx = make_ctx("200")
+        with checks_ran(handler):
+            assert await handler(ctx)  # CommandHandler already counted this use
+        assert await handler(ctx)
+        with pytest.raises(CheckFailure):
+            await handler(ctx)
+
+    asyncio.run(run())
@@ -0,0 +1,33 @@
+import asyncio
+import time
+from brazbot.command_sync import RateLimitBuckets
+
+
+def test_global_429_pauses_sibling_buckets():
+    async def run():
+        buckets = RateLimitBuckets()
+        first = buckets.get("PUT", "/applications/{application_id}/guilds/{guild_id}/commands", "1")
+        second = buckets.get("PUT", "/applications/{application_id}/guilds/{guild_id}/commands", "2")
+        first.update({"X-RateLimit-Global": "true", "Retry-After": "0.2"}, 429)
+        started = time.monotonic()
+        await second.acquire()
+        return time.monotonic() - started, first.remaining
+
+    waited, remaining = asyncio.run(run())
+    assert waited >= 0.15
+    assert remaining is None  # The route's own bucket is left as it was
+
+
+def test_route_429_only_exhausts_its_bucket():
+    async def run():
+        buckets = RateLimitBuckets()
+        first = buckets.get("GET", "/route", "1")
+        second = buckets.get("GET", "/route", "2")
+        first.update({"Retry-After": "5"}, 429)
+        started = time.monotonic()
+        await second.acquire()
+        return time.monotonic() - started, first.remaining
+
+    waited, remaining = asyncio.run(run())
+    assert waited < 0.1
+    assert remaining == 0
@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+from brazbot.redis_cache import RedisCacheBackend
+
+msgpack = pytest.importorskip("msgpack")
+
+
+class FakeRedis:
+    """
+    Minimal RESP server: SET [PX], MSET, MGET and DEL on a dict. Records the
+    commands of each read, so tests can see what arrived pipelined.
+    """
+    def __init__(self):
+        self.data = {}
+        self.batches = []
+        self.hold = None  # Event blocking the replies of the next batch
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def execute(self, args):
+        name = args[0].decode().upper()
+        if name == "SET":
+            self.data[args[1]] = args[2]
+            return b"+OK\r\n"
+        if name == "MSET":
+            for key, value in zip(args[1::2], args[2::2]):
+                self.data[key] = value
+            return b"+OK\r\n"
+        if name == "MGET":
+            parts = [b"*%d\r\n" % (len(args) - 1)]
+            for key in args[1:]:
+                value = self.data.get(key)
+                parts.append(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+            return b"".join(parts)
+        if name == "DEL":
+            return b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in args[1:])
+        return b"-ERR unknown command\r\n"
+
+    async def handle(self, reader, writer):
+        while True:
+            command = await self.read_command(reader)
+            if command is None:
+                break
+            batch = [command]
+            while reader._buffer:  # Everything the client wrote in the same go
+                batch.append(await self.read_command(reader))
+            self.batches.append([[arg.decode(errors="replace") for arg in args] for args in batch])
+            if self.hold is not None:
+                hold, self.hold = self.hold, None
+                await hold.wait()
+            writer.write(b"".join(self.execute(args) for args in batch))
+            await writer.drain()
+        writer.close()
+
+
+def run(test):
+    async def main():
+        server = FakeRedis()
+        backend = RedisCacheBackend(port=await server.start(), prefix="t:")
+        try:
+            await test(server, backend)
+        finally:
+            await backend.close()
+            server.server.close()
+    asyncio.run(main())
+
+
+def test_writes_are_pipelined():
+    async def test(server, backend):
+        await asyncio.gather(
+            backend.set("a", {"x": 1}),
+            backend.set("b", [1, 2]),
+            backend.set("c", "ttl", ttl=5)
+        )
+        assert len(server.batches) == 1
+        names = [command[0] for command in server.batches[0]]
+        assert names == ["SET", "MSET"]
+        assert server.batches[0][0][1] == "t:c" and server.batches[0][0][3:] == ["PX", "5000"]
+        assert server.batches[0][1][1::2] == ["t:a", "t:b"]
+    run(test)
+
+
+def test_reads_are_batched_into_one_mget():
+    async def test(server, backend):
+        await backend.set_many({"a": 1, "b": "two"})
+        server.batches.clear()
+        values = await asyncio.gather(backend.get("a"), backend.get("b"), backend.get("a"), backend.get("missing"))
+        assert values == [1, "two", 1, None]
+        assert server.batches == [[["MGET", "t:a", "t:b", "t:missing"]]]
+    run(test)
+
+
+def test_delete():
+    async def test(server, backend):
+        await backend.set("a", 1)
+        await backend.delete("a")
+        assert server.batches[-1] == [["DEL", "t:a"]]
+        assert await backend.get("a") is None
+    run(test)
+
+
+def test_cancelled_read_does_not_desync_connection():
+    async def test(server, backend):
+        await backend.set_many({"a": "first", "b": "second"})
+        hold = server.hold = asyncio.Event()
+        pending = asyncio.ensure_future(backend.get("a"))
+        await asyncio.sleep(0.05)
+        backend._flush_task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+        hold.set()  # The stale reply now arrives on the old connection
+        assert await asyncio.wait_for(backend.get("b"), 2) == "second"
+    run(test)
@@ -0,0 +1,23 @@
+import asyncio
+import inspect
+import pytest
+from brazbot.router import ParameterPipeline
+
+
+def make_pipeline(annotation):
+    parameter = inspect.Parameter("value", inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=annotation)
+    return ParameterPipeline(parameter)
+
+
+def test_constructor_type_error_becomes_value_error():
+    with pytest.raises(ValueError):
+        asyncio.run(make_pipeline(bytes).convert(None, "abc"))
+
+
+def test_lookup_failure_becomes_value_error():
+    class Entity:
+        def __init__(self, value):
+            raise Exception("Failed to fetch entity: 404")
+
+    with pytest.raises(ValueError, match="404"):
+        asyncio.run(make_pipeline(Entity).convert(None, "123"))